@@ -3,15 +3,76 @@
 
 """
 Toolbox:        WLV_Tools
-Script:			Aufbereitung ZEMOKOST mit Zwischenabfluss, Version 1.5.0
+Script:			Aufbereitung ZEMOKOST mit Zwischenabfluss, Version 1.6.0
 
 Author:         KS, NC, BT (ms.gis,); JK(WLV); BK(BFW)
 QGIS Version:   > 3.40.9
 Created:        2020-04-14
-Last updated:   2025-08-20
+Last updated:   2026-10-18
 
 -----------
 Change log:
+v1.6.0
+    - AKL/RKL area shares aggregated in a single pass over the intersection output (zemokost_prep.vector.class_areas);
+    AKL/RKL polygons are pre-filtered to the TEZG extent via the provider's spatial index
+    - Slope and ridge flow length statistics computed in one fused zonal pass (zemokost_prep.zonal) instead of
+    separate qgis:zonalstatistics runs
+    - ZAF/ZAA rasterised once onto the DEM grid; reclassification, weighting and the interflow sums are computed in
+    memory within the same zonal pass (zemokost_prep.interflow) instead of via temporary rasters
+    - Batch mode for many catchment projects (zemokost_prep.batch, process pool with one temporary folder per
+    project); child algorithms run in the algorithm's processing context and write to its temporary folder
+    - Headless command line runner (python -m zemokost_prep run ...); the warning for TEZG smaller than 100 m² is
+    written to the log and returned in the results (WARNINGS) instead of a message box; WhiteboxTools is set up
+    once per process (zemokost_prep.wbt)
+    - Optional cache for filled DEM, D8 flow accumulation and ridges (zemokost_prep.cache), keyed by the clipped DEM
+    and the tool parameters, with size-bounded LRU eviction (parameters CACHE_DIR, CACHE_MAX_MB)
+    - Incremental mode (INCREMENTAL): per-TEZG fingerprints are stored next to import_zemokost.csv; only TEZG whose
+    geometry, attributes, overlapping AKL/RKL/ZA/channel features or buffered DEM window changed are recalculated;
+    DEM clip and hydrology still cover the whole catchment
+    - Tiled mode (TILED): fill, flow accumulation, ridges and flow length are calculated per buffered TEZG window in
+    parallel (zemokost_prep.tiles) and reduced to the per-TEZG flow length statistics; DEM clip, slope and zonal
+    statistics still cover the whole catchment
+    - WbtChain starts the WBT binary by its absolute path with --max_procs/--compress_rasters per call, without
+    os.chdir or changing the shared wrapper, so tiled windows can run their chains concurrently
+    - DEM clipped with one windowed gdal.Warp into a tiled, compressed GeoTIFF (zemokost_prep.raster) instead of
+    gdal:cliprasterbymasklayer; slope computed in memory (Horn, percent) instead of gdal:slope
+    - Optional target cell size (TARGET_CELLSIZE): the DEM is aggregated (average) to the target resolution before
+    the hydrology; RESOLUTION_REPORT writes F-Laenge/F-Neigung at target vs. DEM resolution (resolution_report.csv),
+    both computed per TEZG window
+    - Optional per-stage profiling (PROFILE): wall time, CPU time (incl. WhiteboxTools), peak memory and temp folder
+    growth per stage are written to import_zemokost_profile.json/.csv (zemokost_prep.profiling)
+    - Optional NumPy hydrology backend (HYDRO_BACKEND, zemokost_prep.hydro): priority-flood filling, D8 flow
+    accumulation, stream rasterisation and downslope distance in process, without WhiteboxTools
+    - WhiteboxTools calls queued per chain (zemokost_prep.wbt.WbtChain) with explicit thread count and compression;
+    run time per tool in the log and profile
+    - Flow length at ridges taken in the zonal statistics sweep (flow length masked by flow accumulation 1..2),
+    without bandStatistics, reclassification and raster_calculator
+    - Runs in the Processing background thread (no FlagNoThreading); THREADS sets the threads of WhiteboxTools,
+    gdal.Warp, the tiled hydrology and the gdal:* algorithms, GDAL_CACHE_MB the warp memory and GDAL cache, both
+    passed per call (zemokost_prep.threads) without changing the GDAL configuration of QGIS; project layers are
+    no longer modified (DEM CRS assigned to a copy, TEZG attributes written through the data provider)
+    - Hydrology, slope, AKL, RKL, ZA and channel statistics declared as task graph (zemokost_prep.dag) and run
+    concurrently with THREADS > 1; results merged into the zonal statistics and the csv afterwards. The AKL/RKL/ZA
+    overlays (processing on layers) run in the algorithm thread; the pool branches only get paths, TEZG shapes and a
+    feature source, and their layers are created in the algorithm thread afterwards
+    - Channel length and slope per TEZG from the channel lines clipped via a spatial index and DEM samples along the
+    clipped lines (zemokost_prep.channels) instead of intersection, dissolve, gdal:rasterize and zonal statistics
+    - Channel, fine channel and ZA inputs narrowed to the buffered TEZG extent (rectangle request on the provider's
+    spatial index, .qix built on demand) into memory layers before clip/intersection, as AKL/RKL already were
+    - TEZG reprojected once per distinct input CRS (zemokost_prep.reproject.ReprojectionCache, keyed by TEZG
+    fingerprint and target CRS) and shared by channels, AKL, RKL and ZA; kept in CACHE_DIR across runs if set
+    - K.O./K.U. junction network checked after writing the csv (single outlet, no loops, every junction fed and
+    draining through one TEZG); violations are returned as WARNINGS (zemokost_prep.routing)
+    - Runoff simulation on import_zemokost.csv (zemokost_prep.runoff, python -m zemokost_prep simulate): port of the
+    workbook's TEZG and junction simulation to NumPy, all TEZG on arrays per time step, junctions summed level by level
+    along the precomputed topological order of the junction network
+    - Design sweep (zemokost_prep.design, python -m zemokost_prep design): all return period x duration combinations
+    of the u/w or p1/p100 series simulated in batches, critical duration per junction; Euler I/II design shapes
+    - Ensemble runs (zemokost_prep.ensemble, python -m zemokost_prep ensemble): AKL/RKL shares, ZAF and Anteil
+    perturbed per TEZG with seeded RNG streams per batch, peak quantiles per junction reduced in constant memory
+    - Storm-cell sweep (zemokost_prep.storm, python -m zemokost_prep storm): grid of storm centres, directions and
+    speeds with radial areal reduction from the TEZG centroids (X/Y) and time offsets along the track, simulated in
+    batches; worst-case peak per junction and the scenario causing it
 v1.5.0
     - ZAF reclassification >=4 NoData
 v1.4.0
@@ -42,17 +103,28 @@ import csv
 import os
 import uuid
 import sys
-import random
-import contextlib
-import io
 
 
-# Import the WhiteboxTools module
+# Make the WhiteboxTools module (WBT) and zemokost_prep importable
 home_dir = os.path.expanduser("~")
 script_path = os.path.join(home_dir, "AppData", "Roaming", "QGIS", "QGIS3", "profiles", "default", "processing", "scripts")
 sys.path.append(script_path)
 
-from WBT.whitebox_tools import WhiteboxTools
+from zemokost_prep.cache import DEFAULT_MAX_MB, HYDRO_PARAMS, HydroCache
+from zemokost_prep.channels import channel_stats
+from zemokost_prep import hydro, incremental, routing
+from zemokost_prep.dag import TaskGraph
+from zemokost_prep.profiling import StageProfiler
+from zemokost_prep.resolution import REPORT_FILE as RESOLUTION_REPORT_FILE, window_table, write_report
+from zemokost_prep.raster import clip_dem, slope_percent
+from zemokost_prep.reproject import ReprojectionCache
+from zemokost_prep.threads import gdal_extra, resolve_threads
+from zemokost_prep.tiles import tiled_flow_length
+from zemokost_prep.vector import (add_table_fields, class_areas, ensure_spatial_index, features_in_extent, layer_shapes,
+                                  value_shapes)
+from zemokost_prep.interflow import add_interflow, weighted_interflow
+from zemokost_prep.wbt import WbtChain, whitebox_tools
+from zemokost_prep.zonal import ZonalEngine, rasterize_values, rasterize_zones, read_array, write_array
 
 import shutil
 from PyQt5.QtCore import (QCoreApplication, QVariant)
@@ -69,11 +141,32 @@ from qgis.core import (QgsProcessing,
                        QgsCoordinateReferenceSystem,
                        QgsVectorFileWriter,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterDefinition,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterEnum,
                        QgsProcessingException,
                        QgsProcessingUtils,
-                       QgsVectorLayer)
+                       QgsFeatureRequest,
+                       QgsVectorLayer,
+                       QgsVectorLayerFeatureSource)
+
+CSV_FIELDNAMES = ['TEZG Nr.', 'K.O.', 'K.U.', 'Bezeichnung/Ergaenzung', 'X', 'Y', 'Flaeche [km2]',
+                  'F-Laenge [m]',
+                  'F-Neigung [1]', 'Nat. Ret.[%]', 'Basisabfl. [m3/s]', 'AKL-0', 'AKL-1', 'AKL-2', 'AKL-3',
+                  'AKL-4', 'AKL-5', 'AKL-6', 'RKL-1', 'RKL-2', 'RKL-3', 'RKL-4', 'RKL-5', 'RKL-6',
+                  'ZAF 1 bis 7', 'Anteil [%]', 'G-Laenge [m]', 'G-Neigung [1]', 'd90 [m]']
+
+
+def write_zemokost_csv(outCsv, dictCsv):
+    """Writes the rows of dictCsv to import_zemokost.csv, sorted by TEZG Nr. in reversed order."""
+    dictCsvRev = dict(sorted(dictCsv.items(), reverse=True))
+    with open(outCsv, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, delimiter=';', fieldnames=CSV_FIELDNAMES)
+
+        writer.writeheader()
+        for key in dictCsvRev.keys():
+            writer.writerow(dictCsvRev[key])
 
-from qgis.PyQt.QtWidgets import QMessageBox
 
 def delete_temp_files(temp_folder):
     for item in os.listdir(temp_folder):
@@ -113,6 +206,16 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
     INTERFLOW_PROP = 'INTERFLOW_PROP'
     PROJECTPATH = 'PROJECTPATH'
     KEEPDATA = 'KEEPDATA'
+    CACHE_DIR = 'CACHE_DIR'
+    CACHE_MAX_MB = 'CACHE_MAX_MB'
+    INCREMENTAL = 'INCREMENTAL'
+    TILED = 'TILED'
+    HYDRO_BACKEND = 'HYDRO_BACKEND'
+    TARGET_CELLSIZE = 'TARGET_CELLSIZE'
+    RESOLUTION_REPORT = 'RESOLUTION_REPORT'
+    PROFILE = 'PROFILE'
+    THREADS = 'THREADS'
+    GDAL_CACHE_MB = 'GDAL_CACHE_MB'
 
     def tr(self, string):
         """
@@ -164,10 +267,7 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 		parameters and outputs associated with it..
 		"""
         return self.tr(
-            "Aufbereitung der Grundlagendaten für das NA Modell ZEMOKOST. Es werden Angaben zu Teileinzugsgebietsflächen, Abflussbeiwert, Rauhigkeitsbeiwert, Gerinne und ein DHM benötigt. Die zusätzliche Angabe eines Feingerinnes sowie Informationen zu Zwischenabflussfaktor und -anteil sind optional. \n\n \n--- HINWEIS --- \n- Berechnungen und optionale Datenausgabe erfolgen im Koordinatensystem des angegeben Höhenmodells. \n- Die Verwendung von SHAPEFILES als Dateninput ist empfohlen; das Tool ist derzeit nicht für GPKG-Daten geeignet.\n\n\n\n\n--- Eingabehilfe ---\n\nHöhenmodell - Höhenmodell (Raster) auswählen. Es wird eine 10x10m Auflösung empfohlen.\n\n\nTeileinzugsgebietsflächen (TEZG) - Polygon-Shapefile mit den Teileinzugsgebietsflächen (TEZG). Jedes Polygon muss eine ID sowie jeweils einen Zufluss- und Abflussknoten haben; die Angabe einer TEZG-Bezeichnung ist optional.\n\nTEZG-ID - Attribut mit eindeutiger ID je TEZG.\n\n\nTEZG Knoten oben - Attribut mit oberem Knoten (Zuflussknoten) je TEZG.\n\n\nTEZG Knoten unten - Attribut mit unterem Knoten (Abflussknoten) je TEZG.\n\n\nTEZG Bezeichnung [optional] - Attribut mit Name/Bezeichnung je TEZG.\n\n\nHauptgerinne - Linien-Shapefile mit einem Hauptgerinneast je TEZG.\n\n\nFeingerinne [optional] - Linien-Shapefile mit dem Feingerinnenetz vom gesamten Einzugsgebiet zur Berechnung des mittleren Oberflächenfließweges (können beliebig viele Gerinneäste sein).\n\n\nAbflussbeiwert (AKL) - Polygon-Shapefile mit den Flächen gleicher Abflussbeiwerteklasse (AKL).\n\n\nAKL-Feld - Attribut mit AKL-Wert (0-6)\n\nRauigkeitsbeiwert (RKL) - Polygon-Shapefile mit den Flächen gleicher Rauigkeitsbeiwerteklasse (RKL).\n\n\nRKL-Feld - Attribut mit RKL-Wert (1-5).\n\n\n Zwischenabluss [optional] - Polygon-Shapefile mit Flächen gleichen Faktors (ZAF) und Anteils (ZAA). \n\n\nZAF-Feld (verpflichtend, wenn Zwischenabfluss-Layer angegeben wird) - Attribut mit ZAF-Wert (0-7). \n\n\nZAA-Feld (verpflichtend, wenn Zwischenabfluss-Layer angegeben wird) - Attribut mit ZAA-Wert (0-1). \n\nPfad zu Verzeichnis, in welchem Ausgabeordner mit Ergebnissen gespeichert werden.")
-
-    def flags(self):
-        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+            "Aufbereitung der Grundlagendaten für das NA Modell ZEMOKOST. Es werden Angaben zu Teileinzugsgebietsflächen, Abflussbeiwert, Rauhigkeitsbeiwert, Gerinne und ein DHM benötigt. Die zusätzliche Angabe eines Feingerinnes sowie Informationen zu Zwischenabflussfaktor und -anteil sind optional. \n\n \n--- HINWEIS --- \n- Berechnungen und optionale Datenausgabe erfolgen im Koordinatensystem des angegeben Höhenmodells. \n- Die Verwendung von SHAPEFILES als Dateninput ist empfohlen; das Tool ist derzeit nicht für GPKG-Daten geeignet.\n\n\n\n\n--- Eingabehilfe ---\n\nHöhenmodell - Höhenmodell (Raster) auswählen. Es wird eine 10x10m Auflösung empfohlen; alternativ kann unter 'Erweiterte Parameter' eine Ziel-Zellgröße angegeben werden, auf die das Höhenmodell intern gemittelt wird.\n\n\nTeileinzugsgebietsflächen (TEZG) - Polygon-Shapefile mit den Teileinzugsgebietsflächen (TEZG). Jedes Polygon muss eine ID sowie jeweils einen Zufluss- und Abflussknoten haben; die Angabe einer TEZG-Bezeichnung ist optional.\n\nTEZG-ID - Attribut mit eindeutiger ID je TEZG.\n\n\nTEZG Knoten oben - Attribut mit oberem Knoten (Zuflussknoten) je TEZG.\n\n\nTEZG Knoten unten - Attribut mit unterem Knoten (Abflussknoten) je TEZG.\n\n\nTEZG Bezeichnung [optional] - Attribut mit Name/Bezeichnung je TEZG.\n\n\nHauptgerinne - Linien-Shapefile mit einem Hauptgerinneast je TEZG.\n\n\nFeingerinne [optional] - Linien-Shapefile mit dem Feingerinnenetz vom gesamten Einzugsgebiet zur Berechnung des mittleren Oberflächenfließweges (können beliebig viele Gerinneäste sein).\n\n\nAbflussbeiwert (AKL) - Polygon-Shapefile mit den Flächen gleicher Abflussbeiwerteklasse (AKL).\n\n\nAKL-Feld - Attribut mit AKL-Wert (0-6)\n\nRauigkeitsbeiwert (RKL) - Polygon-Shapefile mit den Flächen gleicher Rauigkeitsbeiwerteklasse (RKL).\n\n\nRKL-Feld - Attribut mit RKL-Wert (1-5).\n\n\n Zwischenabluss [optional] - Polygon-Shapefile mit Flächen gleichen Faktors (ZAF) und Anteils (ZAA). \n\n\nZAF-Feld (verpflichtend, wenn Zwischenabfluss-Layer angegeben wird) - Attribut mit ZAF-Wert (0-7). \n\n\nZAA-Feld (verpflichtend, wenn Zwischenabfluss-Layer angegeben wird) - Attribut mit ZAA-Wert (0-1). \n\nPfad zu Verzeichnis, in welchem Ausgabeordner mit Ergebnissen gespeichert werden.")
 
     def initAlgorithm(self, config=None):
         """
@@ -333,6 +433,102 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
             )
         )
 
+        # Cache for filled DEM, flow accumulation and ridges (re-used if DEM and TEZG outline are unchanged)
+        cacheDir = QgsProcessingParameterFile(
+            self.CACHE_DIR,
+            self.tr('Cache-Ordner Hydrologie (optional)'),
+            QgsProcessingParameterFile.Folder,
+            optional=True
+        )
+        cacheDir.setFlags(cacheDir.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cacheDir)
+
+        cacheMaxMb = QgsProcessingParameterNumber(
+            self.CACHE_MAX_MB,
+            self.tr('Maximale Cache-Größe [MB]'),
+            QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_MAX_MB,
+            minValue=0
+        )
+        cacheMaxMb.setFlags(cacheMaxMb.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cacheMaxMb)
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INCREMENTAL,
+                self.tr('Nur geänderte TEZG neu berechnen (inkrementell)'),
+                defaultValue=False
+            )
+        )
+
+        # Hydrology per TEZG window (buffered) in parallel instead of one clipped DEM
+        tiled = QgsProcessingParameterBoolean(
+            self.TILED,
+            self.tr('Hydrologie je TEZG-Ausschnitt parallel berechnen (gekachelt)'),
+            defaultValue=False
+        )
+        tiled.setFlags(tiled.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(tiled)
+
+        # Hydrology with WhiteboxTools (subprocess per tool) or in process on NumPy arrays (zemokost_prep.hydro)
+        hydroBackend = QgsProcessingParameterEnum(
+            self.HYDRO_BACKEND,
+            self.tr('Hydrologie berechnen mit'),
+            options=['WhiteboxTools', 'NumPy (im Prozess, ohne WhiteboxTools)'],
+            defaultValue=0
+        )
+        hydroBackend.setFlags(hydroBackend.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(hydroBackend)
+
+        # Resample the DEM (average) to a target cell size inside the pipeline; 0 = DEM resolution
+        targetCellsize = QgsProcessingParameterNumber(
+            self.TARGET_CELLSIZE,
+            self.tr('Ziel-Zellgröße für die Berechnung [m] (0 = Auflösung des Höhenmodells)'),
+            QgsProcessingParameterNumber.Double,
+            defaultValue=0,
+            minValue=0
+        )
+        targetCellsize.setFlags(targetCellsize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(targetCellsize)
+
+        resolutionReport = QgsProcessingParameterBoolean(
+            self.RESOLUTION_REPORT,
+            self.tr('F-Laenge/F-Neigung mit der Auflösung des Höhenmodells vergleichen (resolution_report.csv)'),
+            defaultValue=False
+        )
+        resolutionReport.setFlags(resolutionReport.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(resolutionReport)
+
+        # Wall/CPU time, peak memory and temp disk usage per processing stage (import_zemokost_profile.json/.csv)
+        profile = QgsProcessingParameterBoolean(
+            self.PROFILE,
+            self.tr('Laufzeit und Speicherbedarf je Arbeitsschritt protokollieren'),
+            defaultValue=False
+        )
+        profile.setFlags(profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(profile)
+
+        # Worker threads for WhiteboxTools, gdal.Warp, the tiled hydrology and the gdal:* algorithms; 0 = all cores
+        threads = QgsProcessingParameterNumber(
+            self.THREADS,
+            self.tr('Anzahl Threads (0 = alle Prozessorkerne)'),
+            QgsProcessingParameterNumber.Integer,
+            defaultValue=0,
+            minValue=0
+        )
+        threads.setFlags(threads.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(threads)
+
+        gdalCacheMb = QgsProcessingParameterNumber(
+            self.GDAL_CACHE_MB,
+            self.tr('GDAL-Cache [MB] (0 = GDAL-Standard)'),
+            QgsProcessingParameterNumber.Integer,
+            defaultValue=0,
+            minValue=0
+        )
+        gdalCacheMb.setFlags(gdalCacheMb.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(gdalCacheMb)
+
     def checkParameterValues(self, parameters, context):
         paramInterflow = self.parameterAsVectorLayer(parameters, self.INTERFLOW, context)
         paramZAF = self.parameterAsString(parameters, self.INTERFLOW_FACTOR, context)
@@ -351,9 +547,6 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 
         ## --------------------------
         # Pass parameters to script
-        wbt = WhiteboxTools()
-        # wbt.set_verbose_mode(False)
-
         dgm = self.parameterAsRasterLayer(parameters, self.DEM, context)
         tezgSrc = self.parameterAsVectorLayer(parameters, self.TEZG, context)
         tezgNr = self.parameterAsString(parameters, self.TEZG_ID, context)
@@ -371,9 +564,24 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
         zaaVal = self.parameterAsString(parameters, self.INTERFLOW_PROP, context)
         wDir = self.parameterAsString(parameters, self.PROJECTPATH, context)
         keepDataBOOL = self.parameterAsBool(parameters, self.KEEPDATA, context)
+        cacheDir = self.parameterAsString(parameters, self.CACHE_DIR, context)
+        cacheMaxMb = self.parameterAsInt(parameters, self.CACHE_MAX_MB, context)
+        incrementalBOOL = self.parameterAsBool(parameters, self.INCREMENTAL, context)
+        tiledBOOL = self.parameterAsBool(parameters, self.TILED, context)
+        hydroBackend = hydro.BACKENDS[self.parameterAsEnum(parameters, self.HYDRO_BACKEND, context)]
+        targetCellsize = self.parameterAsDouble(parameters, self.TARGET_CELLSIZE, context)
+        resolutionReportBOOL = self.parameterAsBool(parameters, self.RESOLUTION_REPORT, context)
+        profileBOOL = self.parameterAsBool(parameters, self.PROFILE, context)
+        threads = resolve_threads(self.parameterAsInt(parameters, self.THREADS, context))
+        gdalCacheMb = self.parameterAsInt(parameters, self.GDAL_CACHE_MB, context)
+
+        # WhiteboxTools is only needed (and has to be installed) for the WBT backend
+        wbt = whitebox_tools() if hydroBackend == 'wbt' else None
 
         # New 1m ASL DEM has no CRS defined. Therefore we define it here, based on the file name
         if os.path.basename(dgm.source()) == 'ALS_DGM_1m_AT_COG_20240110.tif':
+            # Assign the CRS to a copy, the layer in the project stays unchanged (background thread)
+            dgm = dgm.clone()
             dgm.setCrs(QgsCoordinateReferenceSystem(31287 , QgsCoordinateReferenceSystem.EpsgCrsId))
         else:
             pass
@@ -407,9 +615,16 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 
         feedback.pushInfo("\nSTARTING ......................")
 
-        ## Get dem cellsize
+        ## Get dem cellsize (or the target cell size, if the DEM is resampled within the pipeline)
         ras = gdal.Open(dgm.source())
-        cellsize = int(ras.GetGeoTransform()[1])
+        nativeCellsize = ras.GetGeoTransform()[1]
+        cellsize = int(nativeCellsize)
+        if targetCellsize > 0:
+            cellsize = int(targetCellsize) if float(targetCellsize).is_integer() else targetCellsize
+            feedback.pushInfo("... DEM resolution {} m, calculating with target cell size {} m".format(
+                nativeCellsize, cellsize))
+            if targetCellsize < nativeCellsize:
+                feedback.pushWarning("!!ACHTUNG!!: Die Ziel-Zellgröße ist kleiner als die Auflösung des Höhenmodells.")
 
         ## Get crs of input layer
         crsDEM = dgm.crs().authid().split(':')[1]
@@ -430,20 +645,12 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
                 raise QgsProcessingException(
                     '!!ACHTUNG!!: Die Karteneinheit des Layers Zwischenabfluss ist nicht in Meter. Bitte ändern.')
 
-        ### --- CUSTOM FUNCTIONS --- ###
-
-        # Define a utility function to get the URI of a QgsRasterLayer
-        def my_callback(value):
-            if not "%" in value:
-                print(value)
-
         ## Set paths and variables
         rasDir = os.path.join(wDir, 'rasters')
         shpDir = os.path.join(wDir, 'shps')
 
         srcGer = os.path.join(shpDir, 'Gerinne.shp')
         srcFGer = os.path.join(shpDir, 'Feingerinne.shp')
-        tezgGer_dis = os.path.join(shpDir, 'Gerinne_dissolved.shp')
 
         demClp = os.path.join(rasDir, 'dgm{}m.tif'.format(cellsize))
         demSlp = os.path.join(rasDir, 'dgm{}m_slopePerc.tif'.format(cellsize))
@@ -455,7 +662,6 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
         demFLenRidges = os.path.join(rasDir, 'dgm{}m_flowlength_Ridges.sdat'.format(cellsize))
 
         rasDrain = os.path.join(rasDir, 'Gerinne_ras.sdat')
-        rasTezgGer = os.path.join(rasDir, 'TEZGGerinne_ras.sdat')
 
         tezg = os.path.join(shpDir, 'TEZG_Stats.shp')
         tezgAKL = os.path.join(shpDir, 'TEZG_AKL.shp')
@@ -472,7 +678,10 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
         ras_cellsize_x_rZAA = os.path.join(rasDir, 'rasCalc_cellsize_x_rZAA.tif')
 
         # Define the temporary folder for wbt outputs
-        temp_folder = QgsProcessingUtils.tempFolder()
+        temp_folder = QgsProcessingUtils.tempFolder(context)
+
+        # Per-stage timing and memory report (no-op if PROFILE is not set)
+        profiler = StageProfiler(temp_folder, enabled=profileBOOL)
 
         # List for vlyr und rlyr, to save at end if required
         lyrList = []
@@ -491,11 +700,12 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 
         ## --- MAKE A COPY OF EZG FOR STATS ---
         feedback.pushInfo("... making a copy of TEZG")
+        profiler.mark('reproject TEZG')
 
         res3 = processing.run("native:reprojectlayer", {
             'INPUT': tezgSrc,
             'TARGET_CRS': dgm,  # dgm crs determines project crs
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
+            'OUTPUT': 'TEMPORARY_OUTPUT'}, context=context)
         vlyr_tezg = res3['OUTPUT']
         vlyr_tezg.setName('vlyr_tezg')
         lyrList.append(vlyr_tezg)
@@ -511,6 +721,18 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
                 has_small_area = True
                 break  # Exit the loop if any area is smaller than the threshold
 
+        def finalWarnings(rows):
+            # Report a warning if any polygon is smaller than 100 m² (log / run report, no dialog)
+            warnings = []
+            if has_small_area:
+                warnings.append("!!ACHTUNG!!: Eines oder mehrere Polygone im TEZG sind kleiner als 100 m².")
+                feedback.pushWarning(warnings[-1])
+            # The workbook only accepts a loop-free junction tree with a single outlet
+            for problem in routing.row_problems(rows):
+                warnings.append("!!ACHTUNG!!: Knotennetz (K.O./K.U.): " + problem)
+                feedback.pushWarning(warnings[-1])
+            return warnings
+
         # --- ADD UNIQUE TEZG_ID_ZK FIELD AND CENTROIDS to TEZG SHP ---
 
         # Add TEZG_ID_ZK field, likely unique over all input layer
@@ -527,23 +749,59 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
         # Calculate x,y coordinates of ezg centroids and transfer tezgNr
         feedback.pushInfo("... calculating TEZG_ID and centroids")
 
-        vlyr_tezg.startEditing()
-        feats = vlyr_tezg.getFeatures()
-        for feat in feats:
-            feat['ctr_x'] = feat.geometry().centroid().asPoint().x()
-            feat['ctr_y'] = feat.geometry().centroid().asPoint().y()
-            feat['TEZG_ID_ZK'] = int(feat[tezgNr])
-            vlyr_tezg.updateFeature(feat)
-        vlyr_tezg.commitChanges()
+        # Written through the data provider of the temporary copy (no edit buffer, safe in the background thread)
+        fieldIdx = [vlyr_tezg.fields().indexOf(name) for name in ('TEZG_ID_ZK', 'ctr_x', 'ctr_y')]
+        changes = {}
+        for feat in vlyr_tezg.getFeatures():
+            ctr = feat.geometry().centroid().asPoint()
+            changes[feat.id()] = dict(zip(fieldIdx, [str(int(feat[tezgNr])), ctr.x(), ctr.y()]))
+        vlyr_tezg.dataProvider().changeAttributeValues(changes)
+
+        ## --- INCREMENTAL MODE: RECOMPUTE CHANGED TEZG ONLY ---
+        outCsv = os.path.join(wDir, 'import_zemokost.csv')
+        if incrementalBOOL:
+            feedback.pushInfo("... comparing TEZG fingerprints with the previous run")
+            profiler.mark('incremental fingerprints')
+            statePath = incremental.state_path(outCsv)
+            globalFp = incremental.global_fingerprint({
+                'version': '1.6.0', 'dem': dgm.source(), 'crs': dgm.crs().authid(), 'cellsize': cellsize,
+                'fields': [tezgNr, knotenO, knotenU, bezeichnung, beiwertVal, rauhigkeitVal, zafVal, zaaVal],
+                'feingerinne': bool(feingerinne), 'interflow': bool(zaSrc), 'hydro_backend': hydroBackend,
+                'tiled': tiledBOOL})
+            fingerprints = incremental.tezg_fingerprints(
+                vlyr_tezg, 'TEZG_ID_ZK', [tezgNr, knotenO, knotenU, bezeichnung],
+                {'AKL': beiwert, 'RKL': rauhigkeit, 'ZA': zaSrc, 'Gerinne': gerinne, 'Feingerinne': feingerinne},
+                dgm.source())
+            changedFids = incremental.changed_ids(incremental.load_state(statePath), globalFp, fingerprints)
+            oldRows = incremental.read_rows(outCsv)
+            if changedFids is None or not oldRows:
+                feedback.pushInfo("... no previous run with the same settings found, all TEZG are calculated")
+                keptRows = {}
+            else:
+                keptRows = {fid: row for fid, row in oldRows.items()
+                            if fid in fingerprints and fid not in changedFids}
+                changedFids = set(fingerprints) - set(keptRows)
+                feedback.pushInfo("... {} of {} TEZG changed".format(len(changedFids), len(fingerprints)))
+                if not changedFids:
+                    write_zemokost_csv(outCsv, keptRows)
+                    incremental.save_state(statePath, globalFp, fingerprints)
+                    feedback.pushInfo("\nFINISHED (no changes) ......................")
+                    return {'OUTPUT': outCsv, 'WARNINGS': finalWarnings(keptRows.values()),
+                            'PROFILE': profiler.write(wDir)}
+                # DEM clip and hydrology keep the whole catchment (fill and flow paths cross TEZG boundaries);
+                # only the statistics and csv rows of the changed TEZG are calculated
 
         # Add EZG data to output dictionary
         feedback.pushInfo("... adding catchment attributes to dictionary")
+        profiler.mark('catchment attributes')
 
 
         feats = vlyr_tezg.getFeatures()
         fidVal = []
         for feat in feats:
             fid = int(feat['TEZG_ID_ZK'])
+            if incrementalBOOL and fid in keptRows:
+                continue
             fidVal.append(fid)
             dictCsv[fid] = {}
             # feedback.pushInfo(f"Value: {fid}, Type: {type(fid)}")
@@ -565,24 +823,37 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 
         ## --- CREATE COPY OF FLOWPATHS IN DGM CRS ---
 
+        # Spatial indexes of the (national) input layers, built once here before the concurrent branches read them
+        profiler.mark('spatial indexes of input layers')
+        for lyr in (gerinne, feingerinne, beiwert, rauhigkeit, zaSrc):
+            if lyr:
+                ensure_spatial_index(lyr)
+
+        # One CACHE_DIR store for the whole run: the entries it hands out stay leased (not evicted by other runs)
+        # until the run ends
+        cacheStore = HydroCache(cacheDir, cacheMaxMb) if cacheDir else None
+
+        # TEZG reprojected once per distinct CRS of the input layers (shared by channels, AKL, RKL and ZA; kept in
+        # CACHE_DIR across runs)
+        profiler.mark('reproject TEZG to input CRS')
+        reprojCache = ReprojectionCache(temp_folder, context, feedback, cacheStore)
+        reprojCache.prepare(vlyr_tezg, [lyr.crs() for lyr in (gerinne, feingerinne, beiwert, rauhigkeit, zaSrc) if lyr])
+        feedback.pushInfo("... TEZG reprojected into {} CRS ({} reused)".format(len(reprojCache.paths),
+                                                                               reprojCache.hits))
+
         # -- Gerinne --
+        profiler.mark('clip and reproject channels')
 
-        # Reproject TEZG to crsGer if different crs
-        if crsDEM != crsGer:
-            res16 = processing.run("native:reprojectlayer", {
-                'INPUT': vlyr_tezg,
-                'TARGET_CRS': gerinne,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            clipTEZG = res16['OUTPUT']
-        else:
-            clipTEZG = vlyr_tezg
+        # TEZG in crsGer if different crs
+        clipTEZG = reprojCache.layer(vlyr_tezg, gerinne.crs()) if crsDEM != crsGer else vlyr_tezg
 
         # Clip gerinne to TEZG
         gerinne_path = temp_folder + '/'+ f"gerinne_{uuid.uuid4().hex}.shp" #gerinne_path = os.path.join(temp_folder, f"gerinne_{uuid.uuid4().hex}.shp")
+        # (only lines within the buffered TEZG extent are fetched)
         res17 = processing.run("native:clip", {
-            'INPUT': gerinne,
+            'INPUT': features_in_extent(gerinne, clipTEZG.extent(), buffer=cellsize),
             'OVERLAY': clipTEZG,
-            'OUTPUT': gerinne_path})
+            'OUTPUT': gerinne_path}, context=context)
         vlyr_srcGer = QgsVectorLayer(res17['OUTPUT'], 'vlyr_srcGer', 'ogr')
 
         # Reproject gerinne to crsDEM if different crs
@@ -590,7 +861,7 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
             res1 = processing.run("native:reprojectlayer", {
                 'INPUT': res17['OUTPUT'],
                 'TARGET_CRS': dgm,  # dgm crs determines project crs
-                'OUTPUT': gerinne_path})
+                'OUTPUT': gerinne_path}, context=context)
             vlyr_srcGer = QgsVectorLayer(res1['OUTPUT'], 'vlyr_srcGer', 'ogr')
 
 
@@ -605,22 +876,15 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
             drainage_path = gerinne_path
 
         else:
-            # Reproject TEZG to crsFGer if different crs
-            if crsDEM != crsFGer:
-                res18 = processing.run("native:reprojectlayer", {
-                    'INPUT': vlyr_tezg,
-                    'TARGET_CRS': feingerinne,
-                    'OUTPUT': 'TEMPORARY_OUTPUT'})
-                clipTEZG = res18['OUTPUT']
-            else:
-                clipTEZG = vlyr_tezg
+            # TEZG in crsFGer if different crs
+            clipTEZG = reprojCache.layer(vlyr_tezg, feingerinne.crs()) if crsDEM != crsFGer else vlyr_tezg
 
             # Clip feingerinne to TEZG
             feingerinne_path = os.path.join(temp_folder, f"feingerinne_{uuid.uuid4().hex}.shp")
             res19 = processing.run("native:clip", {
-                'INPUT': feingerinne,
+                'INPUT': features_in_extent(feingerinne, clipTEZG.extent(), buffer=cellsize),
                 'OVERLAY': clipTEZG,
-                'OUTPUT': feingerinne_path})
+                'OUTPUT': feingerinne_path}, context=context)
 
             # Reproject feingerinne to crsDEM if different crs
             feingerinne_path_reproj = os.path.join(temp_folder, f"feingerinne_reproj_{uuid.uuid4().hex}.shp")
@@ -628,7 +892,7 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
                 res2 = processing.run("native:reprojectlayer", {
                     'INPUT': QgsVectorLayer(feingerinne_path, 'vlyr_srcFGer', 'ogr'),
                     'TARGET_CRS': dgm,  # dgm crs determines project crs
-                    'OUTPUT': feingerinne_path_reproj})
+                    'OUTPUT': feingerinne_path_reproj}, context=context)
                 vlyr_srcFGer = QgsVectorLayer(feingerinne_path_reproj, 'vlyr_srcFGer', 'ogr')
                 drainage_path = feingerinne_path_reproj
             else:
@@ -642,282 +906,163 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
 
         # --- CLIP DEM TO TEZG BOUNDARY ---
 
-        # Clip DEM
+        # Clip DEM: windowed read of the source DEM with the TEZG as cutline, written as tiled
+        # GeoTIFF readable by WhiteboxTools (only blocks intersecting the TEZG are read)
         feedback.pushInfo("... clipping dem to area of interest")
-        
-        res4 = processing.run("gdal:cliprasterbymasklayer", {
-            'INPUT': dgm,
-            'MASK': vlyr_tezg,
-            #'TARGET_CRS': dgm.crs().authid(),
-            'NODATA': 99999,
-            'CROP_TO_CUTLINE': True,
-            'DATA_TYPE': 6,  # Float32
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-        rlyr_demClp = QgsRasterLayer(res4['OUTPUT'], "rlyr_demClp", "gdal")
+        profiler.mark('clip DEM')
+        tezgShapes = layer_shapes(vlyr_tezg, 'TEZG_ID_ZK')
+        # TEZG with statistics to calculate (incremental run: the changed TEZG only)
+        calcShapes = [shape for shape in tezgShapes if shape[0] in dictCsv]
+
+        demClpPath = os.path.join(temp_folder, f"DEM_Clip_{uuid.uuid4().hex}.tif")
+        clip_dem(dgm.source(), [wkb for _, wkb in tezgShapes], demClpPath, cellsize=targetCellsize or None,
+                 crs_wkt=dgm.crs().toWkt(), threads=threads, cache_mb=gdalCacheMb)
+        rlyr_demClp = QgsRasterLayer(demClpPath, "rlyr_demClp", "gdal")
         lyrList.append(rlyr_demClp)
 
-        # --- CALCULATE HYDROLOGICAL Rasters ---
-        feedback.pushInfo("... calculating hydrological rasters")
-        # Redirect stdout to avoid the NoneType error in flush()
-        with contextlib.redirect_stdout(io.StringIO()):
-            # Create a hydrologically corrected DEM (Digital Elevation Model)
-            corrected_dem_path = os.path.join(temp_folder, f"DEM_Corrected_{uuid.uuid4().hex}.tif")
-            # Perform depression filling on DEM to create a hydrologically corrected DEM
-            wbt.fill_depressions_wang_and_liu(
-                dem=rlyr_demClp.dataProvider().dataSourceUri(),
-                output=corrected_dem_path,
-                fix_flats=True,
-                flat_increment=None,
-                callback = my_callback
-            )
-            rlyr_demFilled = QgsRasterLayer(corrected_dem_path, "rlyr_demFilled", "gdal")
-            feedback.pushInfo("corr dem:"+corrected_dem_path)
-            lyrList.append(rlyr_demFilled)
-
-            # Calculate flow accumulation raster (for ridge detection)
-            flow_accumulation_path = os.path.join(temp_folder, f"Flow_Accumulation_{uuid.uuid4().hex}.tif")
-
-            # Calculate flow accumulation raster using D8 algorithm
-            wbt.d8_flow_accumulation(
-                corrected_dem_path,
-                output=flow_accumulation_path,
-                out_type="cells",  # Output type set to "cells" for cell-based flow accumulation
-                log=False,
-                clip=False,
-                pntr=False,
-                esri_pntr=False,
-            )
-            rlyr_demFAcc = QgsRasterLayer(flow_accumulation_path, "rlyr_demFAcc", "gdal")
-            lyrList.append(rlyr_demFAcc)
-            feedback.pushInfo("FAcc: "+flow_accumulation_path )
-            # Reclassify flowacc to get ridges (acc val = 1,2)
-            stats = rlyr_demFAcc.dataProvider().bandStatistics(1)
-
-            res4 = processing.run("native:reclassifybytable", {
-                'INPUT_RASTER': rlyr_demFAcc,
-                'RASTER_BAND': 1,
-                'TABLE': ['1', '2', '1', '3', stats.maximumValue, '0'],
-                'NO_DATA': 0, 'RANGE_BOUNDARIES': 2, 'NODATA_FOR_MISSING': False,
-                'DATA_TYPE': 5,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            rlyr_demFAccRecl = QgsRasterLayer(res4['OUTPUT'], "rlyr_demFAccRecl", "gdal")
-            lyrList.append(rlyr_demFAccRecl)
+        # --- INDEPENDENT BRANCHES ---
+        # Hydrology, slope, AKL, RKL, ZA and channel statistics are declared as task graph; their results are merged
+        # into the zonal statistics sweep and dictCsv in this thread afterwards. QGIS layers must not be used from
+        # other threads: the AKL, RKL and ZA overlays (processing algorithms on layers) are local tasks and run in
+        # this thread, while the pool (THREADS > 1) calculates hydrology, slope and channel statistics, which only
+        # get file paths, TEZG shapes and a feature source. Layers of the pool branches are created here afterwards.
+        zoneGrid = rasterize_zones(tezgShapes, demClpPath)
+        branchWorkers = min(threads, 6)
 
+        # TEZG to intersect (incremental run: the changed TEZG only)
+        tezgRequest = QgsFeatureRequest()
+        if len(calcShapes) < len(tezgShapes):
+            tezgRequest.setFilterExpression('"TEZG_ID_ZK" IN ({})'.format(', '.join(str(fid) for fid, _ in calcShapes)))
 
-            # # --- OVERLAND FLOW LENGTH AT RIDGES---
-            feedback.pushInfo("... calculating max flowlength from ridges")
+        def tezgCopy(crs):
+            # TEZG in crs (reprojected once, see reprojCache) as memory layer of its own
+            return reprojCache.layer(vlyr_tezg, crs).materialize(QgsFeatureRequest(tezgRequest))
 
-            # Create a path for the rasterized streams output
-            rasterized_streams_path = os.path.join(temp_folder, f"Rasterized_Streams_{uuid.uuid4().hex}.tif")
+        def overlayInputs(srcLyr):
+            # TEZG copy in the crs of srcLyr and the features of srcLyr within the buffered TEZG extent
+            clipTEZG = tezgCopy(srcLyr.crs())
+            return features_in_extent(srcLyr, clipTEZG.extent(), buffer=cellsize), clipTEZG
 
-            # Rasterize streams based on the corrected DEM
-            wbt.rasterize_streams(
-                streams=drainage_path,
-                base=corrected_dem_path,
-                output=rasterized_streams_path,
-                feature_id=False
-            )
-            rlyr_rasDrain = QgsRasterLayer(rasterized_streams_path, "rlyr_rasDrain", "gdal")
-            lyrList.append(rlyr_rasDrain)
+        # Channels for the channel statistics branch (a feature source may be read from another thread)
+        channelSource = QgsVectorLayerFeatureSource(vlyr_srcGer)
 
-            # Create a path for the overland flow length output
+        # --- CALCULATE HYDROLOGICAL Rasters ---
+        def hydrologyBranch():
+            if tiledBOOL:
+                # Fill, flow accumulation, ridges and flow length per buffered TEZG window (parallel);
+                # every window is reduced to the flow length statistics of its TEZG
+                feedback.pushInfo("... calculating hydrological rasters per TEZG window (tiled)")
+                return {'tiles': tiled_flow_length(wbt, dgm.source(), calcShapes, drainage_path, temp_folder,
+                                                   feedback=feedback, crs_wkt=dgm.crs().toWkt(),
+                                                   cellsize=targetCellsize or None, threads=threads,
+                                                   cache_mb=gdalCacheMb)}
+            if hydroBackend == 'numpy':
+                # Fill, D8, ridges, streams and flow length in process; the rasters stay in memory
+                feedback.pushInfo("... calculating hydrological rasters (NumPy)")
+                demClpDs = gdal.Open(demClpPath)
+                demClpGt = demClpDs.GetGeoTransform()
+                streams = hydro.rasterize_streams(drainage_path, demClpDs)
+                return {'arrays': hydro.hydrology(read_array(demClpDs), streams, abs(demClpGt[1]), abs(demClpGt[5]))}
+
+            feedback.pushInfo("... calculating hydrological rasters")
+            # Filled DEM, flow accumulation and ridges depend only on the clipped DEM; look them up in the cache
+            hydroCache = cacheStore
+            hydroFiles = None
+            if hydroCache is not None:
+                hydroKey = hydroCache.key(demClpPath, HYDRO_PARAMS)
+                hydroFiles = hydroCache.get(hydroKey)
+
+            # All WBT tools of the hydrology chain are queued and run with the same thread and compression
+            # settings; every tool is timed (log and, if run sequentially, profile)
+            wbtChain = WbtChain(wbt, num_threads=threads, profiler=profiler if branchWorkers <= 1 else None,
+                                feedback=feedback)
+            rasterized_streams_path = os.path.join(temp_folder, f"Rasterized_Streams_{uuid.uuid4().hex}.tif")
             flow_length_path = os.path.join(temp_folder, f"Flow_Length_{uuid.uuid4().hex}.tif")
+            if hydroFiles:
+                feedback.pushInfo("... filled dem and flow accumulation taken from cache " + hydroKey[:12])
+                corrected_dem_path = hydroFiles['filled']
+                flow_accumulation_path = hydroFiles['facc']
+            else:
+                # Hydrologically corrected DEM (depression filling) and D8 flow accumulation in cells (ridges)
+                corrected_dem_path = os.path.join(temp_folder, f"DEM_Corrected_{uuid.uuid4().hex}.tif")
+                flow_accumulation_path = os.path.join(temp_folder, f"Flow_Accumulation_{uuid.uuid4().hex}.tif")
+                wbtChain.add('fill_depressions_wang_and_liu', dem=demClpPath,
+                             output=corrected_dem_path, fix_flats=True)
+                wbtChain.add('d8_flow_accumulation', input=corrected_dem_path, output=flow_accumulation_path,
+                             out_type='cells')
 
-            # Calculate overland flow length
-            wbt.downslope_distance_to_stream(
-                dem=corrected_dem_path,
-                streams=rasterized_streams_path,
-                output=flow_length_path,
-                dinf=False
-            )
-            rlyr_demFLen = QgsRasterLayer(flow_length_path, "rlyr_demFLen", "gdal")
-            lyrList.append(rlyr_demFLen)
-
-            # Multiply reclassified flowacc with flow length to overland flow length ridges
-            multiplied_raster_path = os.path.join(temp_folder, f"Flow_Length_Ridges_{uuid.uuid4().hex}.tif")
-
-            wbt.raster_calculator(
-                output=multiplied_raster_path,
-                statement=f'"{rlyr_demFLen.dataProvider().dataSourceUri()}" * "{rlyr_demFAccRecl.dataProvider().dataSourceUri()}"'
-            )
-            # Load the multiplied raster layer in QGIS
-            rlyr_demFLenRidges = QgsRasterLayer(multiplied_raster_path, "rlyr_demFLenRidges", "gdal")
-            lyrList.append(rlyr_demFLenRidges)
-
+            # # --- OVERLAND FLOW LENGTH AT RIDGES---
+            # Rasterize streams based on the corrected DEM and calculate the overland flow length
+            wbtChain.add('rasterize_streams', streams=drainage_path, base=corrected_dem_path,
+                         output=rasterized_streams_path, nodata=True)
+            wbtChain.add('downslope_distance_to_stream', dem=corrected_dem_path, streams=rasterized_streams_path,
+                         output=flow_length_path)
+            wbtChain.run()
 
+            if hydroCache is not None and not hydroFiles:
+                hydroCache.put(hydroKey, {'filled': corrected_dem_path, 'facc': flow_accumulation_path})
 
-        ## --- Calculate TEZG Area Attributes ---
-        feedback.pushInfo("... calculating TEZG area attributes and adding them to dictionary")
+            feedback.pushInfo("corr dem:"+corrected_dem_path)
+            feedback.pushInfo("FAcc: "+flow_accumulation_path )
+            # Raster layers are created in the algorithm thread after the branches (see below)
+            return {'facc': flow_accumulation_path, 'flen': flow_length_path,
+                    'rasters': [(corrected_dem_path, "rlyr_demFilled"), (flow_accumulation_path, "rlyr_demFAcc"),
+                                (rasterized_streams_path, "rlyr_rasDrain"), (flow_length_path, "rlyr_demFLen")]}
 
         # --- Slope ---
-        res11 = processing.run("gdal:slope", {
-            'INPUT': rlyr_demClp,
-            'BAND': 1,
-            'AS_PERCENT': True,
-            'ZEVENBERGEN': False,
-            # Tried both HORN (default) and ZEVENBERGEN & THORNE method, HORN closer to ArcGIS output.
-            'OPTIONS': '',
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-        rlyr_demSlp = QgsRasterLayer(res11['OUTPUT'], "rlyr_demSlp", "gdal")
-        lyrList.append(rlyr_demSlp)
-
-        # Calculate statistics, adding mean slope to TEZG
-        processing.run("qgis:zonalstatistics", {
-            'INPUT_RASTER': rlyr_demSlp,
-            'RASTER_BAND': 1,
-            'INPUT_VECTOR': vlyr_tezg,
-            'COLUMN_PREFIX': 'slpP',
-            'STATS': [2]})  # Mean
-
-        # Delete and reload vtezg with new attributes
-        del vlyr_tezg
-        vlyr_tezg = res3['OUTPUT']
-
-        # Add slope data to output dictionary
-        feats = vlyr_tezg.getFeatures()
-        for feat in feats:
-            fid = int(feat['TEZG_ID_ZK'])
-            dictCsv[fid]['F-Neigung [1]'] = str(round(feat['slpPmean'] / 100, 3)).replace('.', ',')
-
-        ##--- Average max flow length ---
-
-        # Calculate statistics, adding mean slope to TEZG
-        processing.run("qgis:zonalstatistics", {
-            'INPUT_RASTER': rlyr_demFLenRidges,
-            'RASTER_BAND': 1,
-            'INPUT_VECTOR': vlyr_tezg,
-            'COLUMN_PREFIX': 'flenM',
-            'STATS': [0, 2, 5, 6]})  # Count, Mean, Min, Max
-
-        # # Delete and reload vtezg with new attributes
-        del vlyr_tezg
-        vlyr_tezg = res3['OUTPUT']
-
-        # Add average max flow length to output dictionary
-        feats = vlyr_tezg.getFeatures()
-        for feat in feats:
-            fid = int(feat['TEZG_ID_ZK'])
-            dictCsv[fid]['F-Laenge [m]'] = str(round(feat['flenMmean']))
+        def slopeBranch():
+            # Horn's method in percent as gdal:slope, computed in memory on the clipped DEM
+            # (Tried both HORN (default) and ZEVENBERGEN & THORNE method, HORN closer to ArcGIS output.)
+            rasSlp = slope_percent(read_array(demClpPath), zoneGrid.cellsize, abs(zoneGrid.geotransform[5]))
+            if keepDataBOOL:
+                write_array(demSlp, rasSlp, zoneGrid)
+            return rasSlp
 
         ## -------------------------------------------------
         # --- CALCULATE AKL & RKL DISTRIBUTION IN TEZGS ---
-        feedback.pushInfo("... calculating AKL and RKL distribution and adding them to dictionary")
-
-        # -- AKL -- #
-
-        # Reproject TEZG to crsAKL if different crs
-        if crsDEM != crsAKL:
-            res12 = processing.run("native:reprojectlayer", {
-                'INPUT': vlyr_tezg,
-                'TARGET_CRS': beiwert,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            clipTEZG = res12['OUTPUT']
-        else:
-            clipTEZG = vlyr_tezg
-
-        # Intersect TEZG and AKL
-        res13 = processing.run("native:intersection", {
-            'INPUT': beiwert,
-            'OVERLAY': clipTEZG,
-            'INPUT_FIELDS': [], 'OVERLAY_FIELDS': [],
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-        # Reproject AKL to crsDEM if different crs
-        if crsDEM != crsAKL:
-            res20 = processing.run("native:reprojectlayer", {
-                'INPUT': res13['OUTPUT'],
-                'TARGET_CRS': dgm,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            vlyr_tezgAKL = res20['OUTPUT']
-        else:
-            vlyr_tezgAKL = res13['OUTPUT']
-
-        # Set layer name and add to lyrList
-        vlyr_tezgAKL.setName('vlyr_tezgAKL')
-        lyrList.append(vlyr_tezgAKL)
-
-        # Calculate area per AKLVal per TEZG and add to dictCsv
-        aklVal = [0, 1, 2, 3, 4, 5, 6]
-        for val in aklVal:
-            for fid in fidVal:
-                area = 0
-                featsAKL = vlyr_tezgAKL.getFeatures()
-                for feat in featsAKL:
-                    if feat[beiwertVal] == val and int(feat['TEZG_ID_ZK']) == fid:
-                        area += feat.geometry().area()
-                    dictCsv[fid]['AKL-{}'.format(val)] = round(area)
-
-        # -- RKL -- #
-
-        # Reproject TEZG to crsRKL if different crs
-        if crsDEM != crsRKL:
-            res14 = processing.run("native:reprojectlayer", {
-                'INPUT': vlyr_tezg,
-                'TARGET_CRS': rauhigkeit,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            clipTEZG = res14['OUTPUT']
-        else:
-            clipTEZG = vlyr_tezg
+        def classBranch(classLyr, classCrs, classVal, name):
+            # Local task (algorithm thread): intersect the TEZG copy and the AKL/RKL polygons within the buffered
+            # TEZG extent (see overlayInputs)
+            classPolys, clipTEZG = overlayInputs(classLyr)
+            res = processing.run("native:intersection", {
+                'INPUT': classPolys,
+                'OVERLAY': clipTEZG,
+                'INPUT_FIELDS': [], 'OVERLAY_FIELDS': [],
+                'OUTPUT': 'TEMPORARY_OUTPUT'}, context=context)
 
-        res15 = processing.run("native:intersection", {
-            'INPUT': rauhigkeit,
-            'OVERLAY': clipTEZG,
-            'INPUT_FIELDS': [],
-            'OVERLAY_FIELDS': [],
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-        if crsDEM != crsRKL:
-            res21 = processing.run("native:reprojectlayer", {
-                'INPUT': res15['OUTPUT'],
-                'TARGET_CRS': dgm,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-            vlyr_tezgRKL = res21['OUTPUT']
-        else:
-            vlyr_tezgRKL = res15['OUTPUT']
+            # Reproject the intersection to crsDEM if different crs
+            if crsDEM != classCrs:
+                res = processing.run("native:reprojectlayer", {
+                    'INPUT': res['OUTPUT'],
+                    'TARGET_CRS': dgm,
+                    'OUTPUT': 'TEMPORARY_OUTPUT'}, context=context)
+            vlyr_class = res['OUTPUT']
 
-        # Set layer name and add to lyrList
-        vlyr_tezgRKL.setName('vlyr_tezgRKL')
-        lyrList.append(vlyr_tezgRKL)
+            # Set layer name and add to lyrList
+            vlyr_class.setName(name)
+            lyrList.append(vlyr_class)
 
-        # Calculate area per RKLVal per TEZG and add to dictCsv
-        rklVal = [1, 2, 3, 4, 5, 6]
-        for val in rklVal:
-            for fid in fidVal:
-                area = 0
-                featsRKL = vlyr_tezgRKL.getFeatures()
-                for feat in featsRKL:
-                    if feat[rauhigkeitVal] == val and int(feat['TEZG_ID_ZK']) == fid:
-                        area += feat.geometry().area()
-                    dictCsv[fid]['RKL-{}'.format(val)] = round(area)
+            # Area per class value per TEZG (single pass)
+            return class_areas(vlyr_class, 'TEZG_ID_ZK', classVal)
 
         ## ----------------------------------------------------
         # --- CALCULATE WEIGHTED MEAN ZAF AND ZAA PER TEZGS ---
-        feedback.pushInfo("... calculating weighted mean ZAF and ZAA and adding them to dictionary")
-
-        if zaSrc:
-            # Reproject TEZG to crsZA if different crs
-            if crsDEM != crsZA:
-                res22 = processing.run("native:reprojectlayer", {
-                    'INPUT': vlyr_tezg,
-                    'TARGET_CRS': zaSrc,
-                    'OUTPUT': 'TEMPORARY_OUTPUT'})
-                clipTEZG = res22['OUTPUT']
-            else:
-                clipTEZG = vlyr_tezg
-
-            # Intersect TEZG and ZA
+        def interflowBranch():
+            # Local task (algorithm thread): intersect the TEZG copy and the ZA polygons within the buffered TEZG
+            # extent (see overlayInputs)
+            zaPolys, clipTEZG = overlayInputs(zaSrc)
             res23 = processing.run("native:intersection", {
-                'INPUT': zaSrc,
+                'INPUT': zaPolys,
                 'OVERLAY': clipTEZG,
                 'INPUT_FIELDS': [], 'OVERLAY_FIELDS': [],
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
+                'OUTPUT': 'TEMPORARY_OUTPUT'}, context=context)
 
             # Reproject ZA to crsDEM if different crs
             if crsDEM != crsZA:
                 res24 = processing.run("native:reprojectlayer", {
                     'INPUT': res23['OUTPUT'],
                     'TARGET_CRS': dgm,
-                    'OUTPUT': 'TEMPORARY_OUTPUT'})
+                    'OUTPUT': 'TEMPORARY_OUTPUT'}, context=context)
                 vlyr_tezgZA = res24['OUTPUT']
             else:
                 vlyr_tezgZA = res23['OUTPUT']
@@ -925,250 +1070,191 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
             vlyr_tezgZA.setName('vlyr_tezgZA')
             lyrList.append(vlyr_tezgZA)
 
-            ## --- ZAF --- #
-
-            # Create ZAF raster of DEM cellsize
-            res25 = processing.run("gdal:rasterize",
-                                   {'INPUT': vlyr_tezgZA,
-                                    'FIELD': zafVal,
-                                    'BURN': 0,
-                                    'UNITS': 1,
-                                    'WIDTH': cellsize,
-                                    'HEIGHT': cellsize,
-                                    'EXTENT': vlyr_tezgZA,
-                                    'NODATA': -9999,
-                                    'OPTIONS': '',
-                                    'DATA_TYPE': 5,  # Float32
-                                    'INIT': None, 'INVERT': False,
-                                    'EXTRA': '-tap',  # Aligns raster to DEM cells
-                                    'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_rasTezgZAF = QgsRasterLayer(res25['OUTPUT'], "rlyr_rasTezgZAF", "gdal")
-            lyrList.append(rlyr_rasTezgZAF)
-
-            # Reclassify ZAF raster (>4=NoData; V.1_4_0 >3=NoData)
-            res26 = processing.run("native:reclassifybytable", {
-                'INPUT_RASTER': rlyr_rasTezgZAF,
-                'RASTER_BAND': 1,
-                'TABLE': [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4],
-                'NO_DATA': -9999,
-                'RANGE_BOUNDARIES': 2,
-                'NODATA_FOR_MISSING': True,
-                'DATA_TYPE': 5,
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_rasTezgZAF_recl = QgsRasterLayer(res26['OUTPUT'], "rlyr_rasTezgZAF_recl", "gdal")
-            lyrList.append(rlyr_rasTezgZAF_recl)
-
-            ## --- ZAA --- #
-
-            # Create raster of DEM cellsize
-            res27 = processing.run("gdal:rasterize",
-                                   {'INPUT': vlyr_tezgZA,
-                                    'FIELD': zaaVal,
-                                    'BURN': 0,
-                                    'UNITS': 1,
-                                    'WIDTH': cellsize,
-                                    'HEIGHT': cellsize,
-                                    'EXTENT': vlyr_tezgZA,
-                                    'NODATA': -9999,
-                                    'OPTIONS': '',
-                                    'DATA_TYPE': 5,  # Float32
-                                    'INIT': None, 'INVERT': False,
-                                    'EXTRA': '-tap',
-                                    'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_rasTezgZAA = QgsRasterLayer(res27['OUTPUT'], "rlyr_rasTezgZAA", "gdal")
-            lyrList.append(rlyr_rasTezgZAA)
-
-            # Reclassify raster according to values of reclassified ZAF
-            res28 = processing.run("gdal:rastercalculator", {
-                'INPUT_A': rlyr_rasTezgZAF_recl,
-                'BAND_A': 1,
-                'INPUT_B': rlyr_rasTezgZAA,
-                'BAND_B': 1,
-                'FORMULA': '(A > 0) * B',
-                'NO_DATA': -9999,
-                'RTYPE': 5,
-                'OPTIONS': '', 'EXTRA': '',
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_rasTezgZAA_recl = QgsRasterLayer(res28['OUTPUT'], "rlyr_rasTezgZAA_recl", "gdal")
-            lyrList.append(rlyr_rasTezgZAA_recl)
+            ## --- ZAF and ZAA on the DEM grid (in memory) --- #
 
-            ## --- Calculate weighted means for ZAF and ZAA per TEZG --- ##
-            # Source: "P:\NR\BMLF\WLV\PROJEKTE\PYQGIS\Zemokost\DATA_IN\BMNT_20200316\Zemokost_Erweiterung Zwischenabfluss.docx"
-
-            # -- ZAF  [Gew. rZAF = summenprodukt(rZAF * rZAA) / summe(rZAA)]
-
-            # Calculate raster rZAF * rZAA
-            res29 = processing.run("gdal:rastercalculator", {
-                'INPUT_A': rlyr_rasTezgZAF_recl,
-                'BAND_A': 1,
-                'INPUT_B': rlyr_rasTezgZAA_recl,
-                'BAND_B': 1,
-                'FORMULA': 'A*B',
-                'NO_DATA': -9999,
-                'RTYPE': 5,
-                'OPTIONS': '', 'EXTRA': '',
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_ras_rZAF_x_rZAA = QgsRasterLayer(res29['OUTPUT'], "rlyr_ras_rZAF_x_rZAA", "gdal")
-            lyrList.append(rlyr_ras_rZAF_x_rZAA)
-
-            # Calculate sumproduct(rZAF * rZAA) per TEZG (= SP1)
-            processing.run("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_ras_rZAF_x_rZAA,
-                'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'SP1_',
-                'STATS': [1]})
-
-            # Calculate sum(rZAA) per TEZG (= S1)
-            processing.run("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_rasTezgZAA_recl,
-                'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'S1_',
-                'STATS': [1]})
-
-            # -- ZAA  [Gew. rZAA = summenprodukt(cellsize* rZAA) / summe(cellsize of ZAA) * 100]
-
-            # # Calculate raster cellsize * rZAA
-            res30 = processing.run("gdal:rastercalculator", {
-                'INPUT_A': rlyr_rasTezgZAA_recl,
-                'BAND_A': 1,
-                'FORMULA': '{}*A'.format(cellsize),
-                'NO_DATA': -9999,
-                'RTYPE': 5,
-                'OPTIONS': '', 'EXTRA': '',
-                'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-            rlyr_ras_cellsize_x_rZAA = QgsRasterLayer(res30['OUTPUT'], "rlyr_ras_cellsize_x_rZAA", "gdal")
-            lyrList.append(rlyr_ras_cellsize_x_rZAA)
-
-            # Calculate sumproduct(cellsize * rZAA) per TEZG (= SP2)
-            processing.run("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_ras_cellsize_x_rZAA,
-                'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'SP2_',
-                'STATS': [1]})
-
-            # Count grid cells ZAA (before reclassify) per TEZG  (= C2)
-            processing.run("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_rasTezgZAA,
-                'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'C2_',  # cell count x cell size = sum(cellsize)
-                'STATS': [0]})
-
-            # --- Calculate weighted means for ZAF and ZAA and add to dictionary
-            featsZA = vlyr_tezg.getFeatures()
-            for feat in featsZA:
-                fid = int(feat['TEZG_ID_ZK'])
-                if feat['s1_sum'] != 0:
-                    # Weighted mean ZAF                
-                    wZAF = feat['SP1_sum'] / feat['s1_sum']
-                    dictCsv[fid]['ZAF 1 bis 7'] = str(round(wZAF, 4)).replace('.', ',')
-                    # Weighted mean ZAA
-                    wZAA = (feat['SP2_sum'] / (feat['C2_count'] * cellsize)) * 100
-                    dictCsv[fid]['Anteil [%]'] = str(round(wZAA, 4)).replace('.', ',')
+            # Rasterise ZAF and ZAA once onto the DEM grid
+            return (rasterize_values(value_shapes(vlyr_tezgZA, zafVal), zoneGrid),
+                    rasterize_values(value_shapes(vlyr_tezgZA, zaaVal), zoneGrid))
 
         # # -----------------------------------
         # --- CALCULATE CHANNEL STATISTICS ---
-        feedback.pushInfo("... calculating channel attributes and adding them to dictionary")
-
-        # Intersect coarse drainage with tezgs
-        res16 = processing.run("native:intersection", {
-            'INPUT': vlyr_srcGer,
-            'OVERLAY': vlyr_tezg,
-            'INPUT_FIELDS': [],
-            'OVERLAY_FIELDS': [],
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-
-        # Dissolve by tezg
-        res17 = processing.run("native:dissolve", {
-            'INPUT': res16['OUTPUT'],
-            'FIELD': ['TEZG_ID_ZK'],
-            'OUTPUT': QgsProcessingUtils.tempFolder() + '/OUTPUT' + str(random.getrandbits(128)) + '.shp'})
-        vlyr_tezgGer_dis = QgsVectorLayer(res17['OUTPUT'], 'vlyr_tezgGer_dis', 'ogr')
-        # vlyr_tezgGer_dis.setName('vlyr_tezgGer_dis')
-        lyrList.append(vlyr_tezgGer_dis)
-
-        # Calculate coarse drainage length per tezg and add to dictCsv
-
-        featsGer = vlyr_tezgGer_dis.getFeatures()
-        for feat in featsGer:
-            fid = int(feat['TEZG_ID_ZK'])
-            length = feat.geometry().length()
-            dictCsv[fid]['G-Laenge [m]'] = str(round(length, 1)).replace('.', ',')
-
-        # Rasterize vtezgGer    # GDAL and SAGA rasterize (s. res8) produce slightly different drainage raster, possibly necessary to align methods
-        res18 = processing.run("gdal:rasterize", {
-            'INPUT': vlyr_tezgGer_dis,
-            'FIELD': 'TEZG_ID_ZK',
-            'BURN': None,
-            'UNITS': 1,
-            'WIDTH': cellsize,
-            'HEIGHT': cellsize,
-            'EXTENT': rlyr_demFilled,
-            'NODATA': None,
-            'OPTIONS': '',
-            'DATA_TYPE': 5,
-            'INIT': None,
-            'INVERT': False,
-            'OUTPUT': 'TEMPORARY_OUTPUT'})
-        rlyr_rasTezgGer = QgsRasterLayer(res18['OUTPUT'], "rlyr_rasTezgGer", "gdal")
-        lyrList.append(rlyr_rasTezgGer)
-
-        # Calculate channel altitude range in TEZGs
-        res19 = processing.run("native:rasterlayerzonalstats", {
-            'INPUT': rlyr_demClp,
-            'BAND': 1,
-            'ZONES': rlyr_rasTezgGer,
-            'ZONES_BAND': 1,
-            'REF_LAYER': 1,
-            'OUTPUT_TABLE': 'TEMPORARY_OUTPUT'})
-        vlyr_tezgGerStats = res19['OUTPUT_TABLE']
-        vlyr_tezgGerStats.setName('vlyr_tezgGerStats')
-        lyrList.append(vlyr_tezgGerStats)
-
-        # Calculate channel slope
-        feats = vlyr_tezgGerStats.getFeatures()
-        for feat in feats:
-            fid = int(float(feat['zone']))
-            if fid != 0:
-                elevRange = float(feat['max']) - float(feat['min'])
-                length = float(dictCsv[fid]['G-Laenge [m]'].replace(',', '.'))
-                chSlp = elevRange / length
-                dictCsv[fid]['G-Neigung [1]'] = str(round(chSlp, 3)).replace('.', ',')
+        def channelBranch():
+            # Clip the coarse drainage per tezg (spatial index), sum the lengths and take the altitude range of the
+            # DEM cells along the clipped lines
+            stats = channel_stats(channelSource, calcShapes, demClpPath)
+            channelRows = {}
+            for fid, (length, zMin, zMax) in stats.items():
+                length = round(length, 1)
+                channelRows[fid] = {'G-Laenge [m]': str(length).replace('.', ',')}
+                # Calculate channel slope (no DEM cell along the channel -> no slope, as before)
+                if length > 0 and zMax == zMax:
+                    chSlp = (zMax - zMin) / length
+                    channelRows[fid]['G-Neigung [1]'] = str(round(chSlp, 3)).replace('.', ',')
+
+            if keepDataBOOL:
+                with open(tezgGerStats, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file, delimiter=';')
+                    writer.writerow(['zone', 'length', 'min', 'max'])
+                    for fid, (length, zMin, zMax) in sorted(stats.items()):
+                        writer.writerow([fid] + [str(round(v, 3)).replace('.', ',') for v in (length, zMin, zMax)])
+            return channelRows
+
+        branches = TaskGraph()
+        branches.add('hydrology', hydrologyBranch)
+        branches.add('slope', slopeBranch)
+        branches.add('AKL intersection and areas', lambda: classBranch(beiwert, crsAKL, beiwertVal, 'vlyr_tezgAKL'),
+                     local=True)
+        branches.add('RKL intersection and areas',
+                     lambda: classBranch(rauhigkeit, crsRKL, rauhigkeitVal, 'vlyr_tezgRKL'), local=True)
+        if zaSrc:
+            branches.add('ZA intersection and rasterisation', interflowBranch, local=True)
+        branches.add('channel statistics', channelBranch)
+
+        feedback.pushInfo("... calculating hydrology, slope, AKL, RKL, ZA and channel attributes ({} branches, {} "
+                          "at a time)".format(len(branches.tasks), branchWorkers))
+        if branchWorkers > 1:
+            profiler.mark('concurrent branches')
+        branchResults = branches.run(branchWorkers, feedback, on_start=profiler.mark)
+        if feedback.isCanceled():
+            return {}
+        for name, seconds in branches.timings.items():
+            feedback.pushInfo("    {}: {} s".format(name, seconds))
+            profiler.record(name, seconds)
+
+        # Layers of the hydrological rasters, created in this thread (saved with KEEPDATA)
+        for path, name in branchResults['hydrology'].get('rasters', []):
+            lyrList.append(QgsRasterLayer(path, name, "gdal"))
+
+        ## --- Calculate TEZG Area Attributes ---
+        feedback.pushInfo("... calculating TEZG area attributes and adding them to dictionary")
+        profiler.mark('merge branches')
+
+        # Slope, ridge flow length and the interflow arrays are read in a single zonal statistics sweep
+        zonal = ZonalEngine(zoneGrid)
+        zonal.add_array('slpP', branchResults['slope'])
+        hydroResult = branchResults['hydrology']
+        if 'arrays' in hydroResult:
+            hydroArrays = hydroResult['arrays']
+            zonal.add_array('flenM', hydroArrays['flen_ridges'])
+            if keepDataBOOL:
+                for name, path in (('filled', demFilled), ('facc', demFAcc), ('ridges', demFAccRecl),
+                                   ('flen', demFLen), ('flen_ridges', demFLenRidges)):
+                    write_array(os.path.splitext(path)[0] + '.tif', hydroArrays[name], zoneGrid)
+        elif 'flen' in hydroResult:
+            # Overland flow length at ridges (flow accumulation 1..2 cells): flow length and accumulation are
+            # read together in the zonal sweep, no ridge or multiplied raster is written
+            zonal.add_masked_raster('flenM', hydroResult['flen'], hydroResult['facc'], *hydro.RIDGE_CELLS)
+            if keepDataBOOL:
+                facc = read_array(hydroResult['facc'])
+                write_array(os.path.splitext(demFAccRecl)[0] + '.tif', hydro.ridges(facc), zoneGrid)
+                write_array(os.path.splitext(demFLenRidges)[0] + '.tif',
+                            hydro.ridge_flow_length(facc, read_array(hydroResult['flen'])), zoneGrid)
+                facc = None
+        zonalFields = [
+            ('slpPmean', 'slpP', 'mean'),
+            ('flenMcount', 'flenM', 'count'),
+            ('flenMmean', 'flenM', 'mean'),
+            ('flenMmin', 'flenM', 'min'),
+            ('flenMmax', 'flenM', 'max')]
+
+        # AKL and RKL areas per class value and TEZG
+        aklVal = [0, 1, 2, 3, 4, 5, 6]
+        aklArea = branchResults['AKL intersection and areas']
+        rklVal = [1, 2, 3, 4, 5, 6]
+        rklArea = branchResults['RKL intersection and areas']
+        for fid in fidVal:
+            for val in aklVal:
+                dictCsv[fid]['AKL-{}'.format(val)] = round(aklArea.get((fid, val), 0))
+            for val in rklVal:
+                dictCsv[fid]['RKL-{}'.format(val)] = round(rklArea.get((fid, val), 0))
+
+        if zaSrc:
+            rasZAF, rasZAA = branchResults['ZA intersection and rasterisation']
+
+            ## --- Calculate weighted means for ZAF and ZAA per TEZG --- ##
+            # Source: "P:\NR\BMLF\WLV\PROJEKTE\PYQGIS\Zemokost\DATA_IN\BMNT_20200316\Zemokost_Erweiterung Zwischenabfluss.docx"
+
+            # Reclassify ZAF (>4=NoData; V.1_4_0 >3=NoData), mask ZAA with ZAF > 0 and register
+            # SP1 = sumproduct(rZAF * rZAA), S1 = sum(rZAA), SP2 = sumproduct(cellsize * rZAA)
+            # and C2 = count(ZAA) with the zonal statistics sweep
+            rasZA = add_interflow(zonal, rasZAF, rasZAA, cellsize)
+            zonalFields += [
+                ('SP1_sum', 'SP1', 'sum'),
+                ('S1_sum', 'S1', 'sum'),
+                ('SP2_sum', 'SP2', 'sum'),
+                ('C2_count', 'C2', 'count')]
+
+            if keepDataBOOL:
+                write_array(rasTezgZAF, rasZAF, zoneGrid)
+                write_array(rasTezgZAF_recl, rasZA['ZAF_recl'], zoneGrid)
+                write_array(rasTezgZAA, rasZAA, zoneGrid)
+                write_array(rasTezgZAA_recl, rasZA['ZAA_recl'], zoneGrid)
+                write_array(ras_rZAF_x_rZAA, rasZA['SP1'], zoneGrid)
+                write_array(ras_cellsize_x_rZAA, rasZA['SP2'], zoneGrid)
+
+        ## --- ZONAL STATISTICS (single sweep over all rasters) ---
+        feedback.pushInfo("... calculating zonal statistics and adding them to dictionary")
+        profiler.mark('zonal statistics')
+        zonalStats = zonal.run()
+        if 'tiles' in hydroResult:
+            zonalStats.set_stats('flenM', hydroResult['tiles'])
+
+        for fid in fidVal:
+            # Slope and average max flow length
+            slpMean = zonalStats.value(fid, 'slpP', 'mean')
+            if slpMean is not None:
+                dictCsv[fid]['F-Neigung [1]'] = str(round(slpMean / 100, 3)).replace('.', ',')
+            flenMean = zonalStats.value(fid, 'flenM', 'mean')
+            if flenMean is not None:
+                dictCsv[fid]['F-Laenge [m]'] = str(round(flenMean))
+
+            # Weighted mean ZAF and ZAA
+            if zaSrc:
+                wZA = weighted_interflow(zonalStats, fid, cellsize)
+                if wZA is not None:
+                    dictCsv[fid]['ZAF 1 bis 7'] = str(round(wZA[0], 4)).replace('.', ',')
+                    dictCsv[fid]['Anteil [%]'] = str(round(wZA[1], 4)).replace('.', ',')
+
+        # Channel length and slope per TEZG
+        for fid, row in branchResults['channel statistics'].items():
+            if fid in dictCsv:
+                dictCsv[fid].update(row)
+
+        # Compare F-Laenge and F-Neigung with the native DEM resolution
+        if resolutionReportBOOL and targetCellsize > 0:
+            # Both resolutions per TEZG window, so that they differ only in the cell size
+            feedback.pushInfo("... calculating F-Laenge and F-Neigung per TEZG window at DEM and target resolution "
+                              "for the resolution report")
+            profiler.mark('resolution report')
+            reportStats = [window_table(wbt, dgm.source(), calcShapes, drainage_path, temp_folder, cellsize=size,
+                                        crs_wkt=dgm.crs().toWkt(), feedback=feedback, threads=threads,
+                                        cache_mb=gdalCacheMb)
+                           for size in (None, targetCellsize)]
+            write_report(os.path.join(wDir, RESOLUTION_REPORT_FILE), fidVal, *reportStats, nativeCellsize, cellsize)
+
+        # Keep the statistics as TEZG attributes for the saved TEZG_Stats.shp
+        if keepDataBOOL:
+            add_table_fields(vlyr_tezg, 'TEZG_ID_ZK', zonalStats, zonalFields)
 
         ## --- CREATE OUTPUT CSV ---
         feedback.pushInfo("... saving dictionary in output csv")
+        profiler.mark('write csv')
 
-        # Sort dictCSV in reversed order
-        dictCsvRev = dict(sorted(dictCsv.items(), reverse=True))
-
-        ## Write to csv
+        # Incremental run: take over the rows of the unchanged TEZG from the existing csv
+        if incrementalBOOL:
+            for fid, row in keptRows.items():
+                dictCsv.setdefault(fid, row)
 
-        outCsv = os.path.join(wDir, 'import_zemokost.csv')
-        with open(outCsv, mode='w', newline='') as file:
-            fieldnames = ['TEZG Nr.', 'K.O.', 'K.U.', 'Bezeichnung/Ergaenzung', 'X', 'Y', 'Flaeche [km2]',
-                          'F-Laenge [m]',
-                          'F-Neigung [1]', 'Nat. Ret.[%]', 'Basisabfl. [m3/s]', 'AKL-0', 'AKL-1', 'AKL-2', 'AKL-3',
-                          'AKL-4', 'AKL-5', 'AKL-6', 'RKL-1', 'RKL-2', 'RKL-3', 'RKL-4', 'RKL-5', 'RKL-6',
-                          'ZAF 1 bis 7', 'Anteil [%]', 'G-Laenge [m]', 'G-Neigung [1]', 'd90 [m]']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-
-            writer.writeheader()
-            for key in dictCsvRev.keys():
-                writer.writerow(dictCsvRev[key])
+        ## Write to csv (sorted in reversed order)
+        write_zemokost_csv(outCsv, dictCsv)
+        if incrementalBOOL:
+            incremental.save_state(statePath, globalFp, fingerprints)
         
         ## --- WRITE TEMP DATA TO FOLDER ---
 
         if keepDataBOOL:
             feedback.pushInfo("... saving temp data to output folder")
+            profiler.mark('save temp data')
             # feedback.pushInfo(f"... {lyrList}")
             for i in lyrList:
                 if i.name().startswith('rlyr_'):
@@ -1177,20 +1263,17 @@ class ZEMOKOST_GISDaten(QgsProcessingAlgorithm):
                         'TARGET_CRS': i.crs(),
                         'NODATA': None, 'COPY_SUBDATASETS': False,
                         'OPTIONS': '', 'DATA_TYPE': 0,  # Use input layer data type
-                        'OUTPUT': eval(i.name()[5:])})
+                        'EXTRA': gdal_extra(threads, gdalCacheMb),
+                        'OUTPUT': eval(i.name()[5:])}, context=context)
 
-                if i.name().startswith('vlyr_') and i.name() != 'vlyr_tezgGerStats':
+                if i.name().startswith('vlyr_'):
                     QgsVectorFileWriter.writeAsVectorFormat(i, eval(i.name()[5:]), 'utf-8', i.crs(), 'ESRI Shapefile')
-
-                if i.name() == 'vlyr_tezgGerStats':
-                    QgsVectorFileWriter.writeAsVectorFormat(vlyr_tezgGerStats, tezgGerStats, 'utf-8', i.crs(), 'CSV')
+        profiler.mark('delete temp files')
         delete_temp_files(temp_folder)
         feedback.pushInfo("\nFINISHED ......................")
 
         results = {}
         results['OUTPUT'] = outCsv
-
-        # Display a warning if any polygon is smaller than 100 m²
-        if has_small_area:
-            QMessageBox.warning(None, "Warning", "Eines oder mehrere Polygone im TEZG sind kleiner als 100 m².")
+        results['WARNINGS'] = finalWarnings(dictCsv.values())
+        results['PROFILE'] = profiler.write(wDir)
         return results
\ No newline at end of file
@@ -13,19 +13,15 @@ Kurzbeschreibung
 - ZAF (Raster): wZAF = Mittel aus ZAF<=4; ZAA [%] = Anteil ZAF<=4-Zellen je TEZG.
 Hydrologie (wie WLV):
 - Clip DEM -> Fill Depressions (Wang & Liu) -> D8 Flow Accumulation (cells)
- -> Ridge-Reklassifikation (1/2->1, sonst 0)
  -> Rasterize Streams (Haupt/optional Feingerinne)
  -> Downslope Distance to Stream
- -> FlowLen × Ridge
- -> Slope (%) -> Zonalstats (F-Länge, F-Neigung), Kanalstatistik (Länge/Gefälle)
+ -> FlowLen auf Rücken (FAC 1..2) direkt in der Zonalstatistik
+ -> Slope (%) -> Zonalstats (F-Länge, F-Neigung), Kanalstatistik (Länge/Gefälle, DHM-Zellen entlang der Gerinne)
 """
 import csv
 import os
 import uuid
 import sys
-import random
-import contextlib
-import io
 import shutil
 import traceback
 import platform
@@ -38,8 +34,12 @@ from qgis.core import (
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterField,
-    QgsProcessingParameterBoolean,  # (historisch; hier nicht verwendet)
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterFileDestination,  # Pflicht-Output (wie SmokeTest)
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterDefinition,
     QgsRasterLayer,
     QgsField,
     QgsCoordinateReferenceSystem,
@@ -61,7 +61,18 @@ script_path = os.path.join(
     "profiles", "default", "processing", "scripts"
 )
 sys.path.append(script_path)
-from WBT.whitebox_tools import WhiteboxTools  # noqa: E402
+from zemokost_prep import hydro  # noqa: E402
+from zemokost_prep.cache import DEFAULT_MAX_MB, HYDRO_PARAMS, HydroCache  # noqa: E402
+from zemokost_prep.channels import channel_stats  # noqa: E402
+from zemokost_prep.raster import clip_dem, slope_percent  # noqa: E402
+from zemokost_prep.reproject import ReprojectionCache  # noqa: E402
+from zemokost_prep.routing import row_problems  # noqa: E402
+from zemokost_prep.vector import features_in_extent, layer_shapes  # noqa: E402
+from zemokost_prep.interflow import zaf_le4_arrays  # noqa: E402
+from zemokost_prep.profiling import StageProfiler  # noqa: E402
+from zemokost_prep.threads import gdal_extra, resolve_threads  # noqa: E402
+from zemokost_prep.wbt import WbtChain, whitebox_tools  # noqa: E402
+from zemokost_prep.zonal import ZonalEngine, rasterize_zones, read_array  # noqa: E402
 
 
 def delete_temp_files(temp_folder: str):
@@ -77,24 +88,6 @@ def delete_temp_files(temp_folder: str):
             pass
 
 
-def _wbt_safecall(func, *args, **kwargs):
-    """WhiteboxTools-Aufruf: stdout stummschalten + tolerant bzgl. unbekannter kwargs (z.B. callback)."""
-    with contextlib.redirect_stdout(io.StringIO()):
-        try:
-            return func(*args, **kwargs)
-        except TypeError:
-            # Falls die Wrapper-Version 'callback' o.ä. nicht kennt -> ohne erneut versuchen
-            trimmed = dict(kwargs)
-            changed = False
-            for k in ("callback", "compress_rasters", "num_threads"):
-                if k in trimmed:
-                    trimmed.pop(k, None)
-                    changed = True
-            if changed:
-                return func(*args, **trimmed)
-            raise
-
-
 class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
     # Parameter-IDs
     DEM = 'DEM'
@@ -109,6 +102,12 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
     RKL_RASTER = 'RKL_RASTER'
     ZAF_RASTER = 'ZAF_RASTER'
     OUTPUT_CSV = 'OUTPUT_CSV'
+    CACHE_DIR = 'CACHE_DIR'
+    CACHE_MAX_MB = 'CACHE_MAX_MB'
+    PROFILE = 'PROFILE'
+    HYDRO_BACKEND = 'HYDRO_BACKEND'
+    THREADS = 'THREADS'
+    GDAL_CACHE_MB = 'GDAL_CACHE_MB'
 
     def tr(self, s): return QCoreApplication.translate('Processing', s)
     def createInstance(self): return ZEMOKOST_GISDaten_RasterOnly()
@@ -148,6 +147,37 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterFileDestination(
             self.OUTPUT_CSV, self.tr('Ergebnis-CSV'), self.tr('CSV files (*.csv)'), optional=False
         ))
+        # Cache Hydrologie (Fill/D8/Rücken), wiederverwendet bei unverändertem DEM/TEZG-Umriss
+        p_cache = QgsProcessingParameterFile(self.CACHE_DIR, self.tr('Cache-Ordner Hydrologie (optional)'),
+                                             QgsProcessingParameterFile.Folder, optional=True)
+        p_cache.setFlags(p_cache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_cache)
+        p_cache_mb = QgsProcessingParameterNumber(self.CACHE_MAX_MB, self.tr('Maximale Cache-Größe [MB]'),
+                                                  QgsProcessingParameterNumber.Integer,
+                                                  defaultValue=DEFAULT_MAX_MB, minValue=0)
+        p_cache_mb.setFlags(p_cache_mb.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_cache_mb)
+        # Laufzeit/Speicher je Schritt -> import_zemokost_profile.json/.csv neben der Ergebnis-CSV
+        p_profile = QgsProcessingParameterBoolean(self.PROFILE,
+                                                  self.tr('Laufzeit und Speicherbedarf je Arbeitsschritt protokollieren'),
+                                                  defaultValue=False)
+        p_profile.setFlags(p_profile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_profile)
+        # Hydrologie mit WhiteboxTools oder im Prozess auf NumPy-Arrays (ohne WBT-Installation)
+        p_backend = QgsProcessingParameterEnum(self.HYDRO_BACKEND, self.tr('Hydrologie berechnen mit'),
+                                               options=['WhiteboxTools', 'NumPy (im Prozess, ohne WhiteboxTools)'],
+                                               defaultValue=0)
+        p_backend.setFlags(p_backend.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_backend)
+        # Threads für WhiteboxTools, GDAL-Warp und gdal:*-Algorithmen, GDAL-Cache; je Aufruf übergeben
+        p_threads = QgsProcessingParameterNumber(self.THREADS, self.tr('Anzahl Threads (0 = alle Prozessorkerne)'),
+                                                 QgsProcessingParameterNumber.Integer, defaultValue=0, minValue=0)
+        p_threads.setFlags(p_threads.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_threads)
+        p_gdal_cache = QgsProcessingParameterNumber(self.GDAL_CACHE_MB, self.tr('GDAL-Cache [MB] (0 = GDAL-Standard)'),
+                                                    QgsProcessingParameterNumber.Integer, defaultValue=0, minValue=0)
+        p_gdal_cache.setFlags(p_gdal_cache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(p_gdal_cache)
 
     # --- Utilities ---
     @staticmethod
@@ -158,13 +188,15 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             ext = layer_or_raster
         return f"{ext.xMinimum()},{ext.xMaximum()},{ext.yMinimum()},{ext.yMaximum()}"
 
-    def _align_to_dem(self, in_ras, rlyr_demClp, cellsize, name, categorical=False, run=None):
+    def _align_to_dem(self, in_ras, rlyr_demClp, cellsize, name, categorical=False, run=None, extra=''):
         """
-        Reproject/Resample in_ras auf DEM-Ausdehnung/Auflösung.
+        Reproject/Resample in_ras exakt auf das Raster des DEM (Ausdehnung/Auflösung,
+        ohne -tap), damit die Zonalstatistik alle Raster zellgleich lesen kann.
         - RESAMPLING: nearest (kategorisch) / bilinear (kontinuierlich)
         - SRC_NODATA: aus dem Quellband ausgelesen (falls vorhanden)
         - DST_NODATA: -9999 (nur gesetzt, wenn SRC_NODATA erkannt)
         - Datentyp: NICHT erzwingen (Float bleibt Float; kein -ot Int32)
+        - extra: GDAL-Threads/Cache dieses Aufrufs (threads.gdal_extra)
         """
         resampling = 1 if not categorical else 0
         runner = run if callable(run) else processing.run
@@ -186,7 +218,7 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             'TARGET_EXTENT': self._extent_string(rlyr_demClp),
             'TARGET_EXTENT_CRS': rlyr_demClp.crs(),
             'MULTITHREADING': True,
-            'EXTRA': '-tap',
+            'EXTRA': extra,
             'OUTPUT': 'TEMPORARY_OUTPUT'
         }
         if src_nd is not None:
@@ -201,7 +233,9 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
 
         # STEP helper
         step = {"n": 0}
-        TOTAL_STEPS = 31
+        TOTAL_STEPS = 24
+        # Jeder STEP ist eine Profiling-Stufe (nur aktiv mit PROFILE)
+        profiler = StageProfiler(enabled=self.parameterAsBool(parameters, self.PROFILE, context))
 
         def check_cancel():
             if feedback.isCanceled():
@@ -211,6 +245,7 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             check_cancel()
             step["n"] += 1
             feedback.pushInfo(f"[STEP {step['n']:02d}] {msg}")
+            profiler.mark(msg)
             try:
                 p = int(step["n"] / TOTAL_STEPS * 100)
                 feedback.setProgress(min(p, 99))
@@ -241,53 +276,26 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
                     return y0 + t * (y1 - y0)
             return y[-1]
 
-        # Versionsrobuste Hülle für native:rasterlayerzonalstats (OUTPUT vs OUTPUT_TABLE)
-        def run_rasterlayerzonalstats(raster_layer, band, zones_raster, zones_band, ref_layer, name="zstats"):
-            params_common = {
-                'INPUT': raster_layer,
-                'RASTER_BAND': band,
-                'ZONES': zones_raster,
-                'ZONES_BAND': zones_band,
-            }
-            if ref_layer is not None:
-                params_common['REF_LAYER'] = ref_layer
-            try:
-                # bevorzugt Tabellen-Ausgabe
-                res = prun("native:rasterlayerzonalstats", {**params_common, 'OUTPUT_TABLE': 'TEMPORARY_OUTPUT'})
-                out = res.get('OUTPUT_TABLE', None) or res.get('OUTPUT', None)
-                if isinstance(out, QgsVectorLayer):
-                    return out
-                if isinstance(out, str):
-                    return QgsVectorLayer(out, name, 'ogr')
-                for k, v in res.items():
-                    if isinstance(v, QgsVectorLayer):
-                        return v
-                raise QgsProcessingException("Unerwartete Rückgabe (OUTPUT_TABLE).")
-            except Exception:
-                res = prun("native:rasterlayerzonalstats", {**params_common, 'OUTPUT_TABLE': 'TEMPORARY_OUTPUT'})
-                out = res.get('OUTPUT_TABLE', None) or res.get('OUTPUT', None)
-                if isinstance(out, QgsVectorLayer):
-                    return out
-                if isinstance(out, str):
-                    return QgsVectorLayer(out, name, 'ogr')
-                for k, v in res.items():
-                    if isinstance(v, QgsVectorLayer):
-                        return v
-                raise QgsProcessingException("Unerwartete Rückgabe (OUTPUT_TABLE).")
-
         try:
             # --- Whitebox init ---
             mark("Init WhiteboxTools")
-            wbt = WhiteboxTools()
+            # Instanz wird pro Prozess nur einmal erzeugt (CLI/Batch: Wiederverwendung);
+            # NumPy-Backend: kein WhiteboxTools nötig, Zwischenraster bleiben im Speicher
+            hydro_backend = hydro.BACKENDS[self.parameterAsEnum(parameters, self.HYDRO_BACKEND, context)]
+            wbt = whitebox_tools(verbose=False) if hydro_backend == 'wbt' else None
+            hy = {}
+            # Einheitliche WBT-Aufrufe (Threads, Kompression) mit Laufzeit je Tool im Log
+            threads = resolve_threads(self.parameterAsInt(parameters, self.THREADS, context))
+            # GDAL-Threads/Cache je Aufruf, die GDAL-Konfiguration von QGIS bleibt unverändert
+            gdal_cache_mb = self.parameterAsInt(parameters, self.GDAL_CACHE_MB, context)
+            gdal_extra_opts = gdal_extra(threads, gdal_cache_mb)
+            wbt_chain = (WbtChain(wbt, num_threads=threads, profiler=profiler, feedback=feedback)
+                         if wbt is not None else None)
             try:
-                if hasattr(wbt, "set_hide_console"):
+                if wbt is not None and hasattr(wbt, "set_hide_console"):
                     wbt.set_hide_console(True)
             except Exception:
                 pass
-            try:
-                wbt.set_verbose_mode(False)
-            except Exception:
-                pass
             if platform.system().lower().startswith("win"):
                 os.environ["WBT_HIDE_CONSOLE"] = "TRUE"
                 os.environ["WBT_DISABLE_PROGRESS_BAR"] = "TRUE"
@@ -306,11 +314,15 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             rkl_ras_in = self.parameterAsRasterLayer(parameters, self.RKL_RASTER, context)
             zaf_ras_in = self.parameterAsRasterLayer(parameters, self.ZAF_RASTER, context)
             outCsv = self.parameterAsFileOutput(parameters, self.OUTPUT_CSV, context)
+            cache_dir = self.parameterAsString(parameters, self.CACHE_DIR, context)
+            cache_max_mb = self.parameterAsInt(parameters, self.CACHE_MAX_MB, context)
             feedback.pushInfo(f"OUTPUT_CSV path: {outCsv}")
 
             # DEM-CRS Fix
             mark("DEM CRS fix (if needed)")
             if os.path.basename(dgm.source()) == 'ALS_DGM_1m_AT_COG_20240110.tif':
+                # Kopie des Layers, der Projekt-Layer bleibt unverändert (Hintergrund-Thread)
+                dgm = dgm.clone()
                 dgm.setCrs(QgsCoordinateReferenceSystem(31287, QgsCoordinateReferenceSystem.EpsgCrsId))
 
             # CRS-Checks
@@ -337,7 +349,8 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
 
             # Temp-Ordner
             mark("Prepare temp folder")
-            temp_folder = QgsProcessingUtils.tempFolder()
+            temp_folder = QgsProcessingUtils.tempFolder(context)
+            profiler.temp_folder = temp_folder
             lyrList = []
 
             # TEZG -> DEM-CRS
@@ -386,55 +399,62 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
 
             # DEM clip
             mark("Clip DEM to TEZG")
-            res4 = prun("gdal:cliprasterbymasklayer", {
-                'INPUT': dgm, 'MASK': vlyr_tezg, 'NODATA': 99999,
-                'CROP_TO_CUTLINE': True, 'DATA_TYPE': 6, 'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
-            rlyr_demClp = QgsRasterLayer(res4['OUTPUT'], "rlyr_demClp", "gdal"); lyrList.append(rlyr_demClp)
+            # Fensterweises Lesen des Quell-DEM (TEZG als Cutline) -> gekacheltes GeoTIFF (von WBT lesbar)
+            tezg_shapes = layer_shapes(vlyr_tezg, 'TEZG_ID_ZK')
+            dem_clp = os.path.join(temp_folder, f"dem_clip_{uuid.uuid4().hex}.tif")
+            clip_dem(dgm.source(), [wkb for _, wkb in tezg_shapes], dem_clp, crs_wkt=dgm.crs().toWkt(), threads=threads,
+                     cache_mb=gdal_cache_mb)
+            rlyr_demClp = QgsRasterLayer(dem_clp, "rlyr_demClp", "gdal"); lyrList.append(rlyr_demClp)
 
             # ------- Hydro -------
-            mark("WBT fill_depressions_wang_and_liu")
-            dem_corr = os.path.join(temp_folder, f"dem_corr_{uuid.uuid4().hex}.tif")
-            _wbt_safecall(
-                wbt.fill_depressions_wang_and_liu,
-                rlyr_demClp.dataProvider().dataSourceUri(), dem_corr,
-                True, None
-            )
-            rlyr_demFilled = QgsRasterLayer(dem_corr, "rlyr_demFilled", "gdal"); lyrList.append(rlyr_demFilled)
-
-            mark("WBT d8_flow_accumulation")
-            facc = os.path.join(temp_folder, f"facc_{uuid.uuid4().hex}.tif")
-            _wbt_safecall(
-                wbt.d8_flow_accumulation,
-                dem_corr, facc, "cells"
-            )
-            rlyr_demFAcc = QgsRasterLayer(facc, "rlyr_demFAcc", "gdal"); lyrList.append(rlyr_demFAcc)
-
-            mark("Reclassify ridges from FAC")
-            stats = rlyr_demFAcc.dataProvider().bandStatistics(1)
-            res_ridges = prun("native:reclassifybytable", {
-                'INPUT_RASTER': rlyr_demFAcc, 'RASTER_BAND': 1,
-                'TABLE': ['1', '2', '1', '3', stats.maximumValue, '0'],
-                'NO_DATA': 0, 'RANGE_BOUNDARIES': 2, 'NODATA_FOR_MISSING': False,
-                'DATA_TYPE': 5, 'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
-            rlyr_demFAccRecl = QgsRasterLayer(res_ridges['OUTPUT'], "rlyr_demFAccRecl", "gdal"); lyrList.append(rlyr_demFAccRecl)
+            # Fill/D8/Rücken hängen nur vom geclippten DEM ab -> Cache-Lookup
+            hydro_cache = HydroCache(cache_dir, cache_max_mb) if cache_dir and wbt is not None else None
+            hydro_files = None
+            if hydro_cache is not None:
+                hydro_key = hydro_cache.key(rlyr_demClp.source(), HYDRO_PARAMS)
+                hydro_files = hydro_cache.get(hydro_key)
+                if hydro_files:
+                    feedback.pushInfo(f"Hydrologie aus Cache: {hydro_key[:12]}")
+
+            mark("WBT fill_depressions_wang_and_liu + d8_flow_accumulation")
+            if wbt is None:
+                dem_ds = gdal.Open(dem_clp)
+                dem_gt = dem_ds.GetGeoTransform()
+                hy['filled'] = hydro.fill_depressions(read_array(dem_ds))
+                dem_ds = None
+                hy['receiver'], hy['step'] = hydro.d8_receivers(hy['filled'], abs(dem_gt[1]), abs(dem_gt[5]))
+                hy['facc'] = hydro.flow_accumulation(hy['filled'], hy['receiver'])
+            elif hydro_files:
+                dem_corr, facc = hydro_files['filled'], hydro_files['facc']
+            else:
+                dem_corr = os.path.join(temp_folder, f"dem_corr_{uuid.uuid4().hex}.tif")
+                facc = os.path.join(temp_folder, f"facc_{uuid.uuid4().hex}.tif")
+                # Füllen und D8 in einer Kette (Laufzeit je Tool in Log und Profil)
+                wbt_chain.add('fill_depressions_wang_and_liu', dem=rlyr_demClp.dataProvider().dataSourceUri(),
+                              output=dem_corr, fix_flats=True)
+                wbt_chain.add('d8_flow_accumulation', input=dem_corr, output=facc, out_type='cells')
+                wbt_chain.run()
+                if hydro_cache is not None:
+                    hydro_cache.put(hydro_key, {'filled': dem_corr, 'facc': facc})
+            if wbt is not None:
+                rlyr_demFilled = QgsRasterLayer(dem_corr, "rlyr_demFilled", "gdal"); lyrList.append(rlyr_demFilled)
+                rlyr_demFAcc = QgsRasterLayer(facc, "rlyr_demFAcc", "gdal"); lyrList.append(rlyr_demFAcc)
 
             # Gerinne
             mark("Clip/reproject channels")
+            # Nur Linien im gepufferten TEZG-Extent lesen (räumlicher Index, .qix wird bei Bedarf erzeugt)
             crsDEM = dgm.crs().authid().split(':')[1]
             crsGer = gerinne.crs().authid().split(':')[1]
             if feingerinne:
                 crsFGer = feingerinne.crs().authid().split(':')[1]
 
-            if crsDEM != crsGer:
-                res_te_reproj = prun("native:reprojectlayer", {'INPUT': vlyr_tezg, 'TARGET_CRS': gerinne, 'OUTPUT': 'TEMPORARY_OUTPUT'})
-                clipTEZG_ger = res_te_reproj['OUTPUT']
-            else:
-                clipTEZG_ger = vlyr_tezg
+            # TEZG je Ziel-KBS nur einmal reprojizieren (Gerinne und Feingerinne teilen sich das Ergebnis)
+            reproj_cache = ReprojectionCache(temp_folder, context, feedback,
+                                             HydroCache(cache_dir, cache_max_mb) if cache_dir else None)
+            clipTEZG_ger = reproj_cache.layer(vlyr_tezg, gerinne.crs()) if crsDEM != crsGer else vlyr_tezg
 
             gerinne_path = os.path.join(temp_folder, f"gerinne_{uuid.uuid4().hex}.shp")
-            res_g_clip = prun("native:clip", {'INPUT': gerinne, 'OVERLAY': clipTEZG_ger, 'OUTPUT': gerinne_path})
+            res_g_clip = prun("native:clip", {'INPUT': features_in_extent(gerinne, clipTEZG_ger.extent(), buffer=cellsize), 'OVERLAY': clipTEZG_ger, 'OUTPUT': gerinne_path})
             vlyr_srcGer = QgsVectorLayer(res_g_clip['OUTPUT'], 'vlyr_srcGer', 'ogr')
             if crsDEM != crsGer:
                 res_g_reproj = prun("native:reprojectlayer", {'INPUT': vlyr_srcGer, 'TARGET_CRS': dgm, 'OUTPUT': gerinne_path})
@@ -442,13 +462,9 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             lyrList.append(vlyr_srcGer)
 
             if feingerinne:
-                if crsDEM != crsFGer:
-                    res_te2 = prun("native:reprojectlayer", {'INPUT': vlyr_tezg, 'TARGET_CRS': feingerinne, 'OUTPUT': 'TEMPORARY_OUTPUT'})
-                    clipTEZG2 = res_te2['OUTPUT']
-                else:
-                    clipTEZG2 = vlyr_tezg
+                clipTEZG2 = reproj_cache.layer(vlyr_tezg, feingerinne.crs()) if crsDEM != crsFGer else vlyr_tezg
                 feingerinne_path = os.path.join(temp_folder, f"feingerinne_{uuid.uuid4().hex}.shp")
-                res_fg = prun("native:clip", {'INPUT': feingerinne, 'OVERLAY': clipTEZG2, 'OUTPUT': feingerinne_path})
+                res_fg = prun("native:clip", {'INPUT': features_in_extent(feingerinne, clipTEZG2.extent(), buffer=cellsize), 'OVERLAY': clipTEZG2, 'OUTPUT': feingerinne_path})
                 if crsDEM != crsFGer:
                     feingerinne_path_reproj = os.path.join(temp_folder, f"feingerinne_reproj_{uuid.uuid4().hex}.shp")
                     res_fg2 = prun("native:reprojectlayer", {
@@ -463,111 +479,89 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             else:
                 drainage_path = vlyr_srcGer.source()
 
-            mark("WBT rasterize_streams")
-            rasStreams = os.path.join(temp_folder, f"streams_{uuid.uuid4().hex}.tif")
-            _wbt_safecall(
-                wbt.rasterize_streams,
-                drainage_path, dem_corr, rasStreams, False
-            )
-            rlyr_rasDrain = QgsRasterLayer(rasStreams, "rlyr_rasDrain", "gdal"); lyrList.append(rlyr_rasDrain)
-
-            mark("WBT downslope_distance_to_stream")
-            flen = os.path.join(temp_folder, f"flen_{uuid.uuid4().hex}.tif")
-            _wbt_safecall(
-                wbt.downslope_distance_to_stream,
-                dem_corr, rasStreams, flen, False
-            )
-            rlyr_demFLen = QgsRasterLayer(flen, "rlyr_demFLen", "gdal"); lyrList.append(rlyr_demFLen)
-
-            mark("WBT raster_calculator (FlowLen×Ridge)")
-            flen_ridges = os.path.join(temp_folder, f"flen_ridges_{uuid.uuid4().hex}.tif")
-            _wbt_safecall(
-                wbt.raster_calculator, flen_ridges,
-                f'"{rlyr_demFLen.dataProvider().dataSourceUri()}" * '
-                f'"{rlyr_demFAccRecl.dataProvider().dataSourceUri()}"'
-            )
-            rlyr_demFLenRidges = QgsRasterLayer(flen_ridges, "rlyr_demFLenRidges", "gdal"); lyrList.append(rlyr_demFLenRidges)
-
-            # Slope/Zonal
-            mark("GDAL slope")
-            res_slope = prun("gdal:slope", {
-                'INPUT': rlyr_demClp, 'BAND': 1, 'AS_PERCENT': True, 'ZEVENBERGEN': False,
-                'OPTIONS': '', 'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
-            rlyr_demSlp = QgsRasterLayer(res_slope['OUTPUT'], "rlyr_demSlp", "gdal"); lyrList.append(rlyr_demSlp)
-
-            mark("Zonalstats slope")
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_demSlp, 'RASTER_BAND': 1, 'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'slpP', 'STATS': [2]
-            })
-            for f in vlyr_tezg.getFeatures():
-                fid = int(f['TEZG_ID_ZK'])
-                mean_val = f['slpPmean']
-                dictCsv[fid]['F-Neigung [1]'] = str(round((mean_val / 100) if mean_val is not None else 0, 3)).replace('.', ',')
-
-            mark("Zonalstats flowlen×ridge")
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_demFLenRidges, 'RASTER_BAND': 1, 'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'flenM', 'STATS': [0, 2, 5, 6]
-            })
-            for f in vlyr_tezg.getFeatures():
-                fid = int(f['TEZG_ID_ZK'])
-                dictCsv[fid]['F-Laenge [m]'] = str(round(f['flenMmean'] if f['flenMmean'] is not None else 0)).replace('.', ',')
+            mark("WBT rasterize_streams + downslope_distance_to_stream")
+            if wbt is None:
+                hy['streams'] = hydro.rasterize_streams(drainage_path, dem_clp)
+                hy['flen'] = hydro.downslope_distance(hy['filled'], hy['receiver'], hy['step'], hy['streams'])
+            else:
+                rasStreams = os.path.join(temp_folder, f"streams_{uuid.uuid4().hex}.tif")
+                flen = os.path.join(temp_folder, f"flen_{uuid.uuid4().hex}.tif")
+                wbt_chain.add('rasterize_streams', streams=drainage_path, base=dem_corr, output=rasStreams)
+                wbt_chain.add('downslope_distance_to_stream', dem=dem_corr, streams=rasStreams, output=flen)
+                wbt_chain.run()
+                rlyr_rasDrain = QgsRasterLayer(rasStreams, "rlyr_rasDrain", "gdal"); lyrList.append(rlyr_rasDrain)
+                rlyr_demFLen = QgsRasterLayer(flen, "rlyr_demFLen", "gdal"); lyrList.append(rlyr_demFLen)
+
+            # Slope
+            mark("Slope (Horn, %) in memory")
+            ras_slp = slope_percent(read_array(rlyr_demClp.source()), cellsize)
 
             # Kanalstatistik
             mark("Channel stats (length/slope)")
-            res_g_inter = prun("native:intersection", {
-                'INPUT': QgsVectorLayer(vlyr_srcGer.source(), 'vlyr_srcGer', 'ogr'),
-                'OVERLAY': vlyr_tezg, 'INPUT_FIELDS': [], 'OVERLAY_FIELDS': [],
-                'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
-            res_g_diss = prun("native:dissolve", {
-                'INPUT': res_g_inter['OUTPUT'], 'FIELD': ['TEZG_ID_ZK'],
-                'OUTPUT': QgsProcessingUtils.tempFolder() + '/OUTPUT' + str(random.getrandbits(128)) + '.shp'
-            })
-            vlyr_tezgGer_dis = QgsVectorLayer(res_g_diss['OUTPUT'], 'vlyr_tezgGer_dis', 'ogr'); lyrList.append(vlyr_tezgGer_dis)
-            for f in vlyr_tezgGer_dis.getFeatures():
-                fid = int(f['TEZG_ID_ZK']); L = f.geometry().length()
-                dictCsv[fid]['G-Laenge [m]'] = str(round(L, 1)).replace('.', ',')
-
-            res_g_ras = prun("gdal:rasterize", {
-                'INPUT': vlyr_tezgGer_dis, 'FIELD': 'TEZG_ID_ZK',
-                'BURN': None, 'UNITS': 1, 'WIDTH': cellsize, 'HEIGHT': cellsize,
-                'EXTENT': rlyr_demFilled, 'NODATA': None, 'OPTIONS': '',
-                'DATA_TYPE': 5, 'INIT': None, 'INVERT': False,
-                'OUTPUT': 'TEMPORARY_OUTPUT'
-            })
-            rlyr_rasTezgGer = QgsRasterLayer(res_g_ras['OUTPUT'], "rlyr_rasTezgGer", "gdal"); lyrList.append(rlyr_rasTezgGer)
-
-            # Zonalstats entlang Gerinne (OUTPUT_TABLE bevorzugt)
-            vtab = run_rasterlayerzonalstats(
-                raster_layer=rlyr_demClp, band=1,
-                zones_raster=rlyr_rasTezgGer, zones_band=1, ref_layer=None,
-                name="vtab"
-            )
-            lyrList.append(vtab)
-            for f in vtab.getFeatures():
-                fid = int(float(f['zone']))
-                if fid != 0 and 'G-Laenge [m]' in dictCsv.get(fid, {}):
-                    elevRange = float(f['max']) - float(f['min'])
-                    length = float(dictCsv[fid]['G-Laenge [m]'].replace(',', '.'))
+            # Gerinne je TEZG über räumlichen Index clippen, Längen summieren, Höhen der DHM-Zellen entlang der Linien
+            for fid, (L, zMin, zMax) in channel_stats(vlyr_srcGer, tezg_shapes, rlyr_demClp.source()).items():
+                if fid not in dictCsv:
+                    continue
+                length = round(L, 1)
+                dictCsv[fid]['G-Laenge [m]'] = str(length).replace('.', ',')
+                if zMax == zMax:
+                    elevRange = zMax - zMin
                     dictCsv[fid]['G-Neigung [1]'] = str(round(elevRange / length if length > 0 else 0.0, 3)).replace('.', ',')
 
-            # ----------------------------- AKL (PSI -> AKL via Stützstellen -> Klassenflächen)
-            mark("AKL zonal mean -> class shares")
-            rlyr_psi = self._align_to_dem(akl_ras_in, rlyr_demClp, cellsize, "rlyr_psi_aligned", categorical=False, run=prun)
+            # ----------------------------- AKL/RKL auf DEM-Raster ausrichten
+            mark("Align AKL (PSI) to DEM")
+            rlyr_psi = self._align_to_dem(akl_ras_in, rlyr_demClp, cellsize, "rlyr_psi_aligned", categorical=False, run=prun,
+                                          extra=gdal_extra_opts)
             lyrList.append(rlyr_psi)
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_psi, 'RASTER_BAND': 1, 'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'psi_', 'STATS': [2]
-            })
+
+            mark("Align RKL to DEM")
+            rlyr_rkl = self._align_to_dem(rkl_ras_in, rlyr_demClp, cellsize, "rlyr_rkl_aligned", categorical=False, run=prun,
+                                          extra=gdal_extra_opts)
+            lyrList.append(rlyr_rkl)
+
+            # --- ZAF -> wZAF (<=4) & ZAA [%] ---
+            mark("Align ZAF to DEM (resample)")
+            # ZAF kategorisch (nearest), damit keine bilinearen Mischwerte entstehen
+            rlyr_zaf = self._align_to_dem(zaf_ras_in, rlyr_demClp, cellsize, "rlyr_zaf_aligned", categorical=True, run=prun,
+                                          extra=gdal_extra_opts)
+            lyrList.append(rlyr_zaf)
+            if not rlyr_zaf.isValid():
+                raise QgsProcessingException(f"Aligned ZAF raster invalid. Source: {zaf_ras_in.source()}")
+
+            # ZAF <= 4: Maske (1/0, nur Klassen 1..4) und Werte (0 -> NoData) im Speicher
+            mark("ZAF mask and values (A in [1..4]) in memory")
+            zaf_le4 = zaf_le4_arrays(read_array(rlyr_zaf.source()))
+
+            # --- ZONALSTATS (ein Durchlauf für alle Raster) ---
+            mark("Fused zonal statistics (slope, flowlen×ridge, PSI, RKL, ZAF)")
+            zone_grid = rasterize_zones(tezg_shapes, rlyr_demClp.source())
+            zonal = ZonalEngine(zone_grid)
+            zonal.add_array('slpP', ras_slp)
+            # Fließlänge auf Rücken (FAC 1..2 Zellen) direkt im Zonal-Durchlauf, ohne Reklassifikation/Rasterrechner
+            if wbt is None:
+                zonal.add_array('flenM', hydro.ridge_flow_length(hy['facc'], hy['flen']))
+            else:
+                zonal.add_masked_raster('flenM', rlyr_demFLen.source(), rlyr_demFAcc.source(), *hydro.RIDGE_CELLS)
+            zonal.add_raster('psi', rlyr_psi.source())
+            zonal.add_raster('rkl', rlyr_rkl.source())
+            zonal.add_array('zaf', zaf_le4['zaf'])
+            zonal.add_array('zaale4', zaf_le4['zaale4'])
+            zstats = zonal.run()
+
+            mark("TEZG attributes from zonal statistics")
+            for fid in fid_list:
+                mean_val = zstats.value(fid, 'slpP', 'mean')
+                dictCsv[fid]['F-Neigung [1]'] = str(round((mean_val / 100) if mean_val is not None else 0, 3)).replace('.', ',')
+                flen_mean = zstats.value(fid, 'flenM', 'mean')
+                dictCsv[fid]['F-Laenge [m]'] = str(round(flen_mean if flen_mean is not None else 0)).replace('.', ',')
+
+            # AKL (PSI -> AKL via Stützstellen -> Klassenflächen)
             for fid in fid_list:
                 for cls in [0, 1, 2, 3, 4, 5, 6]:
                     dictCsv[fid][f'AKL-{cls}'] = 0
             for f in vlyr_tezg.getFeatures():
                 fid = int(f['TEZG_ID_ZK']); area_m2 = f.geometry().area()
-                m_psi = f['psi_mean']
+                m_psi = zstats.value(fid, 'psi', 'mean')
                 if m_psi is None:
                     continue
                 akl_cont = psi_to_akl_value(float(m_psi))
@@ -582,19 +576,12 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
                     dictCsv[fid][f'AKL-{k}'] = int(round(area_m2 * w_lo))
                     dictCsv[fid][f'AKL-{k + 1}'] = int(round(area_m2 * w_up))
 
-            # ----------------------------- RKL
-            mark("RKL zonal mean -> class shares")
-            rlyr_rkl = self._align_to_dem(rkl_ras_in, rlyr_demClp, cellsize, "rlyr_rkl_aligned", categorical=False, run=prun)
-            lyrList.append(rlyr_rkl)
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_rkl, 'RASTER_BAND': 1, 'INPUT_VECTOR': vlyr_tezg,
-                'COLUMN_PREFIX': 'rkl_', 'STATS': [2]
-            })
+            # RKL
             for fid in fid_list:
                 for cls in [1, 2, 3, 4, 5, 6]:
                     dictCsv[fid][f'RKL-{cls}'] = 0
             for f in vlyr_tezg.getFeatures():
-                fid = int(f['TEZG_ID_ZK']); area_m2 = f.geometry().area(); m = f['rkl_mean']
+                fid = int(f['TEZG_ID_ZK']); area_m2 = f.geometry().area(); m = zstats.value(fid, 'rkl', 'mean')
                 if m is None:
                     continue
                 if m <= 1:
@@ -606,76 +593,16 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
                     dictCsv[fid][f'RKL-{k}'] = int(round(area_m2 * w_lo))
                     dictCsv[fid][f'RKL-{k + 1}'] = int(round(area_m2 * w_up))
 
-            # --- ZAF -> wZAF (<=4) & ZAA [%] ---
-            mark("Align ZAF to DEM (resample)")
-            # ZAF kategorisch (nearest), damit keine bilinearen Mischwerte entstehen
-            rlyr_zaf = self._align_to_dem(zaf_ras_in, rlyr_demClp, cellsize, "rlyr_zaf_aligned", categorical=True, run=prun)
-            lyrList.append(rlyr_zaf)
-            if not rlyr_zaf.isValid():
-                raise QgsProcessingException(f"Aligned ZAF raster invalid. Source: {zaf_ras_in.source()}")
-
-            # ZAF <= 4: Maske erstellen (1/0) via GDAL rastercalculator (nur Klassen 1..4)
-            mark("ZAF mask (A in [1..4]) via GDAL rastercalculator")
-            mask_path = os.path.join(temp_folder, f"zaf_mask_le4_{uuid.uuid4().hex}.tif")
-            res_mask = prun("gdal:rastercalculator", {
-                'INPUT_A': rlyr_zaf, 'BAND_A': 1,
-                'FORMULA': '((A >= 1) * (A <= 4))',
-                'NO_DATA': -9999, 'RTYPE': 5,  # Float32
-                'EXTRA': '', 'OUTPUT': mask_path
-            })
-            rlyr_zaf_le4_mask = QgsRasterLayer(res_mask['OUTPUT'], "rlyr_zaf_le4_mask", "gdal")
-            lyrList.append(rlyr_zaf_le4_mask)
-            if not rlyr_zaf_le4_mask.isValid():
-                raise QgsProcessingException("ZAF<=4 mask invalid (gdal:rastercalculator).")
-
-            # Werte-Raster: A * Maske (für wZAF)
-            mark("ZAF values A*mask via GDAL rastercalculator")
-            vals_path = os.path.join(temp_folder, f"zaf_vals_le4_{uuid.uuid4().hex}.tif")
-            res_vals = prun("gdal:rastercalculator", {
-                'INPUT_A': rlyr_zaf, 'BAND_A': 1,
-                'INPUT_B': rlyr_zaf_le4_mask, 'BAND_B': 1,
-                'FORMULA': 'A*B',
-                'NO_DATA': -9999, 'RTYPE': 5,
-                'EXTRA': '', 'OUTPUT': vals_path
-            })
-            rlyr_zaf_le4_vals = QgsRasterLayer(res_vals['OUTPUT'], "rlyr_zaf_le4_vals", "gdal")
-            lyrList.append(rlyr_zaf_le4_vals)
-            if not rlyr_zaf_le4_vals.isValid():
-                raise QgsProcessingException("ZAF<=4 values raster invalid (gdal:rastercalculator).")
-
-            # 0 -> NoData (für wZAF-Mittelbildung)
-            mark("Zero->NoData via GDAL rastercalculator")
-            recl_path = os.path.join(temp_folder, f"zaf_le4_nodata_{uuid.uuid4().hex}.tif")
-            res_nodata = prun("gdal:rastercalculator", {
-                'INPUT_A': rlyr_zaf_le4_vals, 'BAND_A': 1,
-                'FORMULA': '((A==0)*(-9999) + (A!=0)*A)',
-                'NO_DATA': -9999, 'RTYPE': 5,
-                'EXTRA': '', 'OUTPUT': recl_path
-            })
-            rlyr_zaf_le4 = QgsRasterLayer(res_nodata['OUTPUT'], "rlyr_zaf_le4", "gdal")
-            lyrList.append(rlyr_zaf_le4)
-
-            # --- ZONALSTATS ---
-            mark("Zonal mean ZAF<=4 and ZAA%")
             # wZAF: Mittel der Werte <=4
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_zaf_le4, 'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg, 'COLUMN_PREFIX': 'zaf_', 'STATS': [2]  # mean
-            })
-            for f in vlyr_tezg.getFeatures():
-                fid = int(f['TEZG_ID_ZK']); m = f['zaf_mean']
+            for fid in fid_list:
+                m = zstats.value(fid, 'zaf', 'mean')
                 if m is not None:
                     dictCsv[fid]['ZAF 1 bis 7'] = str(round(m, 4)).replace('.', ',')
 
             # ZAA[%] = mean(0/1-Maske)*100 -> garantiert in [0,100]
-            prun("qgis:zonalstatistics", {
-                'INPUT_RASTER': rlyr_zaf_le4_mask, 'RASTER_BAND': 1,
-                'INPUT_VECTOR': vlyr_tezg, 'COLUMN_PREFIX': 'zaale4_', 'STATS': [2]  # mean
-            })
-            for f in vlyr_tezg.getFeatures():
-                fid = int(f['TEZG_ID_ZK'])
-                mean_le4 = f['zaale4_mean'] if f['zaale4_mean'] is not None else 0.0
-                zaa_pct = float(mean_le4) * 100.0
+            for fid in fid_list:
+                mean_le4 = zstats.value(fid, 'zaale4', 'mean')
+                zaa_pct = float(mean_le4 if mean_le4 is not None else 0.0) * 100.0
                 # Clamp auf [0, 100] (Numerik-Toleranzen abfangen)
                 if zaa_pct < 0.0:
                     zaa_pct = 0.0
@@ -709,11 +636,17 @@ class ZEMOKOST_GISDaten_RasterOnly(QgsProcessingAlgorithm):
             except Exception:
                 pass
             feedback.pushInfo("\nFINISHED (Raster only) ......................")
+            warnings = []
             if has_small:
-                feedback.pushInfo("Hinweis: Eines oder mehrere Polygone im TEZG sind kleiner als 100 m².")
-
-            # QGIS-konformer Return (FileDestination)
-            return {self.OUTPUT_CSV: outCsv}
+                warnings.append("Hinweis: Eines oder mehrere Polygone im TEZG sind kleiner als 100 m².")
+                feedback.pushWarning(warnings[-1])
+            for problem in row_problems(dictCsv.values()):
+                warnings.append("Hinweis: Knotennetz (K.O./K.U.): " + problem)
+                feedback.pushWarning(warnings[-1])
+
+            # QGIS-konformer Return (FileDestination); Warnungen und Profiling-Bericht für CLI/Batch
+            return {self.OUTPUT_CSV: outCsv, 'WARNINGS': warnings,
+                    'PROFILE': profiler.write(os.path.dirname(outCsv) or '.')}
 
         except Exception as e:
             tb = traceback.format_exc()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests of zemokost_prep.
+
+The tests cover the modules that run without QGIS (runoff simulation and
+its sweeps); run them from the repository root with python -m pytest.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zemokost_prep.runoff import Catchment  # noqa: E402
+
+
+@pytest.fixture
+def catchment():
+    """Three TEZG: two headwaters (1, 2) join at junction 10 and drain through TEZG 3 to the outlet 20."""
+    return Catchment(
+        ids=[1, 2, 3], ko=[0, 0, 10], ku=[10, 10, 20], names=['', '', ''],
+        x=[1000.0, 3000.0, 2000.0], y=[3000.0, 3000.0, 1000.0], area=[0.8, 1.2, 0.5],
+        length=[400.0, 650.0, 300.0], slope=[0.35, 0.25, 0.15], natret=[10.0, np.nan, 0.0],
+        qbasis=[0.02, np.nan, np.nan],
+        akl=[[0, 0, 2000, 5000, 3000, 0, 0], [0, 1000, 4000, 4000, 1000, 0, 0], [0, 0, 0, 6000, 2000, 2000, 0]],
+        rkl=[[0, 3000, 5000, 2000, 0, 0], [0, 0, 6000, 4000, 0, 0], [1000, 4000, 5000, 0, 0, 0]],
+        zaf=[3.0, np.nan, 5.0], anteil=[40.0, 0.0, 25.0], ch_length=[900.0, 1200.0, 1500.0],
+        ch_slope=[0.12, 0.08, 0.04], d90=[0.1, 0.1, 0.1])
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Scalar reference of the runoff simulation for the tests.
+
+Step-by-step transcription of the workbook VBA (ZEMOKOST-2_0_1.xlsm:
+clsAbflTEZG.Simulieren for one sub-catchment, clsAbflKnoten.Summenganglinie
+for the junctions) in plain Python loops, one sub-catchment at a time. It
+uses the model constants of runoff.parameters and is slow; runoff.simulate
+is checked against it on small catchments.
+"""
+import math
+
+import numpy as np
+
+from zemokost_prep.runoff import nat_ret_constant, parameters
+
+
+def simulate_tezg(p, b, intensity, n_rain, i_max, q_ko, q_ko_start, n_steps, dt=1.0):
+    """
+    Hydrograph [m³/s] of sub-catchment b at its lower junction (index 1 to
+    n_steps, index 0 unused) and the runoff volume [m³] it passes on
+    (overland flow plus interflow, without base flow). intensity(i): rain [mm/h] of
+    step i; n_rain: last step with rain; i_max: maximum intensity; q_ko(i):
+    hydrograph of the upper junction (q_ko(i <= 0) = start value).
+    """
+    length, area, width = p['length'][b], p['area'][b], p['width'][b]
+    n_seg = max(int(round(10 * math.log10(length))), 10)
+    dl = length / n_seg
+    cv_max = dl / 180
+    cv_new = cv_max * 0.9
+    c_sim = p['cv_ob'][b] / dl
+    cv_ob = p['cv_ob'][b] / 60
+    c_out = cv_ob * width / dt
+    psi100 = p['psi100'][b]
+    c1 = psi100 * (0.7 + 0.3 * psi100)
+    c2 = 0.1 * math.exp(psi100 * 3.3)
+    c3 = 1 - 0.7 * psi100
+    c4 = 0.0035 * (1 - psi100)
+    flag_if = bool(p['flag_if'][b])
+    q_basis = p['qbasis'][b]
+    if flag_if:
+        n_if = math.ceil(length / (p['v_if'][b] * 60))
+        c_if = 1 / (60 * n_if)
+        c_reg_if = p['anteil'][b] / 60000
+
+    # Linear storage of the overland flow and natural retention with tOB of the maximum intensity
+    if i_max > 0 and psi100 > 0:
+        psi = c1 * (1 - math.exp(-0.03 * math.exp(c2 * i_max ** c3)) + c4 * i_max)
+        t_ob = p['ct_ob'][b] / (psi * i_max) ** (2 / 3)
+        q_ob_max = i_max * psi * area / (60000 * 60)
+        d_lin = 1 - math.exp(-dt / t_ob)
+        d_nr = 1 - math.exp(-dt * nat_ret_constant(q_ob_max, t_ob, p['dq_natret'][b])) \
+            if p['dq_natret'][b] > 0 else 1
+    else:
+        d_lin = d_nr = 1
+
+    h = [0.0] * (n_seg + 1)
+    q_ob = [0.0] * (n_steps + 1)
+    q_if = [0.0] * (n_steps + 1)
+    if_in = [0.0] * (n_steps + 1)
+    q_nr = [0.0] * (n_steps + 1)
+    t0 = n_rain * dt + dt
+    i0 = n_rain + 1
+    started = False
+    raining = n_rain > 0
+    on_slope = True
+    v_eff = v_out = v_end = v_if = 0.0
+    q_max = 0.0
+    reg = 0.0
+    for i in range(1, n_steps + 1):
+        t = (i - 1) * dt
+        t_end = i * dt
+        dt_ob = dt
+        if raining:
+            ir = intensity(i)
+            if ir > 0:
+                psi_ns = min(1, c1 * (1 - math.exp(-0.03 * math.exp(c2 * ir ** c3)) + c4 * ir))
+                if not started and psi_ns > 0:
+                    # Initial abstraction
+                    tp = t + max(0, -7.05 * math.log(psi_ns) + 6.14 + p['szi'][b])
+                    if tp < t0:
+                        t0 = tp
+                        i0 = math.floor(t0 / dt) + 1
+            else:
+                psi_ns = 0
+            if i == i0:
+                started = True
+                t = t0
+                dt_ob = t_end - t
+            if started:
+                reg = psi_ns * ir / 60000
+                v_eff += dt_ob * reg * area
+                if flag_if:
+                    if_in[i] = c_if * dt_ob * c_reg_if * (1 - psi_ns) * ir * area
+                    # The workbook's convolution passes every input on for n_if - 1 steps
+                    v_if += if_in[i] * 60 * (n_if - 1)
+            if i == n_rain:
+                raining = False
+                v_end = 0.9 * v_eff
+        else:
+            reg = 0
+
+        # Interflow: moving sum over the travel time
+        if flag_if and started:
+            if i > 1:
+                q_if[i] = if_in[i - 1] + q_if[i - 1]
+            if i >= n_if:
+                q_if[i] -= if_in[i - n_if]
+
+        # Overland flow: kinematic wave with adaptive sub-steps, then exponential recession
+        if on_slope:
+            more = started
+            while more:
+                dt_ob = t_end - t
+                more = False
+                v = cv_ob * h[n_seg] ** 2
+                if dt_ob * v > cv_max:
+                    dt_ob = cv_new / v
+                    more = True
+                while True:
+                    dr = dt_ob * reg
+                    v = cv_ob * (h[n_seg] + dr) ** 2
+                    if dt_ob * v > cv_max:
+                        dt_ob *= 0.9
+                        more = True
+                    else:
+                        break
+                c = dt_ob * c_sim
+                h3 = h[n_seg] ** 3
+                q_ob[i] += dt_ob * c_out * h3
+                d_in = c * h3
+                for j in range(n_seg, 0, -1):
+                    d_out = d_in
+                    d_in = c * h[j - 1] ** 3
+                    h[j] = max(0, (h[j] + (dr + d_in)) - d_out)
+                t += dt_ob
+            v_out += dt * 60 * q_ob[i]
+            if not raining and v_out > v_end:
+                on_slope = False
+                q_e = q_ob[i]
+                a_e = math.log(1 + 60 * q_e / (v_eff - v_out))
+                q_e = q_e * math.exp(i * a_e)
+        else:
+            q_ob[i] = q_e * math.exp(-a_e * i)
+
+        q_ob[i] = d_lin * q_ob[i] + (1 - d_lin) * q_ob[i - 1] if i > 1 else d_lin * q_ob[1]
+        q_fl = q_ob[i] + q_if[i] + q_basis
+        q_nr[i] = d_nr * q_fl + (1 - d_nr) * (q_nr[i - 1] if i > 1 else q_basis)
+        q_max = max(q_max, (q_nr[i] + q_basis) * 0.5 + q_ko(i))
+
+    # Channel: moving average over the Rickenmann travel time plus the shifted upper junction
+    out = [0.0] * (n_steps + 1)
+    if q_max > 0:
+        v = p['konst_ge'][b] * q_max ** p['exp_rick'][b]
+        n_ge = math.ceil(p['ch_length'][b] / (v * 60) / dt)
+        c_ge = 1 / n_ge
+        parts = {k: c_ge * q_basis for k in range(1 - n_ge, 1)}
+        mean = q_basis
+        for i in range(1, n_steps + 1):
+            parts[i] = c_ge * q_nr[i]
+            mean = mean + parts[i] - parts[i - n_ge]
+            out[i] = mean + q_ko(i - n_ge)
+    return out, v_eff + v_if
+
+
+def simulate_reference(catchment, rain, offset=0, reduction=1.0, szi=0.0, n_steps=1000):
+    """
+    Junction hydrographs {junction: array of n_steps} and the runoff volume
+    [m³] of all sub-catchments for the hyetograph rain, with offset [steps]
+    and reduction per sub-catchment as in runoff.simulate.
+    """
+    p = parameters(catchment, szi=szi)
+    n = len(catchment)
+    rain = list(np.asarray(rain, dtype=np.float64))
+    offset = np.broadcast_to(np.asarray(offset, dtype=np.int64), (n,))
+    reduction = np.broadcast_to(np.asarray(reduction, dtype=np.float64), (n,))
+    graph = catchment.graph
+    q = {int(j): [0.0] * (n_steps + 1) for j in graph.junctions}
+    q_start = {int(j): 0.0 for j in graph.junctions}
+    volume = 0.0
+    for b in graph.order:
+        ko = int(catchment.ko[b])
+        if ko:
+            def q_ko(i, ko=ko):
+                return q[ko][i] if i > 0 else q_start[ko]
+        else:
+            def q_ko(i):
+                return 0.0
+
+        def intensity(i, b=b):
+            k = i - 1 - offset[b]
+            return reduction[b] * rain[k] if 0 <= k < len(rain) else 0.0
+
+        out, v = simulate_tezg(p, b, intensity, int(offset[b]) + len(rain), reduction[b] * max(rain), q_ko,
+                               q_start[ko] if ko else 0.0, n_steps)
+        ku = int(catchment.ku[b])
+        for i in range(1, n_steps + 1):
+            q[ku][i] += out[i]
+        q_start[ku] += (q_start[ko] if ko else 0.0) + p['qbasis'][b]
+        volume += v
+    return {j: np.array(values[1:]) for j, values in q.items()}, volume
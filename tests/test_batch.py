@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import json
+
+from zemokost_prep.batch import META_KEYS, read_manifest
+
+
+def test_manifest_metadata_kept_apart(tmp_path):
+    manifest = tmp_path / 'projects.csv'
+    manifest.write_text('DEM;TEZG;NAME;Project;tool\n'
+                        'd.tif;t.shp;Bezeichnung;Gaisbach;zemokost_rasteronly\n'
+                        'd.tif;t2.shp;;;\n', encoding='utf-8')
+    first, second = read_manifest(str(manifest))
+    assert (first['project'], first['tool']) == ('Gaisbach', 'zemokost_rasteronly')
+    assert (second['project'], second['tool']) == ('project_002', 'zemokost')
+    # The parameters handed to runner.algorithm_parameters keep the NAME field and never contain the metadata
+    assert first['parameters'] == {'DEM': 'd.tif', 'TEZG': 't.shp', 'NAME': 'Bezeichnung'}
+    assert second['parameters'] == {'DEM': 'd.tif', 'TEZG': 't2.shp', 'NAME': ''}
+
+
+def test_json_manifest(tmp_path):
+    manifest = tmp_path / 'projects.json'
+    manifest.write_text(json.dumps({'projects': [{'DEM': 'd.tif', 'project': 'A'}]}), encoding='utf-8')
+    project, = read_manifest(str(manifest))
+    assert project['project'] == 'A'
+    assert not {str(k).lower() for k in project['parameters']} & set(META_KEYS)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from zemokost_prep import cache
+from zemokost_prep.cache import HydroCache
+
+
+def _store(store, key, tmp_path, size=1024):
+    src = tmp_path / (key + '.gpkg')
+    src.write_bytes(b'x' * size)
+    store.put_files(key, {'tezg': str(src)}, '.gpkg')
+
+
+def test_leased_entries_are_not_evicted(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    reader = HydroCache(cache_dir, max_mb=3 / 1024)
+    writer = HydroCache(cache_dir, max_mb=3 / 1024)
+    _store(writer, 'a', tmp_path)
+    paths = reader.get('a', ['tezg'], '.gpkg')
+    _store(writer, 'b', tmp_path)
+    _store(writer, 'c', tmp_path)
+    # 'a' is the least recently used entry, but leased by the reader
+    _store(writer, 'd', tmp_path)
+    assert os.path.isfile(paths['tezg'])
+    assert not os.path.isdir(os.path.join(cache_dir, 'b'))
+
+    reader.release()
+    _store(writer, 'e', tmp_path)
+    assert not os.path.isdir(os.path.join(cache_dir, 'a'))
+    assert reader.get('a', ['tezg'], '.gpkg') is None
+
+
+def test_leases_end_with_the_cache_object_or_expire(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    writer = HydroCache(cache_dir, max_mb=1 / 1024)
+    _store(writer, 'a', tmp_path)
+    reader = HydroCache(cache_dir)
+    assert reader.get('a', ['tezg'], '.gpkg')
+    entry = os.path.join(cache_dir, 'a')
+    assert HydroCache._in_use(entry)
+    del reader
+    assert not HydroCache._in_use(entry)
+
+    # A lease left over by a crashed run expires
+    open(os.path.join(entry, cache._LEASE + 'crashed'), 'w').close()
+    assert HydroCache._in_use(entry)
+    monkeypatch.setattr(time, 'time', lambda: os.path.getmtime(entry) + cache.LEASE_SECONDS + 1)
+    assert not HydroCache._in_use(entry)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from zemokost_prep.dag import TaskGraph
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_local_tasks_run_in_calling_thread(workers):
+    caller = threading.get_ident()
+    graph = TaskGraph()
+    graph.add('a', lambda: threading.get_ident())
+    graph.add('b', lambda: threading.get_ident(), local=True)
+    graph.add('c', lambda a, b: (a, b, threading.get_ident()), requires=['a', 'b'], local=True)
+    graph.add('d', lambda c: threading.get_ident(), requires=['c'])
+    results = graph.run(workers)
+    assert results['b'] == caller and results['c'][2] == caller
+    assert results['c'][:2] == (results['a'], results['b'])
+    assert (results['a'] != caller and results['d'] != caller) == (workers > 1)
+    assert set(graph.timings) == {'a', 'b', 'c', 'd'}
+
+
+def test_local_task_overlaps_pool():
+    started = threading.Event()
+    graph = TaskGraph()
+    graph.add('pool', lambda: started.set() or 'pool')
+    graph.add('local', lambda: started.wait(5), local=True)
+    assert graph.run(2) == {'pool': 'pool', 'local': True}
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from zemokost_prep.design import design_sweep
+from zemokost_prep.rainfall import UWSeries
+from zemokost_prep.runoff import simulate
+
+SERIES = UWSeries.from_p([15, 30, 60, 120], [12.0, 16.0, 20.0, 25.0], [35.0, 48.0, 62.0, 78.0])
+
+
+def test_sweep_equals_single_simulations(catchment):
+    durations, return_periods = [15, 30, 60], [30, 100]
+    result = design_sweep(catchment, SERIES, durations, return_periods, n_steps=900, batch_size=2)
+    for t, return_period in enumerate(return_periods):
+        for d, duration in enumerate(durations):
+            single = simulate(catchment, SERIES.hyetograph('block rainfall', return_period, duration), n_steps=900)
+            np.testing.assert_allclose(result.peak[t, d], single.peak, rtol=1e-12)
+            np.testing.assert_allclose(result.volume[t, d], single.volume, rtol=1e-12)
+            np.testing.assert_array_equal(result.t_peak[t, d], single.t_peak)
+
+
+def test_critical_duration(catchment):
+    result = design_sweep(catchment, SERIES, [15, 30, 60, 120], [100], n_steps=900)
+    expected = result.durations[np.argmax(result.peak, axis=1)]
+    np.testing.assert_array_equal(result.critical, expected)
+    assert sum(row['critical'] for row in result.rows()) == len(result.junctions)
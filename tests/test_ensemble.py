@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from zemokost_prep.ensemble import StreamingQuantiles, perturb, run_ensemble
+from zemokost_prep.rainfall import design_rain
+
+
+def test_perturb_keeps_anteil_without_zaf(catchment):
+    # Anteil 0 and empty ZAF, as the raster tool writes TEZG without interflow
+    dry = catchment.copy(zaf=np.full(3, np.nan), anteil=np.zeros(3))
+    varied = perturb(dry, np.random.default_rng(1), 50)
+    assert (varied.anteil == 0).all()
+    assert np.isnan(varied.zaf).all()
+
+    varied = perturb(catchment, np.random.default_rng(1), 50)
+    assert (varied.anteil[:, 1] == 0).all()
+    assert np.ptp(varied.anteil[:, 0]) > 0 and np.ptp(varied.anteil[:, 2]) > 0
+
+
+def test_ensemble_without_interflow(catchment):
+    dry = catchment.copy(zaf=np.full(3, np.nan), anteil=np.zeros(3))
+    result = run_ensemble(dry, design_rain('block rainfall', 60.0, 30), 20, seed=1, n_steps=600)
+    assert result.realisations == 20
+    assert np.isfinite(result.mean).all() and (result.mean > 0).all()
+
+
+def test_reproducible_and_ordered(catchment):
+    rain = design_rain('block rainfall', 60.0, 30)
+    first = run_ensemble(catchment, rain, 30, seed=7, n_steps=600, batch_size=10)
+    second = run_ensemble(catchment, rain, 30, seed=7, n_steps=600, batch_size=10)
+    np.testing.assert_array_equal(first.quantiles, second.quantiles)
+    assert (first.min <= first.quantiles).all() and (first.quantiles <= first.max).all()
+
+
+def test_streaming_quantiles():
+    values = np.random.default_rng(3).lognormal(0.0, 0.5, size=(4000, 2))
+    stats = StreamingQuantiles((0.1, 0.5, 0.9), 2)
+    stats.add(values)
+    np.testing.assert_allclose(stats.quantiles(), np.quantile(values, (0.1, 0.5, 0.9), axis=0), rtol=0.02)
+    np.testing.assert_allclose(stats.mean, values.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.std, values.std(axis=0, ddof=1), rtol=1e-9)
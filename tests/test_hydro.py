@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from zemokost_prep.hydro import (FLAT_INCREMENT, d8_receivers, downslope_distance, fill_depressions,
+                                 flow_accumulation, hydrology)
+
+
+def _terrain(rows=12, cols=10, seed=5):
+    """Plane falling to the south with noise, two pits and a flat, NoData in one corner."""
+    rng = np.random.default_rng(seed)
+    dem = np.arange(rows, 0, -1, dtype=np.float64)[:, None] + 0.3 * rng.random((rows, cols))
+    dem[4, 3] -= 5.0
+    dem[7, 6] -= 3.0
+    dem[2:4, 6:9] = 8.0
+    dem[0:2, 0:2] = np.nan
+    return dem
+
+
+def test_fill_depressions():
+    dem = _terrain()
+    filled = fill_depressions(dem)
+    valid = ~np.isnan(dem)
+    np.testing.assert_array_equal(np.isnan(filled), ~valid)
+    assert (filled[valid] >= dem[valid]).all()
+    # The pits are raised above their lowest neighbour
+    for r, c in ((4, 3), (7, 6)):
+        neighbours = np.delete(dem[r - 1:r + 2, c - 1:c + 2].ravel(), 4)
+        assert filled[r, c] > neighbours.min() > dem[r, c]
+
+
+def test_strict_drainage_after_flat_increment():
+    filled = fill_depressions(_terrain())
+    receiver, step = d8_receivers(filled, 5.0)
+    flat = filled.ravel()
+    valid = np.flatnonzero(~np.isnan(flat))
+    drains = receiver[valid] >= 0
+    # Every cell drains to a strictly lower neighbour, except the outlets on the edge or next to NoData
+    assert (flat[receiver[valid[drains]]] < flat[valid[drains]]).all()
+    assert (flat[valid[drains]] - flat[receiver[valid[drains]]] >= FLAT_INCREMENT * 0.5).all()
+    rows, cols = filled.shape
+    r, c = np.divmod(valid[~drains], cols)
+    padded = np.pad(np.isnan(filled), 1, constant_values=True)
+    edge = np.array([padded[i:i + 3, j:j + 3].any() for i, j in zip(r, c)])
+    assert edge.all()
+    assert set(np.round(step[valid[drains]], 6)) <= {5.0, round(5.0 * np.sqrt(2), 6)}
+
+
+def test_accumulation_sums_to_cells_at_outlets():
+    filled = fill_depressions(_terrain())
+    receiver, _ = d8_receivers(filled, 5.0)
+    facc = flow_accumulation(filled, receiver)
+    valid = ~np.isnan(filled)
+    outlets = valid.ravel() & (receiver < 0)
+    assert facc.ravel()[outlets].sum() == valid.sum()
+    assert np.isnan(facc[~valid]).all() and (facc[valid] >= 1).all()
+
+
+def test_downslope_distance():
+    # Plane falling to the south: flow runs straight down the columns
+    dem = np.repeat(np.arange(8, 0, -1, dtype=np.float64)[:, None], 5, axis=1)
+    streams = np.zeros(dem.shape, dtype=bool)
+    streams[5:, 2] = True
+    filled = fill_depressions(dem)
+    receiver, step = d8_receivers(filled, 10.0)
+    dist = downslope_distance(filled, receiver, step, streams)
+    assert (dist[streams] == 0).all()
+    np.testing.assert_allclose(dist[:5, 2], [50.0, 40.0, 30.0, 20.0, 10.0])
+    # Columns without a stream leave the grid without reaching one
+    assert np.isnan(dist[:, [0, 1, 3, 4]]).all()
+
+    result = hydrology(dem, streams, 10.0)
+    np.testing.assert_array_equal(result['flen'], dist)
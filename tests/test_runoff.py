@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from reference import simulate_reference
+from zemokost_prep.rainfall import design_rain
+from zemokost_prep.routing import RoutingGraph, network_problems, parse_junction
+from zemokost_prep.runoff import Catchment, simulate
+
+
+def _tree(catchment, n, seed=1):
+    """Random tree of n TEZG with the values of the fixture repeated."""
+    rng = np.random.default_rng(seed)
+    parent = [-1] + [int(rng.integers(0, i)) for i in range(1, n)]
+    ids = np.arange(1, n + 1)
+    ku = [10 * ids[parent[i]] if i else 10 * (n + 1) for i in range(n)]
+    ko = [10 * ids[i] if i in parent else 0 for i in range(n)]
+    pick = np.arange(n) % len(catchment)
+    scale = 1 + 0.3 * rng.random(n)
+    values = {}
+    for field in Catchment.FIELDS:
+        value = getattr(catchment, field)[pick]
+        values[field] = value * scale if value.ndim == 1 else value
+    return Catchment(ids, ko, ku, **values)
+
+
+def test_matches_scalar_reference(catchment):
+    tree = _tree(catchment, 7)
+    rain = design_rain('triangular (middle acc.)', 60.0, 45)
+    offset = np.arange(7) % 3 * 4
+    reduction = np.linspace(1.0, 0.7, 7)
+    result = simulate(tree, rain, offset=offset, reduction=reduction, szi=2.0, n_steps=900)
+    expected, _ = simulate_reference(tree, rain, offset, reduction, szi=2.0, n_steps=900)
+    q = np.array([expected[int(j)] for j in result.junctions])
+    assert np.abs(result.q - q).max() <= 1e-9 * q.max()
+
+
+def test_mass_balance(catchment):
+    # Without base flow the outlet passes the runoff volume of all TEZG once the hydrographs have receded
+    # (short, steep slopes with high AKL and fast interflow recede within the simulation)
+    akl = np.zeros((3, 7))
+    akl[:, 5:] = 1
+    steep = catchment.copy(akl=akl, length=np.full(3, 100.0), slope=np.full(3, 0.8), qbasis=np.full(3, np.nan),
+                           zaf=np.array([2.0, np.nan, 2.0]))
+    rain = design_rain('block rainfall', 40.0, 30)
+    result = simulate(steep, rain, n_steps=4000)
+    _, volume = simulate_reference(steep, rain, n_steps=4000)
+    assert result.peaks()[int(steep.graph.outlet)][2] == pytest.approx(volume, rel=1e-6)
+    assert volume < rain.sum() / 60 * steep.area.sum() * 1e3
+
+
+def test_batch_equals_single(catchment):
+    rains = [design_rain('block rainfall', 60.0, 30), design_rain('block rainfall', 30.0, 30)]
+    batch = simulate(catchment, np.array(rains)[:, None, :], n_steps=600)
+    for k, rain in enumerate(rains):
+        single = simulate(catchment, rain, n_steps=600)
+        np.testing.assert_allclose(batch.q[k], single.q, rtol=1e-12, atol=0)
+        np.testing.assert_array_equal(batch.t_peak[k], single.t_peak)
+
+
+def test_routing_graph_levels():
+    graph = RoutingGraph([1, 2, 3, 4], [0, 0, 10, 0], [10, 10, 30, 30])
+    assert graph.outlet == 30
+    assert list(graph.level) == [1, 1, 0, 0]
+    assert [list(tezg) for tezg, _, _ in graph.levels] == [[0, 1], [2, 3]]
+
+
+@pytest.mark.parametrize('ko, ku, message', [
+    ([0, 5, 6], [5, 6, 5], 'Schleife im Knotennetz: 5 -> 6 -> 5 (TEZG 2, 3).'),
+    ([0, 0], [5, 6], 'Mehrere Auslassknoten: 5 (TEZG 1); 6 (TEZG 2).'),
+    ([0, 7], [5, 9], 'Knoten 7 (K.O. von TEZG 2) hat kein zufließendes TEZG.'),
+    ([0, 5, 5, 0], [5, 6, 7, 5], 'Knoten 5 ist K.O. mehrerer TEZG (2, 3); jeder Knoten darf nur über ein TEZG '
+                                 'abfließen.'),
+    ([0, 6], [5, 6], 'TEZG 2: K.O. und K.U. sind derselbe Knoten.'),
+])
+def test_network_problems(ko, ku, message):
+    ids = np.arange(1, len(ko) + 1)
+    assert message in network_problems(ids, ko, ku)
+    with pytest.raises(ValueError, match='K.O./K.U.: '):
+        RoutingGraph(ids, ko, ku)
+
+
+def test_parse_junction():
+    assert parse_junction('10,0') == 10
+    with pytest.raises(ValueError, match="Knotennummer muss eine ganze Zahl sein: '10,5'."):
+        parse_junction('10,5')
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from zemokost_prep.rainfall import design_rain
+from zemokost_prep.runoff import simulate
+from zemokost_prep.storm import centre_grid, storm_scenarios, storm_sweep
+
+
+def test_scenarios(catchment):
+    centres = centre_grid(catchment, 2)
+    table, reduction, offset = storm_scenarios(catchment, 45, centres, directions=(0, 90), speeds=(20, 40))
+    assert table.shape == (16, 4) and reduction.shape == offset.shape == (16, 3)
+    assert (offset.min(axis=1) == 0).all()
+    # Moving north at 20 km/h: TEZG 3 (2 km south of TEZG 1 and 2) is reached first, the others 6 min later
+    first = np.flatnonzero((table[:, 2] == 0) & (table[:, 3] == 20))[0]
+    np.testing.assert_allclose(offset[first], [6.0, 6.0, 0.0])
+
+
+def test_sweep_equals_single_simulations(catchment):
+    rain = design_rain('block rainfall', 60.0, 45)
+    result = storm_sweep(catchment, rain, 45, centre_grid(catchment, 2), directions=(0, 180), speeds=(30,),
+                         n_steps=900, batch_size=3)
+    _, reduction, offset = storm_scenarios(catchment, 45, centre_grid(catchment, 2), (0, 180), (30,))
+    for s in range(len(result.scenarios)):
+        single = simulate(catchment, rain, offset=offset[s], reduction=reduction[s], n_steps=900)
+        np.testing.assert_allclose(result.peak[s], single.peak, rtol=1e-12)
+    worst = result.worst()
+    for k, junction in enumerate(result.junctions):
+        assert worst[int(junction)][0] == result.peak[:, k].max()
+
+
+def test_missing_xy(catchment):
+    with pytest.raises(ValueError, match='TEZG 2: X/Y fehlen'):
+        centre_grid(catchment.copy(x=np.array([1000.0, np.nan, 2000.0])), 3)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from zemokost_prep.wbt import WbtChain
+
+pytestmark = pytest.mark.skipif(os.name == 'nt', reason='stand-in binary is a POSIX script')
+
+# Stand-in for the WBT binary: writes its command line to --output, fails for --run=Fail
+FAKE_WBT = '''#!{}
+import sys
+args = sys.argv[1:]
+if '--run=Fail' in args:
+    print('Error: tool failed')
+    sys.exit(1)
+output = [a.split('=', 1)[1].strip("'") for a in args if a.startswith('--output=')][0]
+with open(output, 'w') as f:
+    f.write(' '.join(args))
+'''
+
+
+@pytest.fixture
+def wbt(tmp_path):
+    exe = tmp_path / 'whitebox_tools'
+    exe.write_text(FAKE_WBT.format(sys.executable))
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    return SimpleNamespace(exe_path=str(tmp_path), exe_name='whitebox_tools')
+
+
+def test_chain_passes_settings_per_call(wbt, tmp_path):
+    cwd = os.getcwd()
+    out = tmp_path / 'filled.tif'
+    chain = WbtChain(wbt, num_threads=3)
+    chain.add('fill_depressions_wang_and_liu', dem='dem.tif', output=str(out), fix_flats=True, flat_increment=None)
+    assert [tool for tool, _ in chain.run()] == ['fill_depressions_wang_and_liu']
+    args = out.read_text().split()
+    assert args[0] == '--run=FillDepressionsWangAndLiu'
+    assert "--dem='dem.tif'" in args and '--fix_flats' in args
+    assert '--max_procs=3' in args and '--compress_rasters=true' in args
+    assert not any(arg.startswith('--flat_increment') for arg in args)
+    assert os.getcwd() == cwd
+
+
+def test_chains_run_concurrently(wbt, tmp_path):
+    def run(k):
+        out = tmp_path / 'flen_{}.tif'.format(k)
+        WbtChain(wbt, num_threads=k + 1, compress=False).add('d8_flow_accumulation', output=str(out)).run()
+        return out.read_text().split()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(run, range(8)))
+    for k, args in enumerate(results):
+        assert '--max_procs={}'.format(k + 1) in args and '--compress_rasters=false' in args
+
+
+def test_failed_tool_raises(wbt, tmp_path):
+    chain = WbtChain(wbt).add('fail', output=str(tmp_path / 'x.tif'))
+    with pytest.raises(ValueError, match='WhiteboxTools fail fehlgeschlagen:\nError: tool failed'):
+        chain.run()
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Helper package for the WLV pyQGIS ZEMOKOST preparation scripts.
+
+The package is copied next to the scripts into the QGIS processing scripts
+folder (like the WBT folder) and imported from there by
+WLV_pyqgis_ZEMOKOST.py and WLV_pyqgis_raster_ZEMOKOST.py.
+"""
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from zemokost_prep.cli import main
+
+raise SystemExit(main())
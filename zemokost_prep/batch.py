@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Batch mode: prepares many catchment projects in one invocation.
+
+The manifest (CSV with ';' or ',' delimiter, or JSON) lists one project per
+row/object. Keys are the parameter names of the algorithm (DEM, TEZG,
+TEZG_ID, KNTO, KNTU, NAME, CHANNEL_MAIN, CHANNEL_HIGHRES, DISCHARGE_COEFF,
+DISCHARGE_COEFF_VAL, ROUGHNESS_COEFF, ROUGHNESS_COEFF_VAL, INTERFLOW,
+INTERFLOW_FACTOR, INTERFLOW_PROP, PROJECTPATH, KEEPDATA, or AKL_RASTER,
+RKL_RASTER, ZAF_RASTER, OUTPUT_CSV for the raster tool), plus the optional
+keys 'project' (label) and 'tool' (zemokost | zemokost_rasteronly). These
+two are batch metadata and are kept apart from the algorithm parameters, so
+they cannot collide with a parameter name (e.g. NAME, the TEZG name field).
+Empty values are treated as not set.
+
+Every project runs in a worker process of a process pool with its own
+temporary folder. A status/timing summary is written at the end.
+
+    python -m zemokost_prep batch manifest.csv --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from zemokost_prep import qgis_env
+
+# Manifest keys that are no algorithm parameters (case-insensitive)
+META_KEYS = ('project', 'tool')
+
+SUMMARY_FIELDS = ['project', 'tool', 'status', 'seconds', 'output', 'warnings', 'error']
+
+
+def read_manifest(path):
+    """
+    Returns the projects of a CSV or JSON manifest as list of dicts
+    {'project': label, 'tool': algorithm, 'parameters': {key: value}}.
+    """
+    with open(path, encoding='utf-8-sig') as f:
+        if path.lower().endswith('.json'):
+            data = json.load(f)
+            projects = data['projects'] if isinstance(data, dict) else data
+        else:
+            sample = f.read(4096)
+            f.seek(0)
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,')
+            projects = list(csv.DictReader(f, dialect=dialect))
+
+    result = []
+    for n, row in enumerate(projects, start=1):
+        meta = {str(k).lower(): v for k, v in row.items() if str(k).lower() in META_KEYS}
+        result.append({'project': meta.get('project') or 'project_{:03d}'.format(n),
+                       'tool': meta.get('tool') or 'zemokost',
+                       'parameters': {k: v for k, v in row.items() if str(k).lower() not in META_KEYS}})
+    return result
+
+
+def _init_worker(script_dir, wbt_dir):
+    qgis_env.add_script_paths(script_dir, wbt_dir)
+    qgis_env.start_qgis()
+
+
+def run_project(project):
+    """
+    Runs one project in the current (QGIS-initialised) process with its own
+    temporary folder and returns its summary row.
+    """
+    from zemokost_prep import runner  # needs QGIS (qgis_env.start_qgis in the worker)
+
+    temp_folder = tempfile.mkdtemp(prefix='zemokost_{}_'.format(project['project']))
+    try:
+        report = runner.run_algorithm(project['tool'], project['parameters'], temp_folder)
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    return {'project': project['project'], 'tool': project['tool'], 'status': report['status'],
+            'seconds': report['seconds'], 'output': runner.output_path(report),
+            'warnings': ' | '.join(report['warnings']), 'error': ' | '.join(report['errors'])}
+
+
+def write_summary(rows, path):
+    """Writes the per-project summary as CSV (';') and, next to it, as JSON."""
+    with open(path, mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, delimiter=';', fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    with open(os.path.splitext(path)[0] + '.json', mode='w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+
+
+def run_batch(projects, workers=1, summary=None, script_dir=None, wbt_dir=None):
+    """Runs all projects in a pool of workers processes; returns the summary rows in manifest order."""
+    rows = [None] * len(projects)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(script_dir, wbt_dir)) as pool:
+        futures = {pool.submit(run_project, project): n for n, project in enumerate(projects)}
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                rows[n] = future.result()
+            except Exception as e:  # worker crashed
+                rows[n] = {'project': projects[n]['project'], 'tool': projects[n]['tool'],
+                           'status': 'failed', 'seconds': '', 'output': '', 'warnings': '',
+                           'error': '{}: {}'.format(type(e).__name__, e)}
+            print('[{}] {} ({} s)'.format(rows[n]['status'], rows[n]['project'], rows[n]['seconds']), flush=True)
+    if summary:
+        write_summary(rows, summary)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ZEMOKOST Aufbereitung - Batchmodus')
+    parser.add_argument('manifest', help='Projektliste (CSV oder JSON)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Anzahl paralleler Worker-Prozesse')
+    parser.add_argument('--summary', default=None,
+                        help='Zusammenfassung (CSV); Standard: batch_summary.csv neben dem Manifest')
+    parser.add_argument('--script-dir', default=None, help='Ordner mit den WLV_pyqgis_*-Skripten')
+    parser.add_argument('--wbt-dir', default=None, help='Ordner, der das WBT-Paket enthält')
+    args = parser.parse_args(argv)
+
+    summary = args.summary or os.path.join(os.path.dirname(os.path.abspath(args.manifest)), 'batch_summary.csv')
+    rows = run_batch(read_manifest(args.manifest), args.workers, summary, args.script_dir, args.wbt_dir)
+    return 0 if all(row['status'] == 'ok' for row in rows) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the preparation tools.
+
+Every scenario is a synthetic catchment (zemokost_prep.synthetic) of a given
+number of sub-basins and DEM cells. Both algorithms are run on it with
+PROFILE enabled, each run in a fresh worker process (so that peak memory is
+per run). Results (total and per-stage wall time, peak memory) are written
+to benchmark_results.csv/.json in the work folder, can be stored as
+baseline and compared against a stored baseline; runs slower or larger than
+baseline * (1 + tolerance) are reported as regression.
+
+    python -m zemokost_prep bench --scenarios xs,s --work-dir bench/ --save-baseline baseline.json
+    python -m zemokost_prep bench --scenarios xs,s --work-dir bench/ --baseline baseline.json
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from zemokost_prep import qgis_env
+from zemokost_prep.profiling import PROFILE_FILE
+
+# name: (sub-basins, DEM cells)
+SCENARIOS = {
+    'xs': (10, 10 ** 5),
+    's': (30, 10 ** 6),
+    'm': (100, 10 ** 7),
+    'l': (300, 10 ** 8),
+}
+
+RESULT_FIELDS = ['scenario', 'algorithm', 'basins', 'cells', 'status', 'seconds', 'peak_rss_mb',
+                 'peak_rss_children_mb', 'baseline_seconds', 'baseline_peak_rss_mb', 'verdict']
+
+RESULTS_FILE = 'benchmark_results'
+
+DEFAULT_TOLERANCE = 0.25
+
+
+def _init_worker(script_dir, wbt_dir):
+    qgis_env.add_script_paths(script_dir, wbt_dir)
+    qgis_env.start_qgis()
+
+
+def _run(algorithm, values, profile_path):
+    """Runs one benchmark in the worker process; returns the run report plus the profile."""
+    from zemokost_prep import runner
+
+    if os.path.isfile(profile_path):
+        os.remove(profile_path)
+    report = runner.run_algorithm(algorithm, values)
+    if os.path.isfile(profile_path):
+        with open(profile_path, encoding='utf-8') as f:
+            report['profile'] = json.load(f)
+    return report
+
+
+def run_once(algorithm, inputs, out_dir, script_dir=None, wbt_dir=None):
+    """Runs algorithm on the scenario inputs in a fresh process; returns the run report."""
+    os.makedirs(out_dir, exist_ok=True)
+    values = dict(inputs, PROFILE=True)
+    if algorithm == 'zemokost_rasteronly':
+        values['OUTPUT_CSV'] = os.path.join(out_dir, 'import_zemokost.csv')
+    else:
+        values['PROJECTPATH'] = out_dir
+    profile_path = os.path.join(out_dir, PROFILE_FILE + '.json')
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(script_dir, wbt_dir)) as pool:
+        return pool.submit(_run, algorithm, values, profile_path).result()
+
+
+def run_benchmark(scenarios, algorithms, work_dir, repeat=1, seed=0, cellsize=5.0, script_dir=None, wbt_dir=None):
+    """
+    Runs all scenarios x algorithms repeat times. Returns one result per
+    scenario and algorithm with the median wall time and the maximum peak
+    memory over the repetitions and the median wall time per stage.
+    """
+    from zemokost_prep.synthetic import make_catchment
+
+    results = []
+    for scenario in scenarios:
+        basins, cells = SCENARIOS[scenario]
+        print('[{}] generating synthetic catchment ({} TEZG, {} cells)'.format(scenario, basins, cells), flush=True)
+        inputs = make_catchment(os.path.join(work_dir, 'data', '{}_seed{}'.format(scenario, seed)), basins, cells,
+                                cellsize=cellsize, seed=seed)
+        for algorithm in algorithms:
+            reports = []
+            for n in range(repeat):
+                out_dir = os.path.join(work_dir, 'runs', scenario, algorithm)
+                reports.append(run_once(algorithm, inputs[algorithm], out_dir, script_dir, wbt_dir))
+                print('[{}] {} run {}/{}: {} ({} s)'.format(scenario, algorithm, n + 1, repeat,
+                                                           reports[-1]['status'], reports[-1]['seconds']), flush=True)
+            results.append(_aggregate(scenario, algorithm, basins, cells, reports))
+    return results
+
+
+def _aggregate(scenario, algorithm, basins, cells, reports):
+    profiles = [r['profile'] for r in reports if r.get('profile')]
+    stages = {}
+    for profile in profiles:
+        for stage in profile['stages']:
+            stages.setdefault(stage['stage'], []).append(stage['wall_s'])
+
+    def peak(key):
+        values = [s[key] for p in profiles for s in p['stages'] if s.get(key) is not None]
+        return max(values) if values else None
+
+    ok = [r for r in reports if r['status'] == 'ok']
+    return {
+        'scenario': scenario, 'algorithm': algorithm, 'basins': basins, 'cells': cells,
+        'status': 'ok' if len(ok) == len(reports) else 'failed',
+        'seconds': round(statistics.median(r['seconds'] for r in ok), 1) if ok else None,
+        'peak_rss_mb': peak('peak_rss_mb'),
+        'peak_rss_children_mb': peak('peak_rss_children_mb'),
+        'stages': {name: round(statistics.median(values), 3) for name, values in stages.items()},
+        'errors': [e for r in reports for e in r['errors']],
+    }
+
+
+def machine_info():
+    try:
+        from osgeo import gdal
+        gdal_version = gdal.__version__
+    except ImportError:
+        gdal_version = None
+    return {'platform': platform.platform(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'python': platform.python_version(), 'gdal': gdal_version}
+
+
+def save_baseline(results, path):
+    with open(path, mode='w', encoding='utf-8') as f:
+        json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'machine': machine_info(), 'results': results},
+                  f, indent=1, ensure_ascii=False)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    return {(r['scenario'], r['algorithm']): r for r in baseline['results']}
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Adds baseline values and a verdict ('ok', 'regression', 'faster',
+    'failed', 'no baseline') to every result. Regressions in single stages
+    are listed in result['stage_regressions'].
+    """
+    for result in results:
+        base = baseline.get((result['scenario'], result['algorithm']))
+        result['baseline_seconds'] = base['seconds'] if base else None
+        result['baseline_peak_rss_mb'] = base['peak_rss_mb'] if base else None
+        if result['status'] != 'ok':
+            result['verdict'] = 'failed'
+            continue
+        if not base or not base.get('seconds'):
+            result['verdict'] = 'no baseline'
+            continue
+        slower = result['seconds'] > base['seconds'] * (1 + tolerance)
+        larger = bool(result['peak_rss_mb'] and base.get('peak_rss_mb')
+                      and result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance))
+        result['stage_regressions'] = sorted(
+            name for name, seconds in result['stages'].items()
+            if base['stages'].get(name) and seconds > max(base['stages'][name] * (1 + tolerance),
+                                                          base['stages'][name] + 1.0))
+        if slower or larger:
+            result['verdict'] = 'regression'
+        elif result['seconds'] < base['seconds'] * (1 - tolerance):
+            result['verdict'] = 'faster'
+        else:
+            result['verdict'] = 'ok'
+    return results
+
+
+def write_results(results, work_dir):
+    """Writes benchmark_results.csv (';') and benchmark_results.json to work_dir."""
+    with open(os.path.join(work_dir, RESULTS_FILE + '.csv'), mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, delimiter=';', fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+    with open(os.path.join(work_dir, RESULTS_FILE + '.json'), mode='w', encoding='utf-8') as f:
+        json.dump({'machine': machine_info(), 'results': results}, f, indent=1, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ZEMOKOST Aufbereitung - Benchmark mit synthetischen Einzugsgebieten')
+    parser.add_argument('--scenarios', default='xs,s',
+                        help='Szenarien, kommagetrennt ({})'.format(', '.join(
+                            '{}: {} TEZG/{:.0e} Zellen'.format(k, *v) for k, v in SCENARIOS.items())))
+    parser.add_argument('--algorithms', default=','.join(qgis_env.ALGORITHMS), help='Algorithmen, kommagetrennt')
+    parser.add_argument('--work-dir', default='zemokost_benchmark', help='Arbeitsordner (Daten, Läufe, Ergebnisse)')
+    parser.add_argument('--repeat', type=int, default=1, help='Wiederholungen je Szenario (Median)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed der synthetischen Daten')
+    parser.add_argument('--cellsize', type=float, default=5.0, help='Zellgröße des synthetischen DHM [m]')
+    parser.add_argument('--baseline', default=None, help='Baseline (JSON) zum Vergleich')
+    parser.add_argument('--save-baseline', default=None, help='Ergebnisse als Baseline (JSON) speichern')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Zulässige Verschlechterung gegenüber der Baseline (Anteil, z.B. 0.25)')
+    parser.add_argument('--script-dir', default=None, help='Ordner mit den WLV_pyqgis_*-Skripten')
+    parser.add_argument('--wbt-dir', default=None, help='Ordner, der das WBT-Paket enthält')
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    algorithms = [a.strip() for a in args.algorithms.split(',') if a.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error('Unbekanntes Szenario: {}'.format(name))
+    for name in algorithms:
+        if name not in qgis_env.ALGORITHMS:
+            parser.error('Unbekannter Algorithmus: {}'.format(name))
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = run_benchmark(scenarios, algorithms, args.work_dir, args.repeat, args.seed, args.cellsize,
+                            args.script_dir, args.wbt_dir)
+    if args.baseline:
+        compare(results, load_baseline(args.baseline), args.tolerance)
+    write_results(results, args.work_dir)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+
+    for r in results:
+        print('{:<3} {:<20} {:>8} s {:>8} MB  {}'.format(r['scenario'], r['algorithm'], r['seconds'], r['peak_rss_mb'],
+                                                        r.get('verdict', '')), flush=True)
+    failed = any(r['status'] != 'ok' or r.get('verdict') == 'regression' for r in results)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache for the DEM hydrology chain.
+
+The filled DEM and the D8 flow accumulation (ridges: 1..2 cells) depend only on
+the clipped DEM (i.e. DEM and TEZG outline) and the tool parameters. They are
+stored under a key derived from the clipped DEM pixels, its georeferencing and
+the parameters, so re-runs with unchanged DEM/TEZG skip the WBT chain even if
+AKL/RKL, interflow or the channel network changed.
+
+Entries are folders <cache_dir>/<key>/ with one GeoTIFF per raster. The cache
+size is bounded; least recently used entries are evicted first. The same
+folder also holds the reprojected TEZG layers (put_files(), see
+zemokost_prep.reproject).
+
+Several processes (batch workers, QGIS sessions) may share the folder. get()
+leaves a lease file in the entry, which is removed by release() or when the
+HydroCache object is garbage collected (end of the run); eviction skips
+entries with a lease younger than LEASE_SECONDS (older leases are left over
+by crashed runs). An entry is renamed before it is deleted and checked for
+leases again, so a reader either holds a lease on the entry or misses it.
+GDAL is only imported by raster_digest() and put().
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import weakref
+
+# Rasters of the hydrology chain stored per entry
+HYDRO_RASTERS = ('filled', 'facc')
+
+# Parameters of the hydrology chain (part of the key; bump 'version' when the chain changes)
+HYDRO_PARAMS = {
+    'version': 1,
+    'fill_depressions_wang_and_liu': {'fix_flats': True, 'flat_increment': None},
+    'd8_flow_accumulation': {'out_type': 'cells'},
+    'ridges': {'facc': [1, 2]},
+}
+
+DEFAULT_MAX_MB = 2048
+
+_USED = '.used'
+_LEASE = '.lease-'
+
+# Leases older than this are considered stale (crashed run)
+LEASE_SECONDS = 24 * 3600
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    del paths[:]
+
+
+def raster_digest(src, params=None, band=1):
+    """SHA-256 over the pixels, size, geotransform, CRS and NoData of a raster band plus params."""
+    from osgeo import gdal
+
+    ds = gdal.Open(str(src))
+    if ds is None:
+        raise ValueError('Raster konnte nicht geöffnet werden: {}'.format(src))
+    rb = ds.GetRasterBand(band)
+    h = hashlib.sha256()
+    h.update(json.dumps({
+        'size': [ds.RasterXSize, ds.RasterYSize],
+        'geotransform': list(ds.GetGeoTransform()),
+        'projection': ds.GetProjection(),
+        'nodata': rb.GetNoDataValue(),
+        'type': rb.DataType,
+        'params': params,
+    }, sort_keys=True, default=str).encode('utf-8'))
+    rows = max(1, (1 << 22) // max(ds.RasterXSize, 1))
+    for y0 in range(0, ds.RasterYSize, rows):
+        h.update(rb.ReadRaster(0, y0, ds.RasterXSize, min(rows, ds.RasterYSize - y0)))
+    return h.hexdigest()
+
+
+class HydroCache:
+    """Size-bounded (LRU) cache of raster sets in cache_dir."""
+
+    def __init__(self, cache_dir, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lease_name = _LEASE + uuid.uuid4().hex
+        self._leases = []
+        weakref.finalize(self, _remove_files, self._leases)
+
+    def key(self, dem, params=HYDRO_PARAMS):
+        return raster_digest(dem, params)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, names=HYDRO_RASTERS, suffix='.tif'):
+        """
+        Returns {name: path} if all files of the entry exist, else None. Marks
+        the entry as used and leases it until release().
+        """
+        entry = self._entry(key)
+        paths = {name: os.path.join(entry, name + suffix) for name in names}
+        # Lease first, then check: an entry being evicted is either seen with the lease or not found
+        lease = os.path.join(entry, self._lease_name)
+        try:
+            with open(lease, 'w'):
+                pass
+        except OSError:
+            return None
+        if lease not in self._leases:
+            self._leases.append(lease)
+        if not all(os.path.isfile(p) for p in paths.values()):
+            return None
+        self._touch(entry)
+        return paths
+
+    def release(self):
+        """Removes the leases of this object (the entries it returned may be evicted afterwards)."""
+        _remove_files(self._leases)
+
+    def put(self, key, files):
+        """
+        Copies the rasters {name: path} into the entry key and evicts old
+        entries. Safe against concurrent writers (batch workers): the entry
+        is written to a private folder and renamed.
+        """
+        from osgeo import gdal
+
+        def write(tmp):
+            for name, path in files.items():
+                gdal.Translate(os.path.join(tmp, name + '.tif'), str(path), format='GTiff',
+                               creationOptions=['COMPRESS=DEFLATE', 'TILED=YES'])
+        self._store(key, write)
+
+    def put_files(self, key, files, suffix):
+        """Like put(), for other files {name: path} (copied as <name><suffix>, e.g. reprojected vector layers)."""
+        def write(tmp):
+            for name, path in files.items():
+                shutil.copyfile(str(path), os.path.join(tmp, name + suffix))
+        self._store(key, write)
+
+    def _store(self, key, write):
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            self._touch(entry)
+            return
+        tmp = '{}.tmp-{}'.format(entry, uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            write(tmp)
+            self._touch(tmp)
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process stored the same entry in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    @staticmethod
+    def _touch(entry):
+        with open(os.path.join(entry, _USED), 'w') as f:
+            f.write(str(time.time()))
+
+    @staticmethod
+    def _size(entry):
+        return sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+
+    @staticmethod
+    def _in_use(entry):
+        now = time.time()
+        try:
+            return any(e.name.startswith(_LEASE) and now - e.stat().st_mtime < LEASE_SECONDS
+                       for e in os.scandir(entry))
+        except OSError:
+            return False
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache fits into
+        max_bytes; leased entries are kept (the cache may then stay larger).
+        """
+        entries = []
+        for e in os.scandir(self.cache_dir):
+            if not e.is_dir() or '.tmp-' in e.name:
+                continue
+            used = os.path.join(e.path, _USED)
+            entries.append((os.path.getmtime(used) if os.path.exists(used) else 0.0, e.name, self._size(e.path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entry(name)
+            if name == keep or self._in_use(entry):
+                continue
+            # Rename first (fails on Windows while files are open), then look for a lease taken in the meantime
+            doomed = '{}.tmp-{}'.format(entry, uuid.uuid4().hex)
+            try:
+                os.replace(entry, doomed)
+            except OSError:
+                continue
+            if self._in_use(doomed):
+                try:
+                    os.replace(doomed, entry)
+                    continue
+                except OSError:
+                    # Stored again by another process in the meantime: the same content is back at the entry path
+                    pass
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Channel statistics per TEZG (G-Laenge, G-Neigung).
+
+The channel lines are clipped to every TEZG polygon found through a spatial
+index over the TEZG bounding boxes; the clipped lengths are summed directly.
+The elevation range is taken from the DEM cells the clipped lines pass
+through: the lines are sampled at half the cell size and the samples are
+converted to row/column indices, so all DEM values are looked up with one
+array indexing operation. No dissolved channel layer, zone raster or zonal
+statistics table is written.
+"""
+import math
+
+import numpy as np
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsSpatialIndex, QgsWkbTypes
+
+from zemokost_prep.zonal import _open, read_array
+
+
+def _line_parts(geom):
+    """Vertex arrays [(n, 2), ...] of the line parts of geom (points of a geometry collection are skipped)."""
+    parts = []
+    for part in geom.asGeometryCollection():
+        if part.type() != QgsWkbTypes.LineGeometry:
+            continue
+        xy = np.array([(p.x(), p.y()) for p in part.asPolyline()], dtype=np.float64)
+        if len(xy) > 1:
+            parts.append(xy)
+    return parts
+
+
+def sample_line(xy, step):
+    """Points along the polyline xy (n, 2) at most step apart, including all vertices."""
+    seg = np.diff(xy, axis=0)
+    n = np.maximum(np.ceil(np.hypot(seg[:, 0], seg[:, 1]) / step).astype(np.int64), 1)
+    idx = np.repeat(np.arange(len(seg)), n)
+    t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.repeat(n, n)
+    return np.vstack([xy[idx] + seg[idx] * t[:, None], xy[-1:]])
+
+
+def channel_stats(channels, shapes, dem, step=None):
+    """
+    Channel length and elevation range per TEZG.
+
+    channels: line layer or its QgsVectorLayerFeatureSource (safe to read in
+    another thread), shapes: TEZG [(tezg_id, wkb), ...] (vector.layer_shapes),
+    both in the CRS of the DEM raster dem (path). step: sampling distance
+    along the lines (default half the cell size).
+
+    Returns {tezg_id: (length_m, z_min, z_max)} for every TEZG crossed by a
+    channel; z_min/z_max are NaN if no sample hits a valid DEM cell.
+    """
+    index = QgsSpatialIndex()
+    polygons = {}
+    for n, (tezg_id, wkb) in enumerate(shapes):
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        if geom.isNull():
+            continue
+        engine = QgsGeometry.createGeometryEngine(geom.constGet())
+        engine.prepareGeometry()
+        polygons[n] = (int(tezg_id), geom, engine)
+        index.addFeature(n, geom.boundingBox())
+
+    gt = _open(dem).GetGeoTransform()
+    if step is None:
+        step = abs(gt[1]) / 2.0
+
+    lengths = {}
+    samples = []
+    zones = []
+    for feat in channels.getFeatures(QgsFeatureRequest().setNoAttributes()):
+        line = feat.geometry()
+        if line.isNull():
+            continue
+        for fid in index.intersects(line.boundingBox()):
+            tezg_id, polygon, engine = polygons[fid]
+            if not engine.intersects(line.constGet()):
+                continue
+            clipped = line if engine.contains(line.constGet()) else line.intersection(polygon)
+            length = clipped.length()
+            if length <= 0:
+                continue
+            lengths[tezg_id] = lengths.get(tezg_id, 0.0) + length
+            for xy in _line_parts(clipped):
+                pts = sample_line(xy, step)
+                samples.append(pts)
+                zones.append(np.full(len(pts), tezg_id, dtype=np.int64))
+
+    if not lengths:
+        return {}
+    ids = np.array(sorted(lengths), dtype=np.int64)
+    z_min = np.full(len(ids), np.inf)
+    z_max = np.full(len(ids), -np.inf)
+    if samples:
+        pts = np.vstack(samples)
+        zone_idx = np.searchsorted(ids, np.concatenate(zones))
+        arr = read_array(dem)
+        cols = np.floor((pts[:, 0] - gt[0]) / gt[1]).astype(np.int64)
+        rows = np.floor((pts[:, 1] - gt[3]) / gt[5]).astype(np.int64)
+        inside = (rows >= 0) & (rows < arr.shape[0]) & (cols >= 0) & (cols < arr.shape[1])
+        z = arr[rows[inside], cols[inside]].astype(np.float64)
+        valid = ~np.isnan(z)
+        np.minimum.at(z_min, zone_idx[inside][valid], z[valid])
+        np.maximum.at(z_max, zone_idx[inside][valid], z[valid])
+
+    result = {}
+    for i, tezg_id in enumerate(ids.tolist()):
+        lo, hi = z_min[i], z_max[i]
+        if not math.isfinite(lo):
+            lo = hi = math.nan
+        result[tezg_id] = (lengths[tezg_id], float(lo), float(hi))
+    return result
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface for running the preparation outside the QGIS GUI.
+
+    python -m zemokost_prep run --dem dem.tif --tezg tezg.shp --tezg-id ID ... --projectpath out/
+    python -m zemokost_prep run --algorithm zemokost_rasteronly --dem ... --output-csv out.csv
+    python -m zemokost_prep batch manifest.csv --workers 4
+    python -m zemokost_prep bench --scenarios xs,s --baseline baseline.json
+    python -m zemokost_prep parity --dem dem_clip.tif --streams gerinne.shp
+    python -m zemokost_prep simulate import_zemokost.csv --intensity 60 --duration 30 --d90 0.1
+    python -m zemokost_prep design import_zemokost.csv --series uw.csv --return-periods 30,100 --d90 0.1
+    python -m zemokost_prep ensemble import_zemokost.csv --intensity 60 --duration 45 --realisations 5000 --d90 0.1
+    python -m zemokost_prep storm import_zemokost.csv --intensity 60 --duration 45 --grid 5 --d90 0.1
+
+The options of 'run' are generated from the parameter definitions of the
+selected algorithm (initAlgorithm): parameter name in lower case with '-'
+instead of '_'. Warnings (e.g. TEZG polygons smaller than 100 m²) are written
+to the log and to the JSON report (--report).
+"""
+import argparse
+import json
+import logging
+import sys
+
+from zemokost_prep import qgis_env
+
+PARAMETER_TYPES = {
+    'raster': 'Rasterlayer (Pfad)',
+    'vector': 'Vektorlayer (Pfad)',
+    'field': 'Feldname',
+    'file': 'Ordner/Datei',
+    'fileDestination': 'Ausgabedatei',
+    'boolean': 'true/false',
+}
+
+
+def _option(name):
+    return '--' + name.lower().replace('_', '-')
+
+
+def _common_arguments(parser):
+    parser.add_argument('--script-dir', default=None, help='Ordner mit den WLV_pyqgis_*-Skripten')
+    parser.add_argument('--wbt-dir', default=None, help='Ordner, der das WBT-Paket enthält')
+    parser.add_argument('--log', default=None, help='Logdatei (zusätzlich zur Konsole)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Nur Warnungen und Fehler ausgeben')
+
+
+def _setup_logging(args):
+    handlers = [logging.StreamHandler()]
+    if args.log:
+        handlers.append(logging.FileHandler(args.log, encoding='utf-8'))
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s', handlers=handlers)
+
+
+def run(argv):
+    parser = argparse.ArgumentParser(prog='python -m zemokost_prep run', add_help=False)
+    parser.add_argument('--algorithm', default='zemokost', choices=list(qgis_env.ALGORITHMS))
+    parser.add_argument('--report', default=None, help='JSON-Bericht (Status, Laufzeit, Warnungen)')
+    _common_arguments(parser)
+    args, _ = parser.parse_known_args(argv)
+
+    # The algorithm options are only known once the script can be imported
+    qgis_env.add_script_paths(args.script_dir, args.wbt_dir)
+    qgis_env.start_qgis()
+    from zemokost_prep import runner
+
+    alg = qgis_env.algorithm(args.algorithm)
+    alg_parser = argparse.ArgumentParser(prog='python -m zemokost_prep run', parents=[parser],
+                                         description=alg.displayName())
+    for definition in alg.parameterDefinitions():
+        optional = bool(definition.flags() & definition.FlagOptional)
+        alg_parser.add_argument(_option(definition.name()), dest=definition.name(), default=None,
+                                required=not optional and definition.defaultValue() is None,
+                                metavar=PARAMETER_TYPES.get(definition.type(), 'WERT'),
+                                help=definition.description())
+    ns = alg_parser.parse_args(argv)
+    values = {definition.name(): getattr(ns, definition.name()) for definition in alg.parameterDefinitions()}
+
+    _setup_logging(args)
+    report = runner.run_algorithm(args.algorithm, values, feedback=runner.ReportFeedback())
+    report['parameters'] = {k: v for k, v in values.items() if v is not None}
+    if args.report:
+        with open(args.report, mode='w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0 if report['status'] == 'ok' else 1
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in ('run', 'batch', 'bench', 'parity', 'simulate', 'design', 'ensemble', 'storm'):
+        print(__doc__.strip())
+        return 2
+    if argv[0] == 'batch':
+        from zemokost_prep import batch
+        return batch.main(argv[1:])
+    if argv[0] == 'bench':
+        from zemokost_prep import benchmark
+        return benchmark.main(argv[1:])
+    if argv[0] == 'parity':
+        from zemokost_prep import hydro
+        return hydro.main(argv[1:])
+    if argv[0] == 'simulate':
+        from zemokost_prep import runoff
+        return runoff.main(argv[1:])
+    if argv[0] == 'design':
+        from zemokost_prep import design
+        return design.main(argv[1:])
+    if argv[0] == 'ensemble':
+        from zemokost_prep import ensemble
+        return ensemble.main(argv[1:])
+    if argv[0] == 'storm':
+        from zemokost_prep import storm
+        return storm.main(argv[1:])
+    return run(argv[1:])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Task graph (DAG) for the independent branches of a run.
+
+Every task is declared with the names of the tasks whose results it needs
+(its inputs); the results of these tasks are passed to the task function as
+positional arguments. run() starts each task as soon as all of its inputs
+are available, up to workers tasks at a time in a thread pool. The heavy
+parts of the branches (WhiteboxTools subprocesses, GDAL, NumPy) release the
+GIL, so threads are sufficient. Tasks declared with local=True (e.g. QGIS
+processing algorithms on layers, which must not be used from other threads)
+run in the calling thread while the pool works on the others. With
+workers=1 the tasks run one after the other in the calling thread in the
+order they were declared.
+
+    graph = TaskGraph()
+    graph.add('slope', lambda: slope_percent(dem, cellsize))
+    graph.add('stats', lambda slp: zonal(slp), requires=['slope'])
+    results = graph.run(workers=4)
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class TaskGraph:
+    """Tasks with dependencies; timings holds the wall time [s] of every finished task."""
+
+    def __init__(self):
+        self.tasks = {}
+        self.timings = {}
+
+    def add(self, name, func, requires=(), local=False):
+        """
+        Declares task name; requires must name tasks declared before (so the
+        graph has no cycles). local: run in the calling thread, not in the pool.
+        """
+        if name in self.tasks:
+            raise ValueError('Task {} ist bereits definiert.'.format(name))
+        for required in requires:
+            if required not in self.tasks:
+                raise ValueError('Task {} benötigt unbekannten Task {}.'.format(name, required))
+        self.tasks[name] = (func, tuple(requires), local)
+
+    def _call(self, name, args):
+        start = time.perf_counter()
+        result = self.tasks[name][0](*args)
+        self.timings[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def run(self, workers=1, feedback=None, on_start=None):
+        """
+        Runs all tasks and returns {name: result}. on_start(name) is called
+        before a task starts (sequential mode only, e.g. StageProfiler.mark).
+        If feedback is cancelled no further task is started; the results of
+        the finished tasks are returned. The first exception of a task is
+        raised after the running tasks have finished.
+        """
+        results = {}
+        if workers <= 1:
+            for name, (_, requires, _) in self.tasks.items():
+                if feedback is not None and feedback.isCanceled():
+                    break
+                if on_start is not None:
+                    on_start(name)
+                results[name] = self._call(name, [results[r] for r in requires])
+            return results
+
+        pending = dict(self.tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                if feedback is not None and feedback.isCanceled():
+                    pending.clear()
+                for future in [f for f in running if f.done()]:
+                    results[running.pop(future)] = future.result()
+                ready = [n for n, (_, requires, _) in pending.items() if all(r in results for r in requires)]
+                for name in ready:
+                    if not pending[name][2]:
+                        requires = pending.pop(name)[1]
+                        running[pool.submit(self._call, name, [results[r] for r in requires])] = name
+                local = [name for name in ready if name in pending]
+                if local:
+                    # One local task in this thread, then check the pool again
+                    requires = pending.pop(local[0])[1]
+                    results[local[0]] = self._call(local[0], [results[r] for r in requires])
+                    continue
+                if not running:
+                    break
+                wait(running, return_when=FIRST_COMPLETED)
+        return results
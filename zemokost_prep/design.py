@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Design discharge: critical-duration sweep of the runoff simulation.
+
+The workbook's design calculation (clsBemessung.Bemessung) simulates the
+durations of the rainfall series one after another and keeps the one with
+the highest peak at the observed junction. design_sweep() simulates all
+combinations of return period and duration in batches along the batch axis
+of runoff.simulate (optionally spread over worker processes) and returns
+peak, time to peak and volume of every junction, plus the critical duration
+per junction and return period. The workbook's refinement between the given
+durations (SucheLokMax) is not repeated; pass a finer list of durations
+instead.
+
+    series = read_series('uw.csv')  # D [min]; u [mm]; w [mm] (or p1 [mm]; p100 [mm])
+    result = design_sweep(catchment, series, [15, 30, 60, 90, 120], [30, 100, 150])
+    result.critical  # critical duration [min], shape (return period, junction)
+
+    python -m zemokost_prep design import_zemokost.csv --series uw.csv --return-periods 30,100,150 --d90 0.1
+"""
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from zemokost_prep.rainfall import EULER, SHAPES, read_series
+from zemokost_prep.runoff import N_STEPS, read_catchment, simulate
+
+# Lanes (simulations x sub-catchments) per batch; about 0.5 MB each at 11520 steps
+BATCH_LANES = 1024
+
+
+class DesignResult:
+    """
+    Result of a design sweep. peak [m³/s], t_peak [min], volume [m³]: shape
+    (return period, duration, junction); critical: duration [min] with the
+    highest peak, shape (return period, junction).
+    """
+
+    def __init__(self, junctions, return_periods, durations, peak, t_peak, volume):
+        self.junctions = junctions
+        self.return_periods = return_periods
+        self.durations = durations
+        self.peak = peak
+        self.t_peak = t_peak
+        self.volume = volume
+        # Last duration with the maximum peak, as the workbook (<=) selects it
+        last = peak.shape[1] - 1 - np.argmax(peak[:, ::-1], axis=1)
+        self.critical_index = last
+        self.critical = durations[last]
+
+    def rows(self):
+        """One dict per junction, return period and duration."""
+        rows = []
+        for k, junction in enumerate(self.junctions):
+            for t, return_period in enumerate(self.return_periods):
+                for d, duration in enumerate(self.durations):
+                    rows.append({'junction': int(junction), 'return_period': float(return_period),
+                                 'duration': float(duration), 'peak': float(self.peak[t, d, k]),
+                                 't_peak': float(self.t_peak[t, d, k]), 'volume': float(self.volume[t, d, k]),
+                                 'critical': d == self.critical_index[t, k]})
+        return rows
+
+
+def _simulate_batch(catchment, rain, rain_steps, options):
+    result = simulate(catchment, rain[:, None, :], rain_steps=rain_steps[:, None], hydrographs=False, **options)
+    return result.junctions, result.peak, result.t_peak, result.volume
+
+
+def design_sweep(catchment, series, durations, return_periods, shape=SHAPES[0], akl_mode='m', rkl_mode='m', szi=0.0,
+                 n_steps=N_STEPS, workers=1, batch_size=None):
+    """
+    Simulates every (return period x duration) combination of the design
+    rainfall from the UWSeries series with the same rain on all
+    sub-catchments. The combinations are simulated batch_size at a time
+    (default: BATCH_LANES lanes per batch), with workers > 1 in a process
+    pool.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    return_periods = np.asarray(return_periods, dtype=np.float64)
+    if durations.size == 0 or return_periods.size == 0:
+        raise ValueError('Mindestens eine Dauerstufe und eine Jährlichkeit erforderlich.')
+    if (durations <= 0).any() or (return_periods <= 0).any():
+        raise ValueError('Dauerstufen und Jährlichkeiten müssen positiv sein.')
+    if shape not in SHAPES + EULER:
+        raise ValueError('Unbekannte Niederschlagsverteilung: {} (möglich: {}).'.format(
+            shape, ', '.join(SHAPES + EULER)))
+
+    # All hyetographs zero-padded to the longest duration, ordered (return period, duration)
+    hyetographs = [series.hyetograph(shape, t, d) for t in return_periods for d in durations]
+    rain_steps = np.array([len(h) for h in hyetographs], dtype=np.int64)
+    rain = np.zeros((len(hyetographs), int(rain_steps.max())))
+    for row, h in enumerate(hyetographs):
+        rain[row, :len(h)] = h
+
+    options = {'akl_mode': akl_mode, 'rkl_mode': rkl_mode, 'szi': szi, 'n_steps': n_steps}
+    batch_size = batch_size or max(1, BATCH_LANES // len(catchment))
+    starts = range(0, len(rain), batch_size)
+    batches = [(catchment, rain[s:s + batch_size], rain_steps[s:s + batch_size], options) for s in starts]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            parts = list(pool.map(_simulate_batch, *zip(*batches)))
+    else:
+        parts = [_simulate_batch(*batch) for batch in batches]
+
+    shape_out = (len(return_periods), len(durations), -1)
+    peak, t_peak, volume = (np.concatenate([part[i] for part in parts]).reshape(shape_out) for i in (1, 2, 3))
+    return DesignResult(parts[0][0], return_periods, durations, peak, t_peak, volume)
+
+
+def write_table(result, path_or_file):
+    """Design table (';', decimal comma): one row per junction, return period and duration."""
+    own = isinstance(path_or_file, str)
+    f = open(path_or_file, mode='w', newline='', encoding='utf-8') if own else path_or_file
+    try:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Knoten', 'T [a]', 'D [min]', 'Qmax [m3/s]', 'tmax [min]', 'Fracht [m3]', 'massgebend'])
+        for row in result.rows():
+            values = [row[key] for key in ('return_period', 'duration', 'peak', 't_peak', 'volume')]
+            writer.writerow([row['junction']] + [str(round(value, 3)).replace('.', ',') for value in values] +
+                            ['x' if row['critical'] else ''])
+    finally:
+        if own:
+            f.close()
+
+
+def _numbers(text):
+    return [float(value) for value in text.split(',') if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zemokost_prep design',
+                                     description='Bemessung: maßgebende Dauerstufe je Knoten und Jährlichkeit')
+    parser.add_argument('csv', help='import_zemokost.csv')
+    parser.add_argument('--series', required=True,
+                        help='Niederschlagsreihen (CSV: D [min]; u [mm]; w [mm] oder p1 [mm]; p100 [mm])')
+    parser.add_argument('--return-periods', required=True, type=_numbers, help='Jährlichkeiten [a], z.B. 30,100,150')
+    parser.add_argument('--durations', type=_numbers, default=None,
+                        help='Dauerstufen [min] (Standard: Dauerstufen der Reihen)')
+    parser.add_argument('--shape', default=SHAPES[0], choices=SHAPES + EULER, help='Niederschlagsverteilung')
+    parser.add_argument('--akl', default='m', choices=('b', 'm', 't'), help='Bandbreite der AKL')
+    parser.add_argument('--rkl', default='m', choices=('b', 'm', 't'), help='Bandbreite der RKL')
+    parser.add_argument('--szi', type=float, default=0.0, help='Verschiebung der Anfangsverluste [min]')
+    parser.add_argument('--d90', type=float, default=None, help='d90 [m] für leere Zellen')
+    parser.add_argument('--steps', type=int, default=N_STEPS, help='Simulationsdauer [Schritte à 1 min]')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Anzahl paralleler Worker-Prozesse')
+    parser.add_argument('--output', default=None, help='Bemessungstabelle als CSV (Standard: Konsole)')
+    args = parser.parse_args(argv)
+
+    catchment = read_catchment(args.csv, defaults={'d90 [m]': args.d90} if args.d90 is not None else None)
+    series = read_series(args.series)
+    durations = args.durations or series.durations
+    result = design_sweep(catchment, series, durations, args.return_periods, args.shape, args.akl, args.rkl,
+                          args.szi, args.steps, args.workers)
+    write_table(result, args.output or sys.stdout)
+    return 0
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Ensemble (Monte Carlo) runs of the runoff simulation for parameter uncertainty.
+
+The AKL/RKL area shares and the interflow values (ZAF 1 bis 7, Anteil [%])
+of import_zemokost.csv are point estimates. run_ensemble() draws
+realisations of these per-TEZG values, simulates them in batches along the
+batch axis of runoff.simulate (optionally spread over worker processes) and
+reduces the peak discharges per junction on the fly: mean, standard
+deviation, minimum, maximum and quantiles (P² estimator, Jain & Chlamtac
+1985). Memory depends on the batch size, not on the number of realisations.
+
+Distributions per parameter (None keeps the value fixed):
+
+- akl, rkl: ('dirichlet', concentration) around the class shares of every
+  TEZG; higher concentration means less spread
+- zaf, anteil: ('normal', standard deviation) or ('uniform', half width),
+  clipped to 1..7 and 0..100 %; empty values stay empty, and Anteil is
+  only varied where it is above 0 and the TEZG has a ZAF
+
+Batch k draws from the k-th child of SeedSequence(seed), so an ensemble is
+reproducible for a given seed, batch size and distribution independent of
+the number of workers.
+
+    result = run_ensemble(catchment, design_rain('block rainfall', 60.0, 45), 5000, seed=1)
+    result.quantile(0.9)  # 90 % quantile of the peak [m³/s] per junction
+
+    python -m zemokost_prep ensemble import_zemokost.csv --intensity 60 --duration 45 --realisations 5000 --d90 0.1
+"""
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from zemokost_prep.design import BATCH_LANES
+from zemokost_prep.rainfall import SHAPES, design_rain
+from zemokost_prep.runoff import N_STEPS, read_catchment, simulate
+
+DISTRIBUTIONS = {
+    'akl': ('dirichlet', 50.0),
+    'rkl': ('dirichlet', 50.0),
+    'zaf': ('normal', 0.5),
+    'anteil': ('normal', 10.0),
+}
+QUANTILES = (0.05, 0.1, 0.5, 0.9, 0.95)
+LIMITS = {'zaf': (1.0, 7.0), 'anteil': (0.0, 100.0)}
+
+
+def perturb(catchment, rng, size, distributions=None):
+    """Catchment with size realisations (leading batch dimension) of the perturbed values."""
+    distributions = DISTRIBUTIONS if distributions is None else distributions
+    changes = {}
+    for field, spec in distributions.items():
+        if spec is None:
+            continue
+        kind, scale = spec
+        value = getattr(catchment, field)
+        if field in ('akl', 'rkl'):
+            if kind != 'dirichlet':
+                raise ValueError('{}: nur dirichlet möglich, nicht {}.'.format(field.upper(), kind))
+            total = value.sum(axis=-1, keepdims=True)
+            draw = rng.gamma(scale * value / total, size=(size,) + value.shape)
+            drawn = draw.sum(axis=-1, keepdims=True)
+            # Keep the point estimate where all draws underflow to zero
+            changes[field] = np.where(drawn > 0, draw / np.where(drawn > 0, drawn, 1) * total, value)
+        elif field in LIMITS:
+            if kind == 'normal':
+                noise = rng.normal(0.0, scale, size=(size,) + value.shape)
+            elif kind == 'uniform':
+                noise = rng.uniform(-scale, scale, size=(size,) + value.shape)
+            else:
+                raise ValueError('{}: normal oder uniform erwartet, nicht {}.'.format(field, kind))
+            drawn = np.clip(value + noise, *LIMITS[field])
+            if field == 'anteil':
+                # No interflow share without a ZAF (Anteil 0, empty ZAF as the raster tool writes it)
+                drawn = np.where(np.isfinite(catchment.zaf) & (value > 0), drawn, value)
+            changes[field] = drawn
+        else:
+            raise ValueError('Unbekannter Parameter: {} (möglich: {}).'.format(field, ', '.join(DISTRIBUTIONS)))
+    return catchment.copy(**changes)
+
+
+class StreamingQuantiles:
+    """
+    Running mean, standard deviation, minimum, maximum and P² quantile
+    estimates of a stream of vectors (e.g. the peaks of all junctions of one
+    realisation), with constant memory.
+    """
+
+    def __init__(self, probabilities, width):
+        self.p = np.asarray(probabilities, dtype=np.float64)[:, None]
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+        self.first = []
+        # Marker heights, positions and desired positions per quantile and column
+        self.q = None
+        self.n = None
+        self.n_want = None
+        self.dn = np.concatenate([np.zeros_like(self.p), self.p / 2, self.p, (1 + self.p) / 2,
+                                  np.ones_like(self.p)], axis=1)[:, None, :]
+
+    def add(self, values):
+        """Adds the rows of values (realisations x width)."""
+        for x in np.atleast_2d(values):
+            self._add(x)
+
+    def _add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        np.minimum(self.min, x, out=self.min)
+        np.maximum(self.max, x, out=self.max)
+        if self.q is None:
+            self.first.append(x.copy())
+            if len(self.first) == 5:
+                start = np.sort(np.array(self.first), axis=0).T
+                self.q = np.broadcast_to(start, (len(self.p),) + start.shape).copy()
+                self.n = np.broadcast_to(np.arange(1.0, 6.0), self.q.shape).copy()
+                self.n_want = np.broadcast_to(1 + 4 * self.dn, self.q.shape).copy()
+                self.first = []
+            return
+
+        q, n = self.q, self.n
+        q[..., 0] = np.minimum(q[..., 0], x)
+        q[..., 4] = np.maximum(q[..., 4], x)
+        # Cell k with q[k] <= x < q[k + 1]; the markers above it move up by one
+        k = np.clip((x[None, :, None] >= q[..., 1:4]).sum(axis=-1), 0, 3)
+        n += np.arange(5) > k[..., None]
+        self.n_want += self.dn
+        for i in (1, 2, 3):
+            d = self.n_want[..., i] - n[..., i]
+            up = n[..., i + 1] - n[..., i]
+            down = n[..., i - 1] - n[..., i]
+            move = ((d >= 1) & (up > 1)) | ((d <= -1) & (down < -1))
+            if not move.any():
+                continue
+            d = np.where(move, np.sign(d), 0.0)
+            parabolic = q[..., i] + d / (up - down) * ((d - down) * (q[..., i + 1] - q[..., i]) / up +
+                                                       (up - d) * (q[..., i] - q[..., i - 1]) / -down)
+            neighbour = np.where(d > 0, q[..., i + 1], q[..., i - 1])
+            linear = q[..., i] + d * (neighbour - q[..., i]) / np.where(d > 0, up, -down)
+            inside = (q[..., i - 1] < parabolic) & (parabolic < q[..., i + 1])
+            q[..., i] = np.where(move, np.where(inside, parabolic, linear), q[..., i])
+            n[..., i] += d
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def quantiles(self):
+        """Quantile estimates, shape (probabilities, width); exact while fewer than 5 values were added."""
+        if self.q is None:
+            return np.quantile(np.array(self.first), self.p[:, 0], axis=0)
+        return self.q[..., 2].copy()
+
+
+class EnsembleResult:
+    """
+    Peak statistics of an ensemble per junction: probabilities and
+    quantiles (shape (probabilities, junction)), mean, std, min, max and
+    base (peak of the unperturbed catchment) [m³/s].
+    """
+
+    def __init__(self, junctions, stats, base):
+        self.junctions = junctions
+        self.realisations = stats.count
+        self.probabilities = stats.p[:, 0]
+        self.quantiles = stats.quantiles()
+        self.mean = stats.mean
+        self.std = stats.std
+        self.min = stats.min
+        self.max = stats.max
+        self.base = base
+
+    def quantile(self, probability):
+        """Peaks [m³/s] per junction of one of the estimated probabilities."""
+        return self.quantiles[int(np.argmin(np.abs(self.probabilities - probability)))]
+
+
+def _simulate_realisations(catchment, rain, seed, size, distributions, options):
+    realisations = perturb(catchment, np.random.default_rng(seed), size, distributions)
+    return simulate(realisations, rain, hydrographs=False, **options).peak
+
+
+def run_ensemble(catchment, rain, realisations, seed=None, distributions=None, probabilities=QUANTILES,
+                 akl_mode='m', rkl_mode='m', szi=0.0, n_steps=N_STEPS, workers=1, batch_size=None, **rain_options):
+    """
+    Simulates realisations perturbed catchments (distributions: see
+    DISTRIBUTIONS) for the hyetograph rain and reduces the junction peaks.
+    rain_options (offset, reduction, rain_steps) are passed to simulate.
+    """
+    if realisations < 1:
+        raise ValueError('Mindestens eine Realisierung erforderlich.')
+    options = dict(rain_options, akl_mode=akl_mode, rkl_mode=rkl_mode, szi=szi, n_steps=n_steps)
+    base = simulate(catchment, rain, hydrographs=False, **options)
+    batch_size = batch_size or max(1, BATCH_LANES // len(catchment))
+    sizes = [min(batch_size, realisations - start) for start in range(0, realisations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    stats = StreamingQuantiles(probabilities, len(base.junctions))
+
+    args = [(catchment, rain, s, size, distributions, options) for s, size in zip(seeds, sizes)]
+    if workers > 1 and len(args) > 1:
+        # At most two batches per worker in flight; results are reduced in batch order
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for arg in args:
+                pending.append(pool.submit(_simulate_realisations, *arg))
+                if len(pending) >= 2 * workers:
+                    stats.add(pending.pop(0).result())
+            for future in pending:
+                stats.add(future.result())
+    else:
+        for arg in args:
+            stats.add(_simulate_realisations(*arg))
+    return EnsembleResult(base.junctions, stats, base.peak)
+
+
+def write_statistics(result, path_or_file):
+    """Peak statistics per junction as CSV (';', decimal comma)."""
+    own = isinstance(path_or_file, str)
+    f = open(path_or_file, mode='w', newline='', encoding='utf-8') if own else path_or_file
+    try:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Knoten', 'Realisierungen', 'Qmax [m3/s]', 'Mittel [m3/s]', 'Std [m3/s]', 'Min [m3/s]'] +
+                        ['Q{:g}% [m3/s]'.format(100 * p) for p in result.probabilities] + ['Max [m3/s]'])
+        for k, junction in enumerate(result.junctions):
+            values = [result.base[k], result.mean[k], result.std[k], result.min[k]] + \
+                list(result.quantiles[:, k]) + [result.max[k]]
+            writer.writerow([int(junction), result.realisations] +
+                            [str(round(float(value), 3)).replace('.', ',') for value in values])
+    finally:
+        if own:
+            f.close()
+
+
+def _distribution(text):
+    if text.lower() in ('', 'none', 'fix'):
+        return None
+    kind, _, scale = text.partition(':')
+    try:
+        return kind.strip().lower(), float(scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Verteilung als art:wert erwartet, z.B. normal:0.5')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zemokost_prep ensemble',
+                                     description='Ensemble-Simulation für die Unsicherheit von AKL, RKL und '
+                                                 'Zwischenabfluss')
+    parser.add_argument('csv', help='import_zemokost.csv')
+    parser.add_argument('--shape', default=SHAPES[0], choices=SHAPES, help='Niederschlagsverteilung')
+    parser.add_argument('--intensity', type=float, required=True, help='Mittlere Intensität [mm/h]')
+    parser.add_argument('--duration', type=float, required=True, help='Niederschlagsdauer [min]')
+    parser.add_argument('--realisations', type=int, default=1000, help='Anzahl der Realisierungen')
+    parser.add_argument('--seed', type=int, default=None, help='Startwert des Zufallsgenerators')
+    for field, (kind, scale) in DISTRIBUTIONS.items():
+        parser.add_argument('--' + field, type=_distribution, default=(kind, scale),
+                            help='Verteilung (Standard {}:{:g}; fix: unverändert)'.format(kind, scale))
+    parser.add_argument('--quantiles', default=','.join('{:g}'.format(p) for p in QUANTILES),
+                        help='Quantile (0..1), kommagetrennt')
+    parser.add_argument('--akl-mode', default='m', choices=('b', 'm', 't'), help='Bandbreite der AKL')
+    parser.add_argument('--rkl-mode', default='m', choices=('b', 'm', 't'), help='Bandbreite der RKL')
+    parser.add_argument('--szi', type=float, default=0.0, help='Verschiebung der Anfangsverluste [min]')
+    parser.add_argument('--d90', type=float, default=None, help='d90 [m] für leere Zellen')
+    parser.add_argument('--steps', type=int, default=N_STEPS, help='Simulationsdauer [Schritte à 1 min]')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Anzahl paralleler Worker-Prozesse')
+    parser.add_argument('--output', default=None, help='Statistik der Scheitelwerte als CSV (Standard: Konsole)')
+    args = parser.parse_args(argv)
+
+    catchment = read_catchment(args.csv, defaults={'d90 [m]': args.d90} if args.d90 is not None else None)
+    distributions = {field: getattr(args, field) for field in DISTRIBUTIONS}
+    probabilities = [float(p) for p in args.quantiles.split(',') if p.strip()]
+    result = run_ensemble(catchment, design_rain(args.shape, args.intensity, args.duration), args.realisations,
+                          args.seed, distributions, probabilities, args.akl_mode, args.rkl_mode, args.szi,
+                          args.steps, args.workers)
+    write_statistics(result, args.output or sys.stdout)
+    return 0
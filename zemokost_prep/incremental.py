@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-preparation.
+
+A fingerprint per TEZG is stored next to import_zemokost.csv. It covers the
+TEZG geometry and attributes, the AKL/RKL/ZA/channel features overlapping the
+TEZG and the DEM window under the TEZG, buffered by BUFFER_CELLS (the same
+margin as the tiled hydrology), since filling and flow paths reach beyond the
+TEZG boundary. On a re-run only the statistics and CSV rows of the TEZG whose
+fingerprint changed (or which are new) are recomputed, while DEM clip and
+hydrology still cover the whole catchment; the rows of all other TEZG are
+taken over from the existing CSV. If the run settings changed (global
+fingerprint), everything is recomputed.
+"""
+import csv
+import hashlib
+import json
+import os
+
+from osgeo import gdal
+from qgis.core import QgsCoordinateTransform, QgsFeatureRequest, QgsGeometry, QgsProject
+
+from zemokost_prep.tiles import BUFFER_CELLS
+
+STATE_FILE = 'import_zemokost_fingerprints.json'
+STATE_VERSION = 2
+
+
+def state_path(csv_path):
+    return os.path.join(os.path.dirname(csv_path), STATE_FILE)
+
+
+def global_fingerprint(settings):
+    """Fingerprint of the run settings (field names, DEM, cellsize, optional inputs, ...)."""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _overlap_digests(geom, layer, transform):
+    """Sorted digests of the features of layer intersecting geom (given in the CRS of the TEZG layer)."""
+    if transform is not None:
+        geom = QgsGeometry(geom)
+        geom.transform(transform)
+    digests = []
+    for feat in layer.getFeatures(QgsFeatureRequest().setFilterRect(geom.boundingBox())):
+        other = feat.geometry()
+        if other.isNull() or not other.intersects(geom):
+            continue
+        h = hashlib.sha256(bytes(other.asWkb()))
+        h.update(repr(feat.attributes()).encode('utf-8'))
+        digests.append(h.hexdigest())
+    return sorted(digests)
+
+
+def _window_digest(ds, rect, margin=BUFFER_CELLS + 1):
+    """Digest of the pixels of ds (band 1) within rect (in the CRS of ds), plus margin cells."""
+    gt = ds.GetGeoTransform()
+    x0 = max(0, int((rect.xMinimum() - gt[0]) / gt[1]) - margin)
+    x1 = min(ds.RasterXSize, int((rect.xMaximum() - gt[0]) / gt[1]) + margin + 1)
+    y0 = max(0, int((rect.yMaximum() - gt[3]) / gt[5]) - margin)
+    y1 = min(ds.RasterYSize, int((rect.yMinimum() - gt[3]) / gt[5]) + margin + 1)
+    if x1 <= x0 or y1 <= y0:
+        return ''
+    return hashlib.sha256(ds.GetRasterBand(1).ReadRaster(x0, y0, x1 - x0, y1 - y0)).hexdigest()
+
+
+def tezg_fingerprints(tezg, id_field, attr_fields, overlays, dem=None):
+    """
+    Returns {tezg_id: fingerprint}.
+
+    tezg      TEZG layer (in the CRS of the DEM)
+    attr_fields  TEZG attributes entering the CSV (knots, name, ...)
+    overlays  {name: layer} of AKL/RKL/ZA/channel layers (None entries are skipped)
+    dem       path of the DEM; the buffered DEM window under every TEZG is hashed
+    """
+    overlays = {name: lyr for name, lyr in overlays.items() if lyr is not None}
+    transforms = {}
+    for name, lyr in overlays.items():
+        transforms[name] = None if lyr.crs() == tezg.crs() else \
+            QgsCoordinateTransform(tezg.crs(), lyr.crs(), QgsProject.instance())
+    ds = gdal.Open(str(dem)) if dem else None
+
+    fingerprints = {}
+    for feat in tezg.getFeatures():
+        geom = feat.geometry()
+        h = hashlib.sha256(bytes(geom.asWkb()))
+        h.update(repr([feat[f] for f in attr_fields if f]).encode('utf-8'))
+        for name in sorted(overlays):
+            h.update(name.encode('utf-8'))
+            for digest in _overlap_digests(geom, overlays[name], transforms[name]):
+                h.update(digest.encode('ascii'))
+        if ds is not None:
+            h.update(_window_digest(ds, geom.boundingBox()).encode('ascii'))
+        fingerprints[int(feat[id_field])] = h.hexdigest()
+    return fingerprints
+
+
+def load_state(path):
+    """Returns the stored state or None."""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    state['tezg'] = {int(k): v for k, v in state.get('tezg', {}).items()}
+    return state
+
+
+def save_state(path, global_fp, fingerprints):
+    with open(path, mode='w', encoding='utf-8') as f:
+        json.dump({'version': STATE_VERSION, 'global': global_fp,
+                   'tezg': {str(k): v for k, v in sorted(fingerprints.items())}}, f, indent=1)
+
+
+def changed_ids(state, global_fp, fingerprints):
+    """
+    TEZG ids to recompute, or None if a full run is required (no state or
+    changed run settings).
+    """
+    if state is None or state.get('global') != global_fp:
+        return None
+    old = state['tezg']
+    return {fid for fid, fp in fingerprints.items() if old.get(fid) != fp}
+
+
+def read_rows(csv_path):
+    """Rows of an existing import_zemokost.csv as {tezg_id: row}."""
+    rows = {}
+    if not os.path.isfile(csv_path):
+        return rows
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f, delimiter=';'):
+            try:
+                rows[int(row['TEZG Nr.'])] = row
+            except (KeyError, TypeError, ValueError):
+                continue
+    return rows
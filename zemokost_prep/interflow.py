@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory interflow (ZAF/ZAA) stage.
+
+Replaces the chain of temporary rasters (rasterize, reclassifybytable,
+rastercalculator) with array operations on the DEM grid. The arrays are fed
+into the fused ZonalEngine; NaN plays the role of NoData (-9999).
+"""
+import numpy as np
+
+# ZAF classes kept for the weighted mean; ZAF > 4 is set to NoData (v1.5.0)
+ZAF_CLASSES = (1, 2, 3, 4)
+
+
+def interflow_arrays(zaf, zaa, cellsize):
+    """
+    Polygon input: ZAF and ZAA rasterised onto the DEM grid.
+
+    Returns the arrays of the former temporary rasters:
+        ZAF_recl  ZAF reclassified (1..4, else NoData)
+        ZAA_recl  ZAA where ZAF_recl > 0
+        SP1       ZAF_recl * ZAA_recl
+        SP2       cellsize * ZAA_recl
+    """
+    with np.errstate(invalid='ignore'):
+        zaf_recl = np.where(np.isin(zaf, ZAF_CLASSES), zaf, np.nan).astype(np.float32)
+        zaa_recl = np.where(zaf_recl > 0, zaa, np.nan).astype(np.float32)
+    return {
+        'ZAF_recl': zaf_recl,
+        'ZAA_recl': zaa_recl,
+        'SP1': zaf_recl * zaa_recl,
+        'SP2': np.float32(cellsize) * zaa_recl,
+    }
+
+
+def add_interflow(engine, zaf, zaa, cellsize):
+    """
+    Registers the interflow sums with a ZonalEngine:
+        SP1  sumproduct(rZAF * rZAA)
+        S1   sum(rZAA)
+        SP2  sumproduct(cellsize * rZAA)
+        C2   cell count of ZAA (before reclassification)
+    Returns the intermediate arrays (see interflow_arrays).
+    """
+    arrays = interflow_arrays(zaf, zaa, cellsize)
+    engine.add_array('SP1', arrays['SP1'])
+    engine.add_array('S1', arrays['ZAA_recl'])
+    engine.add_array('SP2', arrays['SP2'])
+    engine.add_array('C2', zaa)
+    return arrays
+
+
+def weighted_interflow(table, fid, cellsize):
+    """
+    Weighted means per TEZG from the zonal table:
+        wZAF = sumproduct(rZAF * rZAA) / sum(rZAA)
+        wZAA = sumproduct(cellsize * rZAA) / (count(ZAA) * cellsize) * 100
+    Returns (wZAF, wZAA) or None if the TEZG has no interflow cells.
+    """
+    s1 = table.value(fid, 'S1', 'sum')
+    if not s1:
+        return None
+    sp1 = table.value(fid, 'SP1', 'sum')
+    sp2 = table.value(fid, 'SP2', 'sum')
+    c2 = table.value(fid, 'C2', 'count')
+    return sp1 / s1, (sp2 / (c2 * cellsize)) * 100
+
+
+def zaf_le4_arrays(zaf):
+    """
+    Raster input: ZAF aligned to the DEM grid (NaN = NoData).
+
+    Returns
+        zaf     ZAF values of classes 1..4, else NoData (mean -> wZAF)
+        zaale4  1/0 mask of ZAF in [1..4] on all valid ZAF cells (mean * 100 -> ZAA [%])
+    """
+    with np.errstate(invalid='ignore'):
+        le4 = (zaf >= 1) & (zaf <= 4)
+    mask = np.where(np.isnan(zaf), np.nan, le4).astype(np.float32)
+    return {
+        'zaf': np.where(le4, zaf, np.nan).astype(np.float32),
+        'zaale4': mask,
+    }
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage profiling of the processing tools.
+
+StageProfiler splits a run into consecutive stages (reproject, clip, every
+WhiteboxTools call, zonal statistics, AKL/RKL overlay, channel statistics, CSV
+output, ...). For every stage it records wall time, CPU time (including
+child processes such as WhiteboxTools), the peak resident memory of the
+process and of its children so far, and the number of bytes added to the
+temp folder. Branches that run concurrently form one stage; their own wall
+times are listed as 'tasks' in the JSON report. The report is written next
+to import_zemokost.csv as import_zemokost_profile.json and
+import_zemokost_profile.csv.
+"""
+import csv
+import json
+import os
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILE_FILE = 'import_zemokost_profile'
+
+PROFILE_FIELDS = ['stage', 'wall_s', 'cpu_s', 'cpu_children_s', 'peak_rss_mb', 'peak_rss_children_mb',
+                  'temp_written_mb', 'temp_total_mb']
+
+
+def _cpu_times():
+    t = os.times()
+    return t.user + t.system, t.children_user + t.children_system
+
+
+def _peak_rss_mb():
+    """Peak resident memory (MB) of this process and of its (terminated) children, None if unknown."""
+    if resource is not None:
+        # ru_maxrss is in kB on Linux, in bytes on macOS
+        scale = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        return own, children
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024), None
+    return None, None
+
+
+def folder_bytes(path):
+    """Total size of all files below path (0 if it does not exist)."""
+    total = 0
+    if not path or not os.path.isdir(path):
+        return 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # File removed by a concurrent stage
+                pass
+    return total
+
+
+def _mb(value):
+    return None if value is None else round(value, 1)
+
+
+class StageProfiler:
+    """
+    Records consecutive stages. mark(name) closes the running stage and
+    starts the next one, finish() closes the last stage. With enabled=False
+    all calls are no-ops, so the tools can call it unconditionally.
+    """
+
+    def __init__(self, temp_folder=None, enabled=True):
+        self.temp_folder = temp_folder
+        self.enabled = enabled
+        self.stages = []
+        self.tasks = []
+        self._current = None
+        self._start = None
+        self._run_start = time.perf_counter()
+
+    def _snapshot(self):
+        cpu, cpu_children = _cpu_times()
+        return time.perf_counter(), cpu, cpu_children, folder_bytes(self.temp_folder)
+
+    def mark(self, name):
+        if not self.enabled:
+            return
+        self.finish()
+        self._current = name
+        self._start = self._snapshot()
+
+    def finish(self):
+        if not self.enabled or self._current is None:
+            return
+        wall, cpu, cpu_children, temp = self._snapshot()
+        peak, peak_children = _peak_rss_mb()
+        self.stages.append({
+            'stage': self._current,
+            'wall_s': round(wall - self._start[0], 3),
+            'cpu_s': round(cpu - self._start[1], 3),
+            'cpu_children_s': round(cpu_children - self._start[2], 3),
+            'peak_rss_mb': _mb(peak),
+            'peak_rss_children_mb': _mb(peak_children),
+            'temp_written_mb': _mb(max(0, temp - self._start[3]) / (1024 * 1024)),
+            'temp_total_mb': _mb(temp / (1024 * 1024)),
+        })
+        self._current = None
+
+    def record(self, name, wall_s):
+        """Adds the wall time of a task that ran concurrently with other tasks."""
+        if self.enabled:
+            self.tasks.append({'task': name, 'wall_s': wall_s})
+
+    def summary(self):
+        """Stages plus totals as dict (JSON report)."""
+        self.finish()
+        return {
+            'total_wall_s': round(time.perf_counter() - self._run_start, 3),
+            'total_cpu_s': round(sum(s['cpu_s'] for s in self.stages), 3),
+            'total_cpu_children_s': round(sum(s['cpu_children_s'] for s in self.stages), 3),
+            'peak_rss_mb': max((s['peak_rss_mb'] for s in self.stages if s['peak_rss_mb'] is not None),
+                               default=None),
+            'stages': self.stages,
+            'tasks': self.tasks,
+        }
+
+    def write(self, out_dir):
+        """Writes import_zemokost_profile.json/.csv to out_dir; returns the paths (none if disabled)."""
+        if not self.enabled:
+            return []
+        summary = self.summary()
+        json_path = os.path.join(out_dir, PROFILE_FILE + '.json')
+        with open(json_path, mode='w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+        csv_path = os.path.join(out_dir, PROFILE_FILE + '.csv')
+        with open(csv_path, mode='w', newline='') as f:
+            writer = csv.DictWriter(f, delimiter=';', fieldnames=PROFILE_FIELDS)
+            writer.writeheader()
+            for stage in self.stages:
+                row = {k: '' if v is None else str(v).replace('.', ',') for k, v in stage.items()}
+                row['stage'] = stage['stage']
+                writer.writerow(row)
+        return [json_path, csv_path]
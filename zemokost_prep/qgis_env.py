@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Headless QGIS bootstrap for running the preparation scripts outside the
+Processing toolbox (batch mode, worker processes).
+
+QGIS and the Processing providers are initialised once per process; repeated
+calls return the running application.
+"""
+import importlib
+import os
+import sys
+
+# Processing algorithm name -> (script module, algorithm class)
+ALGORITHMS = {
+    'zemokost': ('WLV_pyqgis_ZEMOKOST', 'ZEMOKOST_GISDaten'),
+    'zemokost_rasteronly': ('WLV_pyqgis_raster_ZEMOKOST', 'ZEMOKOST_GISDaten_RasterOnly'),
+}
+
+_app = None
+
+
+def start_qgis(prefix_path=None):
+    """Starts QgsApplication without GUI and registers the native, GDAL and QGIS processing providers."""
+    global _app
+    if _app is not None:
+        return _app
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+
+    prefix_path = prefix_path or os.environ.get('QGIS_PREFIX_PATH')
+    if prefix_path:
+        QgsApplication.setPrefixPath(prefix_path, True)
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    plugins_path = os.path.join(QgsApplication.pkgDataPath(), 'python', 'plugins')
+    if plugins_path not in sys.path:
+        sys.path.append(plugins_path)
+    from processing.core.Processing import Processing
+    from qgis.analysis import QgsNativeAlgorithms
+    Processing.initialize()
+    if QgsApplication.processingRegistry().providerById('native') is None:
+        QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+
+    _app = app
+    return _app
+
+
+def add_script_paths(script_dir=None, wbt_dir=None):
+    """
+    Makes the preparation scripts and the WBT package importable. wbt_dir is the
+    folder containing WBT/ (default: ZEMOKOST_WBT_PATH, then script_dir).
+    """
+    script_dir = script_dir or os.environ.get('ZEMOKOST_SCRIPT_PATH') or \
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    wbt_dir = wbt_dir or os.environ.get('ZEMOKOST_WBT_PATH')
+    for path in (script_dir, wbt_dir):
+        if path and path not in sys.path:
+            sys.path.append(path)
+
+
+def algorithm(name):
+    """Returns a new instance of the preparation algorithm name (see ALGORITHMS)."""
+    try:
+        module_name, class_name = ALGORITHMS[name]
+    except KeyError:
+        raise ValueError('Unbekannter Algorithmus: {} (erlaubt: {})'.format(name, ', '.join(ALGORITHMS)))
+    alg = getattr(importlib.import_module(module_name), class_name)()
+    alg.initAlgorithm()
+    return alg
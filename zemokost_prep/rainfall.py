@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Rainfall input for the runoff simulation (zemokost_prep.runoff).
+
+Design hyetographs and radial areal reduction as in the ZEMOKOST workbook
+(clsNS, clsUW). A hyetograph is an array of intensities [mm/h], one value
+per simulation step of DT minutes. UWSeries derives the design intensity of
+a return period and duration from u/w (or p1/p100) series.
+"""
+import csv
+
+import numpy as np
+
+DT = 1.0
+# Value of Pi in the workbook (modMain.Pi); kept for identical reduction factors
+PI = 3.1416
+
+SHAPES = ('block rainfall', 'triangular (initial acc.)', 'triangular (middle acc.)', 'triangular (end acc.)',
+          'DVWK (initial acc.)', 'DVWK (middle acc.)', 'DVWK (end acc.)')
+# Shapes built from the intensity-duration curve, only available with a UWSeries
+EULER = ('Euler I', 'Euler II')
+
+
+def steps(duration):
+    """Number of simulation steps of a rainfall of duration [min] (rounded up)."""
+    return max(int(np.ceil(duration / DT - 1e-9)), 1)
+
+
+def shape_profile(shape, n):
+    """Unnormalised profile of the design shape (SHAPES) over n steps."""
+    j = np.arange(1, n + 1, dtype=np.float64)
+    if shape == SHAPES[0]:
+        return np.ones(n)
+    if shape == SHAPES[1]:
+        return np.where(j <= n // 3, 2 * j - 1, n + 0.5 - j)
+    if shape == SHAPES[2]:
+        return np.where(j <= n // 2, j - 0.5, n + 0.5 - j)
+    if shape == SHAPES[3]:
+        return np.where(j <= 2 * n // 3, j - 0.5, (n - j) * 2 + 1)
+    if shape == SHAPES[4]:
+        return np.select([j <= n // 6, j <= n // 3], [5.0, 2.0], 0.75)
+    if shape == SHAPES[5]:
+        return np.select([j <= 3 * n // 10, j <= n // 2], [20.0, 75.0], 18.0)
+    if shape == SHAPES[6]:
+        return np.select([j <= 2 * n // 3, j <= 5 * n // 6], [9.0, 24.0], 60.0)
+    raise ValueError('Unbekannte Niederschlagsverteilung: {} (möglich: {}).'.format(shape, ', '.join(SHAPES)))
+
+
+def design_rain(shape, intensity, duration):
+    """
+    Design hyetograph [mm/h per step] for the mean intensity [mm/h] and the
+    duration [min]. As in the workbook (clsUW.BemNS) the duration is rounded
+    up to whole steps and the profile is scaled to the mean intensity.
+    """
+    n = steps(duration)
+    profile = shape_profile(shape, n)
+    return profile * (intensity * n / profile.sum())
+
+
+def areal_reduction(duration, distance, mode='weak'):
+    """
+    Radial areal reduction factor for a rainfall of duration [min] at
+    distance [km] from the storm centre (scalars or arrays).
+
+    mode 'weak': Lorenz & Skoda (original ZEMOKOST), 'strong': Blöschl
+    (Regelblatt 220), both with the first-order Taylor correction of the
+    workbook. Factors are clipped at 0 far from the centre.
+    """
+    area = PI * np.asarray(distance, dtype=np.float64) ** 2
+    duration = steps(duration) * DT
+    if mode == 'weak':
+        a = -0.19 * duration ** -0.56 * area ** 0.5
+        factor = np.exp(a) * (1 + 0.5 * a)
+    elif mode == 'strong':
+        a = -0.41 * duration ** -0.43 * area ** 0.435
+        factor = np.exp(a) * (1 + 0.435 * a)
+    else:
+        raise ValueError('Unbekannte Abminderung: {} (möglich: weak, strong).'.format(mode))
+    return np.maximum(factor, 0.0)
+
+
+class UWSeries:
+    """
+    u/w series of the design rainfall (clsUW): for every duration [min] the
+    parameters of N(T) = u + w * ln(T) [mm]. The durations must be positive
+    and ascending, at least two.
+    """
+
+    def __init__(self, durations, u, w):
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.u = np.asarray(u, dtype=np.float64)
+        self.w = np.asarray(w, dtype=np.float64)
+        if not (len(self.durations) == len(self.u) == len(self.w)) or len(self.durations) < 2:
+            raise ValueError('u/w-Reihen: mindestens zwei Dauerstufen mit je einem u- und w-Wert erforderlich.')
+        if not np.isfinite(np.concatenate([self.durations, self.u, self.w])).all():
+            raise ValueError('u/w-Reihen: Dauerstufen, u- und w-Werte müssen Zahlen sein.')
+        if (self.durations <= 0).any() or (np.diff(self.durations) <= 0).any():
+            raise ValueError('u/w-Reihen: Dauerstufen müssen positiv und aufsteigend sein.')
+
+    @classmethod
+    def from_p(cls, durations, p1, p100):
+        """Series from the rainfall depths [mm] of the 1- and 100-year events."""
+        p1 = np.asarray(p1, dtype=np.float64)
+        return cls(durations, p1, (np.asarray(p100, dtype=np.float64) - p1) / np.log(100))
+
+    def intensity(self, return_period, duration):
+        """
+        Design intensity [mm/h] (clsUW.IBemessung), u and w interpolated
+        linearly between the durations and extrapolated with the outer
+        segments; beyond 100 years with the factor T^0.085 / 1.479.
+        """
+        t = np.asarray(return_period, dtype=np.float64)
+        d = np.asarray(duration, dtype=np.float64)
+        j = np.clip(np.searchsorted(self.durations, d, side='right') - 1, 0, len(self.durations) - 2)
+        frac = (d - self.durations[j]) / (self.durations[j + 1] - self.durations[j])
+        u = self.u[j] + (self.u[j + 1] - self.u[j]) * frac
+        w = self.w[j] + (self.w[j + 1] - self.w[j]) * frac
+        depth = np.where(t <= 100, u + w * np.log(np.minimum(t, 100)),
+                         (u + w * np.log(100)) / 1.479 * t ** 0.085)
+        return depth * 60 / d
+
+    def hyetograph(self, shape, return_period, duration):
+        """Design hyetograph [mm/h per step] of the shape (SHAPES or EULER)."""
+        intensity = float(self.intensity(return_period, duration))
+        if shape not in EULER:
+            return design_rain(shape, intensity, duration)
+        n = steps(duration)
+        j = np.arange(1, n + 1)
+        if shape == EULER[1]:
+            j0 = int(np.ceil(n * 0.3 - 1e-9))
+            j = np.where(j < j0, j0 - j, j)
+        profile = self.intensity(return_period, DT * j)
+        return profile * (intensity * n / profile.sum())
+
+
+def read_series(path):
+    """
+    Reads u/w or p1/p100 series from a CSV (';', decimal comma) with the
+    columns 'D [min]' and either 'u [mm]', 'w [mm]' or 'p1 [mm]', 'p100 [mm]'.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    columns = rows[0].keys() if rows else ()
+
+    def column(name):
+        return [float((row[name] or 'nan').strip().replace(',', '.')) for row in rows]
+
+    if 'D [min]' in columns and {'u [mm]', 'w [mm]'} <= set(columns):
+        return UWSeries(column('D [min]'), column('u [mm]'), column('w [mm]'))
+    if 'D [min]' in columns and {'p1 [mm]', 'p100 [mm]'} <= set(columns):
+        return UWSeries.from_p(column('D [min]'), column('p1 [mm]'), column('p100 [mm]'))
+    raise ValueError('{}: Spalten D [min] und u [mm]/w [mm] oder p1 [mm]/p100 [mm] erwartet.'.format(path))
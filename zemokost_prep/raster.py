@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+DEM access helpers.
+
+clip_dem reads the source DEM (e.g. the national 1 m COG) through a single
+gdal.Warp with the TEZG polygons as cutline. Only source blocks intersecting
+the cutline are fetched, GDAL picks a matching overview when the target cell
+size is coarser than the source, and the result is written as tiled,
+compressed GeoTIFF that WhiteboxTools can read (no floating point predictor,
+no sparse blocks).
+
+slope_percent replaces gdal:slope with the same Horn kernel computed on the
+array in memory.
+"""
+import math
+import os
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from zemokost_prep.threads import warp_options
+
+NODATA = 99999
+
+# The clipped DEM goes to WhiteboxTools, which reads neither PREDICTOR=3 nor missing (SPARSE_OK) blocks
+CREATION_OPTIONS = ['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
+
+def write_cutline(wkbs, srs_wkt, path, buffer=0.0):
+    """Writes the geometries (WKB) as GeoJSON cutline, optionally buffered."""
+    drv = ogr.GetDriverByName('GeoJSON')
+    if os.path.exists(path):
+        drv.DeleteDataSource(path)
+    srs = None
+    if srs_wkt:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(srs_wkt)
+    vds = drv.CreateDataSource(path)
+    vlyr = vds.CreateLayer('cutline', srs, ogr.wkbUnknown)
+    for wkb in wkbs:
+        geom = ogr.CreateGeometryFromWkb(bytes(wkb))
+        if buffer:
+            geom = geom.Buffer(buffer)
+        feat = ogr.Feature(vlyr.GetLayerDefn())
+        feat.SetGeometry(geom)
+        vlyr.CreateFeature(feat)
+    vds = None
+    return path
+
+
+def snapped_bounds(wkbs, geotransform, cellsize=None, buffer=0.0):
+    """
+    Bounding box of the geometries (plus buffer), snapped outwards to the grid
+    of geotransform (origin) with cell size cellsize (default: source cell size).
+    """
+    env = [math.inf, -math.inf, math.inf, -math.inf]
+    for wkb in wkbs:
+        minx, maxx, miny, maxy = ogr.CreateGeometryFromWkb(bytes(wkb)).GetEnvelope()
+        env = [min(env[0], minx), max(env[1], maxx), min(env[2], miny), max(env[3], maxy)]
+    res_x = cellsize or geotransform[1]
+    res_y = cellsize or abs(geotransform[5])
+    x0, y0 = geotransform[0], geotransform[3]
+    minx = x0 + math.floor((env[0] - buffer - x0) / res_x) * res_x
+    maxx = x0 + math.ceil((env[1] + buffer - x0) / res_x) * res_x
+    maxy = y0 - math.floor((y0 - env[3] - buffer) / res_y) * res_y
+    miny = y0 - math.ceil((y0 - env[2] + buffer) / res_y) * res_y
+    return minx, miny, maxx, maxy
+
+
+def clip_dem(dem, wkbs, out_path, cellsize=None, crs_wkt=None, buffer=0.0, resampling='average', threads=None,
+             cache_mb=0):
+    """
+    Clips the DEM to the geometries wkbs (in the CRS of the DEM) with a
+    cutline and crop to the (buffered) extent, on the grid of the DEM.
+    cellsize: target cell size (default: DEM cell size); coarser cells are
+    aggregated with resampling and read from overviews where available.
+    crs_wkt: CRS to assign if the DEM file has none.
+    threads: warp threads (default: all cores); cache_mb: warp memory [MB]
+    (0 = GDAL default).
+    Returns out_path (Float32, NoData 99999).
+    """
+    src = gdal.Open(str(dem))
+    if src is None:
+        raise ValueError('Raster konnte nicht geöffnet werden: {}'.format(dem))
+    wkbs = list(wkbs)
+    srs_wkt = src.GetProjection() or crs_wkt or ''
+    gt = src.GetGeoTransform()
+    res_x = cellsize or gt[1]
+    res_y = cellsize or abs(gt[5])
+
+    cut_path = os.path.splitext(out_path)[0] + '_cutline.geojson'
+    write_cutline(wkbs, srs_wkt, cut_path, buffer)
+    options = dict(format='GTiff', outputType=gdal.GDT_Float32, outputBounds=snapped_bounds(wkbs, gt, cellsize, buffer),
+                   xRes=res_x, yRes=res_y, cutlineDSName=cut_path, cropToCutline=False, dstNodata=NODATA,
+                   resampleAlg=resampling if cellsize else 'near', creationOptions=CREATION_OPTIONS,
+                   **warp_options(threads, cache_mb))
+    if not src.GetProjection() and crs_wkt:
+        options.update(srcSRS=crs_wkt, dstSRS=crs_wkt)
+    try:
+        ds = gdal.Warp(out_path, src, **options)
+        if ds is None:
+            raise ValueError('DEM konnte nicht zugeschnitten werden: {}'.format(dem))
+        ds = None
+    finally:
+        ogr.GetDriverByName('GeoJSON').DeleteDataSource(cut_path)
+    return out_path
+
+
+def slope_percent(dem, cellsize_x, cellsize_y=None):
+    """
+    Slope in percent with Horn's kernel (as gdaldem slope -p). Edge cells and
+    cells with a NaN neighbour are NaN, as gdaldem without -compute_edges.
+    """
+    cellsize_y = cellsize_y or cellsize_x
+    z = np.pad(dem.astype(np.float64), 1, constant_values=np.nan)
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cellsize_x)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * cellsize_y)
+    slope = 100 * np.sqrt(dzdx * dzdx + dzdy * dzdy)
+    slope[np.isnan(dem)] = np.nan
+    return slope.astype(np.float32)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Reprojection cache for the TEZG layer.
+
+The TEZG layer is reprojected into the CRS of every input layer (channels,
+fine channels, AKL, RKL, ZA) that differs from the DEM CRS, to clip or
+intersect the input in its own CRS. Inputs often share a CRS; the cache
+runs every distinct transform once per run, keyed by a fingerprint of the
+TEZG layer (geometries, attributes, CRS) and the target CRS. Every caller
+gets its own layer object on the cached GeoPackage, so the concurrent
+branches do not share a layer between threads. With a HydroCache the
+reprojected layers are also kept across runs (entries in CACHE_DIR).
+"""
+import hashlib
+import os
+import threading
+import uuid
+
+from qgis import processing
+from qgis.core import QgsVectorLayer
+
+REPROJECT_VERSION = 1
+
+
+def layer_fingerprint(layer):
+    """SHA-256 over the CRS, the field names and the geometries and attributes of all features of layer."""
+    h = hashlib.sha256()
+    h.update(layer.crs().toWkt().encode('utf-8'))
+    h.update(repr(layer.fields().names()).encode('utf-8'))
+    for feat in layer.getFeatures():
+        h.update(bytes(feat.geometry().asWkb()))
+        h.update(repr(feat.attributes()).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ReprojectionCache:
+    """
+    Reprojected copies of a layer per target CRS, e.g.
+
+        cache = ReprojectionCache(temp_folder, context)
+        clipTEZG = cache.layer(vlyr_tezg, gerinne.crs())
+
+    folder: working folder for the reprojected layers (temporary folder).
+    store: optional HydroCache for keeping the layers across runs.
+    """
+
+    def __init__(self, folder, context=None, feedback=None, store=None):
+        self.folder = folder
+        self.context = context
+        self.feedback = feedback
+        self.store = store
+        self.paths = {}
+        self.fingerprints = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def key(self, layer, crs):
+        fingerprint = self.fingerprints.get(layer.id())
+        if fingerprint is None:
+            fingerprint = self.fingerprints[layer.id()] = layer_fingerprint(layer)
+        h = hashlib.sha256('reproject-{}'.format(REPROJECT_VERSION).encode('utf-8'))
+        h.update(fingerprint.encode('utf-8'))
+        h.update(crs.toWkt().encode('utf-8'))
+        return h.hexdigest()
+
+    def path(self, layer, crs):
+        """GeoPackage of layer in crs; reprojects only on the first request of a (layer, CRS) pair."""
+        with self._lock:
+            key = self.key(layer, crs)
+            if key in self.paths:
+                self.hits += 1
+                return self.paths[key]
+            stored = self.store.get(key, ['tezg'], '.gpkg') if self.store is not None else None
+            if stored:
+                self.hits += 1
+                path = stored['tezg']
+            else:
+                path = os.path.join(self.folder, 'reproj_{}.gpkg'.format(uuid.uuid4().hex))
+                processing.run("native:reprojectlayer", {
+                    'INPUT': layer,
+                    'TARGET_CRS': crs,
+                    'OUTPUT': path}, context=self.context, feedback=self.feedback)
+                if self.store is not None:
+                    self.store.put_files(key, {'tezg': path}, '.gpkg')
+            self.paths[key] = path
+            return path
+
+    def layer(self, layer, crs, name=None):
+        """Own layer object on the reprojected copy of layer (or layer itself if it already is in crs)."""
+        if layer.crs() == crs:
+            return layer
+        return QgsVectorLayer(self.path(layer, crs), name or layer.name(), 'ogr')
+
+    def prepare(self, layer, crss):
+        """Runs the transforms of layer into all distinct CRS of crss up front (e.g. before the branches start)."""
+        for crs in crss:
+            if crs.isValid() and layer.crs() != crs:
+                self.path(layer, crs)
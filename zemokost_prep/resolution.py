@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Resolution report: F-Laenge and F-Neigung at the target cell size compared
+with the native resolution of the DEM.
+
+Both sides are computed with the same method, per buffered TEZG window
+(zemokost_prep.tiles): fill, flow length at ridges and slope of every window
+at the native and at the target cell size. The full-resolution DEM is never
+processed as one raster. Since the windows keep the DEM around the TEZG
+boundary, the target values can differ slightly from import_zemokost.csv of
+a run without TILED (whole-catchment hydrology, slope on the clipped DEM).
+"""
+import csv
+
+import numpy as np
+
+from zemokost_prep.tiles import tiled_metrics
+from zemokost_prep.zonal import ZonalTable
+
+REPORT_FILE = 'resolution_report.csv'
+
+REPORT_FIELDS = ['TEZG Nr.', 'Zellgroesse nativ [m]', 'Zellgroesse Ziel [m]',
+                 'F-Laenge nativ [m]', 'F-Laenge Ziel [m]', 'F-Laenge Abw. [%]',
+                 'F-Neigung nativ [1]', 'F-Neigung Ziel [1]', 'F-Neigung Abw. [%]']
+
+
+def window_table(wbt, dem, shapes, drainage_path, work_dir, cellsize=None, crs_wkt=None, feedback=None, threads=None,
+                 cache_mb=0):
+    """
+    ZonalTable with 'slpP' and 'flenM' per TEZG, computed per TEZG window at
+    cellsize (None = native resolution of the DEM).
+    """
+    shapes = list(shapes)
+    metrics = tiled_metrics(wbt, dem, shapes, drainage_path, work_dir, feedback=feedback, crs_wkt=crs_wkt,
+                            cellsize=cellsize, threads=threads, cache_mb=cache_mb, slope=True)
+    table = ZonalTable(np.array([tezg_id for tezg_id, _ in shapes]), {})
+    for name in ('slpP', 'flenM'):
+        table.set_stats(name, {tezg_id: values[name] for tezg_id, values in metrics.items()})
+    return table
+
+
+def _deviation(native, target):
+    if native is None or target is None or native == 0:
+        return ''
+    return str(round((target - native) / native * 100, 1)).replace('.', ',')
+
+
+def _fmt(value, digits):
+    if value is None:
+        return ''
+    return str(round(value, digits) if digits else round(value)).replace('.', ',')
+
+
+def write_report(path, ids, native, target, native_cellsize, target_cellsize):
+    """Writes the comparison per TEZG (csv, ';', decimal comma like import_zemokost.csv)."""
+    with open(path, mode='w', newline='') as f:
+        writer = csv.DictWriter(f, delimiter=';', fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for fid in sorted(ids, reverse=True):
+            flen_n, flen_t = native.value(fid, 'flenM', 'mean'), target.value(fid, 'flenM', 'mean')
+            slp_n, slp_t = native.value(fid, 'slpP', 'mean'), target.value(fid, 'slpP', 'mean')
+            slp_n = slp_n / 100 if slp_n is not None else None
+            slp_t = slp_t / 100 if slp_t is not None else None
+            writer.writerow({
+                'TEZG Nr.': fid,
+                'Zellgroesse nativ [m]': _fmt(native_cellsize, 3),
+                'Zellgroesse Ziel [m]': _fmt(target_cellsize, 3),
+                'F-Laenge nativ [m]': _fmt(flen_n, 0),
+                'F-Laenge Ziel [m]': _fmt(flen_t, 0),
+                'F-Laenge Abw. [%]': _deviation(flen_n, flen_t),
+                'F-Neigung nativ [1]': _fmt(slp_n, 3),
+                'F-Neigung Ziel [1]': _fmt(slp_t, 3),
+                'F-Neigung Abw. [%]': _deviation(slp_n, slp_t),
+            })
+    return path
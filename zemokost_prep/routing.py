@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Junction network of the K.O./K.U. columns of import_zemokost.csv.
+
+Every TEZG drains from its upper junction (K.O., 0 for a headwater TEZG) to
+its lower junction (K.U.). As in the workbook (clsEZG.KnotenEinlesen) the
+network must be a tree: every K.O. junction is fed by at least one TEZG and
+drains through exactly one TEZG, there is exactly one outlet (the K.U.
+junction that is no K.O.) and no loops. network_problems() lists every
+violation with the TEZG and junctions involved (row_problems() for the rows
+written by the preparation tools); RoutingGraph raises them as one
+ValueError.
+
+RoutingGraph orders the TEZG from the headwaters to the outlet, level by
+level (all TEZG of a junction share a level), and within a level by lower
+junction, so the hydrographs of a level are summed per junction with one
+np.add.reduceat over contiguous segments.
+"""
+import numpy as np
+
+
+def parse_junction(value):
+    """Junction number from a K.O./K.U. cell (int, float or text with decimal comma, e.g. '10,0')."""
+    text = str(value).strip().replace(',', '.') if value is not None else ''
+    try:
+        number = float(text)
+    except ValueError:
+        number = np.nan
+    if not np.isfinite(number) or number != int(number):
+        raise ValueError('Knotennummer muss eine ganze Zahl sein: {!r}.'.format(value))
+    return int(number)
+
+
+def junction_numbers(values):
+    """Junction numbers (int64 array) of a K.O./K.U. column."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64)
+    return np.array([parse_junction(value) for value in values.ravel()], dtype=np.int64).reshape(values.shape)
+
+
+def _join(values):
+    return ', '.join(str(v) for v in values)
+
+
+def network_problems(ids, ko, ku):
+    """Violations of the tree structure of the junction network as list of messages (empty if valid)."""
+    ids = np.asarray(ids)
+    ko = junction_numbers(ko)
+    ku = junction_numbers(ku)
+    problems = []
+    for invalid, message in ((ku <= 0, 'K.U. muss größer als 0 sein'),
+                             (ko < 0, 'K.O. darf nicht negativ sein'),
+                             ((ko == ku) & (ko != 0), 'K.O. und K.U. sind derselbe Knoten')):
+        if invalid.any():
+            problems.append('TEZG {}: {}.'.format(_join(ids[invalid]), message))
+
+    lower = set(ku.tolist())
+    upper, counts = np.unique(ko[ko != 0], return_counts=True)
+    for junction in upper[counts > 1]:
+        problems.append('Knoten {} ist K.O. mehrerer TEZG ({}); jeder Knoten darf nur über ein TEZG '
+                        'abfließen.'.format(junction, _join(ids[ko == junction])))
+    for junction in upper:
+        if junction not in lower:
+            problems.append('Knoten {} (K.O. von TEZG {}) hat kein zufließendes TEZG.'.format(
+                junction, _join(ids[ko == junction])))
+
+    outlets = sorted(lower - set(upper.tolist()))
+    if not outlets:
+        problems.append('Kein Auslassknoten gefunden: jeder K.U.-Knoten ist K.O. eines TEZG.')
+    elif len(outlets) > 1:
+        problems.append('Mehrere Auslassknoten: {}.'.format('; '.join(
+            '{} (TEZG {})'.format(junction, _join(ids[ku == junction])) for junction in outlets)))
+
+    # TEZG that do not reach an outlet lie on or above a loop
+    below = {}
+    for n in np.flatnonzero(ko != 0):
+        below.setdefault(int(ko[n]), n)
+    reached = np.isin(ku, outlets)
+    front = ko[reached]
+    while front.size:
+        members = np.isin(ku, front[front != 0]) & ~reached
+        reached |= members
+        front = ko[members]
+    loops = []
+    for n in np.flatnonzero(~reached):
+        path, junction = [], int(ku[n])
+        while junction in below and junction not in path:
+            path.append(junction)
+            junction = int(ku[below[junction]])
+        if junction in path:
+            loop = path[path.index(junction):]
+            start = loop.index(min(loop))
+            loop = loop[start:] + loop[:start]
+            if loop not in loops:
+                loops.append(loop)
+    on_loop = np.zeros(len(ids), dtype=bool)
+    for loop in loops:
+        on_loop |= np.isin(ko, loop)
+        problems.append('Schleife im Knotennetz: {} (TEZG {}).'.format(
+            ' -> '.join(str(j) for j in loop + loop[:1]), _join(ids[np.isin(ko, loop)])))
+    if (~reached & ~on_loop).any() and len(outlets) == 1:
+        problems.append('TEZG {} erreichen den Auslassknoten {} nicht.'.format(
+            _join(ids[~reached & ~on_loop]), outlets[0]))
+    return problems
+
+
+def row_problems(rows):
+    """network_problems() of import_zemokost.csv rows (dicts with 'TEZG Nr.', 'K.O.', 'K.U.')."""
+    ids, ko, ku, problems = [], [], [], []
+    for row in rows:
+        try:
+            ko.append(parse_junction(row['K.O.']))
+            ku.append(parse_junction(row['K.U.']))
+            ids.append(row['TEZG Nr.'])
+        except ValueError as e:
+            problems.append('TEZG {}: {}'.format(row['TEZG Nr.'], e))
+    return problems or network_problems(np.array(ids), ko, ku)
+
+
+class RoutingGraph:
+    """
+    Validated junction network (one entry per TEZG in ids/ko/ku order).
+
+    junctions: sorted junction numbers (K.U.); outlet: outlet junction;
+    ku_index/ko_index: position of K.U./K.O. in junctions (-1 for
+    headwaters); level: 0 for the TEZG draining to the outlet, increasing
+    upstream; order: TEZG positions from the headwaters to the outlet;
+    levels: per level from the headwaters, (tezg, starts, targets) with the
+    TEZG positions grouped by lower junction, the start of every group within
+    tezg and the junction index the group drains to.
+    """
+
+    def __init__(self, ids, ko, ku):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.ko = junction_numbers(ko)
+        self.ku = junction_numbers(ku)
+        problems = network_problems(self.ids, self.ko, self.ku)
+        if problems:
+            raise ValueError('K.O./K.U.: ' + ' '.join(problems))
+
+        self.junctions = np.unique(self.ku)
+        self.outlet = int(np.setdiff1d(self.junctions, self.ko)[0])
+        self.ku_index = np.searchsorted(self.junctions, self.ku)
+        self.ko_index = np.where(self.ko != 0, np.searchsorted(self.junctions, self.ko), -1)
+
+        level = np.full(len(self.ku), -1, dtype=np.int64)
+        front, depth = np.array([self.outlet]), 0
+        while front.size:
+            members = np.isin(self.ku, front)
+            level[members] = depth
+            front = self.ko[members & (self.ko != 0)]
+            depth += 1
+        self.level = level
+        self.order = np.lexsort((self.ku, -level))
+
+        self.levels = []
+        bounds = np.searchsorted(-level[self.order], np.arange(-(depth - 1), 1), side='left')
+        for start, stop in zip(bounds, np.append(bounds[1:], len(self.order))):
+            tezg = self.order[start:stop]
+            ku = self.ku_index[tezg]
+            starts = np.flatnonzero(np.r_[True, ku[1:] != ku[:-1]])
+            self.levels.append((tezg, starts, ku[starts]))
+
+    def __len__(self):
+        return len(self.ids)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Runs one preparation algorithm headless and collects a run report
+(status, run time, results, warnings, errors). Used by the CLI and the
+batch mode.
+"""
+import logging
+import shutil
+import tempfile
+import time
+
+from qgis.core import QgsProcessingContext, QgsProcessingFeedback
+
+from zemokost_prep import qgis_env
+
+log = logging.getLogger('zemokost_prep')
+
+
+class ReportFeedback(QgsProcessingFeedback):
+    """Processing feedback writing to the zemokost_prep logger and collecting warnings and errors."""
+
+    def __init__(self):
+        super().__init__()
+        self.warnings = []
+        self.errors = []
+
+    def pushInfo(self, info):
+        super().pushInfo(info)
+        log.info(info)
+
+    def pushWarning(self, warning):
+        super().pushWarning(warning)
+        self.warnings.append(warning)
+        log.warning(warning)
+
+    def reportError(self, error, fatalError=False):
+        super().reportError(error, fatalError)
+        self.errors.append(error)
+        log.error(error)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'ja')
+    return bool(value)
+
+
+def algorithm_parameters(alg, values):
+    """
+    Maps values {key: value} onto the parameter names of alg (keys are
+    case-insensitive); None and empty strings are treated as not set.
+    """
+    by_key = {str(k).upper(): v for k, v in values.items()}
+    params = {}
+    for definition in alg.parameterDefinitions():
+        value = by_key.get(definition.name().upper())
+        if value is None or value == '':
+            continue
+        if definition.type() == 'boolean':
+            value = to_bool(value)
+        params[definition.name()] = value
+    return params
+
+
+def run_algorithm(name, values, temp_folder=None, feedback=None):
+    """
+    Runs the preparation algorithm name (see qgis_env.ALGORITHMS) in the
+    current, QGIS-initialised process. Temporary outputs go to temp_folder
+    (a new folder, removed afterwards, if not given).
+    Returns the run report as dict.
+    """
+    from qgis import processing  # needs the processing plugin path (qgis_env.start_qgis)
+
+    feedback = feedback or ReportFeedback()
+    own_temp = temp_folder is None
+    if own_temp:
+        temp_folder = tempfile.mkdtemp(prefix='zemokost_')
+    report = {'algorithm': name, 'status': 'ok', 'seconds': 0.0, 'results': {}, 'warnings': [], 'errors': []}
+    start = time.perf_counter()
+    try:
+        alg = qgis_env.algorithm(name)
+        context = QgsProcessingContext()
+        context.setTemporaryFolder(temp_folder)
+        results = processing.run(alg, algorithm_parameters(alg, values), context=context, feedback=feedback)
+        report['results'] = {k: v if isinstance(v, (str, int, float, bool, list)) or v is None else str(v)
+                             for k, v in results.items()}
+    except Exception as e:
+        report['status'] = 'failed'
+        report['errors'].append('{}: {}'.format(type(e).__name__, e))
+        log.exception('Aufbereitung fehlgeschlagen')
+    finally:
+        report['seconds'] = round(time.perf_counter() - start, 1)
+        if own_temp:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+    report['warnings'] = list(getattr(feedback, 'warnings', []))
+    report['errors'] = list(getattr(feedback, 'errors', [])) + report['errors']
+    return report
+
+
+def output_path(report):
+    """Path of the written CSV from a run report."""
+    results = report.get('results', {})
+    return results.get('OUTPUT') or results.get('OUTPUT_CSV') or ''
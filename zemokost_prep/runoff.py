@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+"""
+ZEMOKOST runoff simulation on import_zemokost.csv.
+
+Port of the sub-catchment and junction simulation of the ZEMOKOST workbook
+(ZEMOKOST-2_0_1.xlsm: clsTEZG, clsAbflTEZG, clsAbflKnoten, clsEreignis) to
+NumPy. All sub-catchments are simulated together on arrays over (time step x
+sub-catchment) with the workbook step DT = 1 min:
+
+- overland flow: kinematic wave on the slope (v = cvOB * h²) with adaptive
+  sub-steps, starting at the initial abstraction t0; once the rain has ended
+  and 90 % of the effective rainfall has left the slope, an exponential
+  recession; then the linear storage with tOB of the maximum intensity
+- interflow (ZAF 1 bis 7, Anteil [%]): transport with constant velocity, a
+  moving sum over the travel time
+- natural retention (Nat. Ret.[%]): linear storage
+- channel (G-Laenge, G-Neigung, d90): moving average over the Rickenmann
+  travel time of the mean channel discharge, plus the hydrograph of the
+  upper junction (K.O.) shifted by the same time
+
+The junction hydrographs are summed level by level from the headwaters to
+the outlet. Detention basins, inflows/outflows and return flows of the
+workbook are not part of import_zemokost.csv and are not simulated. There is
+no limit on the number of sub-catchments.
+
+Leading batch dimensions of the rainfall, offset, reduction or catchment
+arrays are simulated in one pass (e.g. several durations at once).
+
+    catchment = read_catchment('import_zemokost.csv', defaults={'d90 [m]': 0.1})
+    result = simulate(catchment, design_rain('block rainfall', 60.0, 30))
+    result.peaks()  # {junction: (Qmax [m³/s], tmax [min], volume [m³])}
+
+From the command line (peaks per junction as CSV):
+
+    python -m zemokost_prep simulate import_zemokost.csv --shape "block rainfall" --intensity 60 --duration 30
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from zemokost_prep.rainfall import DT, SHAPES, design_rain
+from zemokost_prep.routing import RoutingGraph, junction_numbers
+
+N_STEPS = 11520  # default simulation length of the workbook [steps]
+
+PSI_AKL = {'b': (0.001, 0.01, 10, 30, 50, 75, 100),
+           'm': (0.001, 5, 20, 40, 62.5, 87.5, 100),
+           't': (0.001, 10, 30, 50, 75, 100, 100)}
+C_RKL = {'b': (0.001, 0.02, 0.04, 0.06, 0.08, 0.1),
+         'm': (0.01, 0.03, 0.05, 0.07, 0.09, 0.11),
+         't': (0.02, 0.04, 0.06, 0.08, 0.1, 0.12)}
+C_ZAF = (0.1, 0.6, 1, 6, 100, 1e4, 1e5)
+KF = 1e-5  # fixed seepage rate of the natural retention [m/s]
+K_NEW = 0.9
+
+AKL_COLUMNS = ['AKL-{}'.format(i) for i in range(7)]
+RKL_COLUMNS = ['RKL-{}'.format(i) for i in range(1, 7)]
+REQUIRED = ['TEZG Nr.', 'K.O.', 'K.U.', 'Flaeche [km2]', 'F-Laenge [m]', 'F-Neigung [1]'] + AKL_COLUMNS + \
+    RKL_COLUMNS + ['G-Laenge [m]', 'G-Neigung [1]', 'd90 [m]']
+OPTIONAL = ['X', 'Y', 'Nat. Ret.[%]', 'Basisabfl. [m3/s]', 'ZAF 1 bis 7', 'Anteil [%]']
+
+
+def _number(text):
+    text = (text or '').strip()
+    return float(text.replace(',', '.')) if text else np.nan
+
+
+class Catchment:
+    """
+    Sub-catchment table of import_zemokost.csv as arrays (one entry per TEZG).
+
+    Attributes: ids, ko, ku (int), names, x, y, area [km²], length [m],
+    slope [1], natret [%], qbasis [m³/s], akl (n, 7), rkl (n, 6), zaf,
+    anteil [%], ch_length [m], ch_slope [1], d90 [m]; empty optional values
+    are NaN. The numeric arrays may carry leading batch dimensions (see copy).
+    The junction network (graph) is built on first use and shared by copies.
+    """
+
+    FIELDS = ('x', 'y', 'area', 'length', 'slope', 'natret', 'qbasis', 'akl', 'rkl', 'zaf', 'anteil',
+              'ch_length', 'ch_slope', 'd90')
+
+    def __init__(self, ids, ko, ku, names=None, **values):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.ko = junction_numbers(ko)
+        self.ku = junction_numbers(ku)
+        self._graph = None
+        self.names = list(names) if names is not None else [''] * len(self.ids)
+        for field in self.FIELDS:
+            setattr(self, field, np.asarray(values[field], dtype=np.float64))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def copy(self, **changes):
+        """Copy with some arrays replaced, e.g. copy(akl=akl) with akl of shape (realisations, n, 7)."""
+        values = {field: changes.get(field, getattr(self, field)) for field in self.FIELDS}
+        catchment = Catchment(self.ids, self.ko, self.ku, self.names, **values)
+        catchment._graph = self._graph
+        return catchment
+
+    @property
+    def graph(self):
+        """Validated junction network (routing.RoutingGraph) of the K.O./K.U. columns."""
+        if self._graph is None:
+            self._graph = RoutingGraph(self.ids, self.ko, self.ku)
+        return self._graph
+
+
+def read_catchment(path, defaults=None):
+    """
+    Reads import_zemokost.csv (';', decimal comma). defaults: values for
+    empty cells per column, e.g. {'d90 [m]': 0.1}; d90 is not written by the
+    preparation. Empty required values without default raise a ValueError.
+    """
+    defaults = defaults or {}
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    if not rows:
+        raise ValueError('{} enthält keine TEZG.'.format(path))
+    missing = [name for name in REQUIRED + OPTIONAL if name not in rows[0]]
+    if missing:
+        raise ValueError('Spalten fehlen in {}: {}'.format(path, ', '.join(missing)))
+
+    columns = {}
+    for name in ('K.O.', 'K.U.'):
+        try:
+            columns[name] = junction_numbers([row[name] for row in rows])
+        except ValueError as e:
+            raise ValueError('Spalte {}: {}'.format(name, e))
+    for name in REQUIRED + OPTIONAL:
+        if name in columns:
+            continue
+        values = np.array([_number(row[name]) for row in rows])
+        if name in defaults:
+            values[np.isnan(values)] = defaults[name]
+        if name in REQUIRED and np.isnan(values).any():
+            empty = [row['TEZG Nr.'] for row, v in zip(rows, values) if np.isnan(v)]
+            raise ValueError('Spalte {} ist leer für TEZG {}.'.format(name, ', '.join(empty)))
+        columns[name] = values
+
+    return Catchment(
+        ids=columns['TEZG Nr.'], ko=columns['K.O.'], ku=columns['K.U.'],
+        names=[row.get('Bezeichnung/Ergaenzung') or '' for row in rows],
+        x=columns['X'], y=columns['Y'], area=columns['Flaeche [km2]'], length=columns['F-Laenge [m]'],
+        slope=columns['F-Neigung [1]'], natret=columns['Nat. Ret.[%]'], qbasis=columns['Basisabfl. [m3/s]'],
+        akl=np.column_stack([columns[c] for c in AKL_COLUMNS]),
+        rkl=np.column_stack([columns[c] for c in RKL_COLUMNS]),
+        zaf=columns['ZAF 1 bis 7'], anteil=columns['Anteil [%]'], ch_length=columns['G-Laenge [m]'],
+        ch_slope=columns['G-Neigung [1]'], d90=columns['d90 [m]'])
+
+
+def _check(ids, invalid, message):
+    invalid = np.asarray(invalid).reshape(-1, len(ids)).any(axis=0)
+    if invalid.any():
+        raise ValueError('TEZG {}: {}'.format(', '.join(str(i) for i in ids[invalid]), message))
+
+
+def parameters(catchment, akl_mode='m', rkl_mode='m', szi=0.0):
+    """
+    Model constants per sub-catchment (clsTEZG.DatenAendern). akl_mode and
+    rkl_mode select the lower bound ('b'), centre ('m') or upper bound ('t')
+    of the classes, szi [min] shifts the initial abstraction.
+    """
+    if akl_mode not in PSI_AKL or rkl_mode not in C_RKL:
+        raise ValueError('Bandbreite der AKL/RKL muss b, m oder t sein.')
+    c = catchment
+    ids = c.ids
+    unique, counts = np.unique(ids, return_counts=True)
+    _check(ids, np.isin(ids, unique[counts > 1]), 'TEZG Nr. ist doppelt vergeben.')
+    _check(ids, ~(c.area > 0), 'Fläche muss größer als 0 sein.')
+    _check(ids, ~(c.length > 0), 'F-Laenge muss größer als 0 sein.')
+    _check(ids, ~(c.slope > 0), 'F-Neigung muss größer als 0 sein.')
+    _check(ids, ~(c.ch_length > 0), 'G-Laenge muss größer als 0 sein.')
+    _check(ids, ~(c.ch_slope > 0), 'G-Neigung muss größer als 0 sein.')
+    _check(ids, ~(c.d90 > 0), 'd90 muss größer als 0 sein.')
+    _check(ids, (c.akl < 0).any(axis=-1) | ~(c.akl.sum(axis=-1) > 0),
+           'AKL-Anteile müssen >= 0 sein, mindestens einer > 0.')
+    _check(ids, (c.rkl < 0).any(axis=-1) | ~(c.rkl.sum(axis=-1) > 0),
+           'RKL-Anteile müssen >= 0 sein, mindestens einer > 0.')
+    _check(ids, (c.natret < 0) | (c.natret > 100), 'Nat. Ret. muss zwischen 0 und 100 % liegen.')
+    _check(ids, c.qbasis < 0, 'Basisabfluss muss >= 0 sein.')
+
+    area = c.area * 1e6
+    cos_alpha = np.cos(np.arctan(c.slope))
+    psi100 = (c.akl / c.akl.sum(axis=-1, keepdims=True) * np.array(PSI_AKL[akl_mode])).sum(axis=-1) / 100
+    rough = (c.rkl / c.rkl.sum(axis=-1, keepdims=True) * np.array(C_RKL[rkl_mode])).sum(axis=-1)
+    natret = np.nan_to_num(c.natret) / 100
+
+    anteil = np.nan_to_num(c.anteil) / 100
+    anteil = np.where((anteil > 1) & (anteil < 1.01), 1.0, anteil)
+    flag_if = (psi100 < 1) & (anteil > 0)
+    _check(ids, flag_if & ((anteil > 1) | ~((c.zaf >= 1) & (c.zaf <= 7))),
+           'Anteil muss zwischen 0 und 100 %, ZAF zwischen 1 und 7 liegen.')
+    zaf = np.where(flag_if, c.zaf, 1.0)
+    lower = np.clip(np.floor(zaf).astype(np.int64), 1, 7)
+    c_zaf = np.array((0.0,) + C_ZAF + (C_ZAF[-1],))
+    c_if = np.where(lower < 7, c_zaf[lower] * np.exp((zaf - lower) * np.log(c_zaf[lower + 1] / c_zaf[lower])),
+                    C_ZAF[-1])
+    v_if = (c.length * anteil * (1 - psi100) * 100) ** (2 / 3) * c.slope ** (1 / 3) / (527 * c_if * 60)
+
+    steep = c.ch_slope > 0.008
+    return {
+        'area': area,
+        'length': c.length,
+        'width': area / c.length,
+        'psi100': psi100,
+        'ct_ob': 527 * rough * (c.length / (c.slope * cos_alpha)) ** (1 / 3),
+        'cv_ob': 60000.0 ** 2 * c.slope * cos_alpha / (527 * rough) ** 3,
+        'szi': np.full(psi100.shape, float(szi)),
+        'flag_if': flag_if,
+        'anteil': np.where(flag_if, anteil, 0.0),
+        'v_if': np.where(flag_if, v_if, 0.0),
+        'dq_natret': natret * area * KF,
+        'qbasis': np.nan_to_num(c.qbasis),
+        'ch_length': c.ch_length,
+        'exp_rick': np.where(steep, 0.34, 0.29),
+        'konst_ge': np.where(steep, 0.37 * 9.807 ** 0.33 * c.ch_slope ** 0.2 / c.d90 ** 0.35,
+                             0.96 * 9.807 ** 0.36 * c.ch_slope ** 0.35 / c.d90 ** 0.23),
+    }
+
+
+def nat_ret_constant(q_ob, t_ob, dq, k=1.0):
+    """
+    Storage constant of the natural retention (clsTEZG.BerechnecNatRet):
+    the overland flow q_ob is reduced by dq at t = (k + 1) * t_ob.
+    """
+    dq = min(dq, 0.95 * q_ob)
+    c = np.log(q_ob / dq) / ((k + 1) * t_ob) * np.arange(1, 10001) / 10000
+    err = np.abs((1 - np.exp(-c * t_ob)) / c - t_ob * dq / q_ob * np.exp(c * k * t_ob))
+    best = int(np.argmin(err))
+    return c[best] if err[best] < 1000 else 0.0
+
+
+def _psi_ns(ir, psi100):
+    """Runoff coefficient for the intensity ir [mm/h] (not capped)."""
+    with np.errstate(over='ignore'):
+        return psi100 * (0.7 + 0.3 * psi100) * (
+            1 - np.exp(-0.03 * np.exp(0.1 * np.exp(psi100 * 3.3) * ir ** (1 - 0.7 * psi100)))
+            + 0.0035 * (1 - psi100) * ir)
+
+
+def _surface(p, rain, rain_steps, rows, offset, reduction, n_steps):
+    """
+    Discharge after the natural retention (QNR) of all lanes (flattened
+    batch x sub-catchment), shape (n_steps, lanes); p holds the flattened
+    parameters. rain (rows, n_rain) holds the unreduced hyetographs with
+    rain_steps steps each, rows the hyetograph of every lane.
+    """
+    nl = len(rows)
+    n_rain = rain.shape[1]
+    lanes = np.arange(nl)
+    psi100 = p['psi100']
+    area = p['area']
+    n_ns = offset + rain_steps[rows]  # step with the end of the rain
+    i_max = reduction * rain.max(axis=1)[rows]
+
+    # Spatial discretisation; the slope cells are right-aligned in h, the
+    # column left of the first cell of a lane is its (empty) upper boundary.
+    n_cells = np.maximum(np.rint(10 * np.log10(p['length'])), 10).astype(np.int64)
+    n_max = int(n_cells.max())
+    dl = p['length'] / n_cells
+    cells = np.arange(n_max + 1)[None, :] > (n_max - n_cells)[:, None]
+    h = np.zeros((nl, n_max + 1))
+    cv_max = dl / 180
+    cv_new = cv_max * K_NEW
+    c_sim = p['cv_ob'] / dl
+    cv_s = p['cv_ob'] / 60
+    c_out = cv_s * p['width'] / DT
+
+    flag_if = p['flag_if']
+    steps_if = np.ones(nl, dtype=np.int64)
+    steps_if[flag_if] = np.ceil(p['length'][flag_if] / (p['v_if'][flag_if] * 60)).astype(np.int64)
+    c_if = np.where(flag_if, p['anteil'] / (60000 * 60 * steps_if), 0.0) * area
+    q_if_in = np.zeros((n_steps + 1, nl)) if flag_if.any() else None
+
+    # Linear storage of the overland flow and natural retention from the maximum intensity
+    d_lin = np.ones(nl)
+    d_nr = np.ones(nl)
+    wet = (i_max > 0) & (psi100 > 0)
+    psi_max = _psi_ns(i_max, psi100)
+    t_ob = np.where(wet, p['ct_ob'] / np.where(wet, psi_max * i_max, 1) ** (2 / 3), 11520.0)
+    d_lin[wet] = 1 - np.exp(-DT / t_ob[wet])
+    q_ob_max = i_max * psi_max * area / (60000 * 60)
+    for lane in np.flatnonzero(wet & (p['dq_natret'] > 0)):
+        d_nr[lane] = 1 - np.exp(-DT * nat_ret_constant(q_ob_max[lane], t_ob[lane], p['dq_natret'][lane]))
+
+    q = np.zeros((n_steps + 1, nl))  # row i: overland flow of step i
+    flag_ns = n_ns > 0
+    started = np.zeros(nl, dtype=bool)
+    start_now = np.zeros(nl, dtype=bool)
+    ob_sim = np.ones(nl, dtype=bool)
+    t0 = n_ns * DT + DT
+    i0 = n_ns + 1
+    v_fracht = np.zeros(nl)
+    v_out = np.zeros(nl)
+    v_end = np.zeros(nl)
+    i_end = np.zeros(nl, dtype=np.int64)
+    a_end = np.zeros(nl)
+    rain_rate = np.zeros(nl)
+
+    for i in range(1, n_steps + 1):
+        t = (i - 1) * DT
+        t_top = i * DT
+        start_now[:] = False
+        rain_rate[:] = 0
+        ns = np.flatnonzero(flag_ns)
+        if ns.size:
+            k = i - 1 - offset[ns]
+            ir = np.where((k >= 0) & (k < rain_steps[rows[ns]]),
+                          reduction[ns] * rain[rows[ns], np.clip(k, 0, n_rain - 1)], 0.0)
+            psi = np.where(ir > 0, np.minimum(_psi_ns(ir, psi100[ns]), 1.0), 0.0)
+            # Initial abstraction: sliding minimum of t + t0(PsiNS) until it is reached
+            update = ~started[ns] & (psi > 0)
+            if update.any():
+                u = ns[update]
+                t_new = t + np.maximum(-7.05 * np.log(psi[update]) + 6.14 + p['szi'][u], 0)
+                better = t_new < t0[u]
+                u = u[better]
+                t0[u] = t_new[better]
+                i0[u] = np.floor(t0[u] / DT).astype(np.int64) + 1
+            now = i0[ns] == i
+            start_now[ns[now]] = True
+            started[ns[now]] = True
+            dt_ob = np.where(now, t_top - t0[ns], DT)
+            wet = started[ns]
+            rain_rate[ns] = np.where(wet, psi * ir / 60000, 0.0)
+            v_fracht[ns] += dt_ob * rain_rate[ns] * area[ns]
+            if q_if_in is not None:
+                q_if_in[i, ns] = np.where(wet, c_if[ns] * dt_ob * (1 - psi) * ir, 0.0)
+            ending = ns[n_ns[ns] == i]
+            flag_ns[ending] = False
+            v_end[ending] = 0.9 * v_fracht[ending]
+
+        # Overland flow with adaptive sub-steps (dtOB * v <= dL / 180 at the lower end)
+        sim = np.flatnonzero(ob_sim & started)
+        idx = sim
+        tt = np.where(start_now[idx], t0[idx], t)
+        while idx.size:
+            dt_ob = t_top - tt
+            hn = h[idx, -1]
+            v = cv_s[idx] * hn ** 2
+            flag = dt_ob * v > cv_max[idx]
+            dt_ob = np.where(flag, cv_new[idx] / np.where(flag, v, 1), dt_ob)
+            while True:
+                dr = dt_ob * rain_rate[idx]
+                v = cv_s[idx] * (hn + dr) ** 2
+                shrink = dt_ob * v > cv_max[idx]
+                if not shrink.any():
+                    break
+                dt_ob = np.where(shrink, dt_ob * K_NEW, dt_ob)
+                flag |= shrink
+            hh = h[idx]
+            h3 = hh ** 3
+            c = (dt_ob * c_sim[idx])[:, None]
+            q[i, idx] += dt_ob * c_out[idx] * h3[:, -1]
+            hh[:, 1:] += dr[:, None] + c * h3[:, :-1] - c * h3[:, 1:]
+            h[idx] = np.where(cells[idx], np.maximum(hh, 0), 0)
+            tt = tt + dt_ob
+            idx, tt = idx[flag], tt[flag]
+
+        # Exponential recession once the rain has ended and 90 % of the effective rain left the slope
+        if sim.size:
+            v_out[sim] += DT * 60 * q[i, sim]
+            finish = sim[~flag_ns[sim] & (v_out[sim] > v_end[sim])]
+            if finish.size:
+                rest = v_fracht[finish] - v_out[finish]
+                with np.errstate(divide='ignore'):
+                    a_end[finish] = np.where(rest > 0, np.log(1 + 60 * q[i, finish] / np.where(rest > 0, rest, 1)),
+                                             np.inf)
+                i_end[finish] = i
+                ob_sim[finish] = False
+        if not flag_ns.any() and not (ob_sim & started).any():
+            break
+
+    tail = np.flatnonzero(~ob_sim)
+    if tail.size:
+        q_end = q[i_end[tail], tail]
+        for r0 in range(int(i_end[tail].min()) + 1, n_steps + 1, 1024):
+            r1 = min(r0 + 1024, n_steps + 1)
+            lag = np.arange(r0, r1)[:, None] - i_end[tail]
+            with np.errstate(invalid='ignore'):
+                recession = q_end * np.exp(-a_end[tail] * np.maximum(lag, 0))
+            q[r0:r1, tail] = np.where(lag > 0, recession, q[r0:r1, tail])
+
+    if q_if_in is not None:
+        # QIF(i) = sum of the interflow inputs of steps i - steps_if + 1 .. i - 1
+        cum = np.cumsum(q_if_in, axis=0, out=q_if_in)
+        rows_i = np.arange(1, n_steps + 1)[:, None]
+        lower = rows_i - steps_if[None, :]
+        q_if = cum[rows_i - 1, lanes] - np.where(lower >= 0, cum[np.maximum(lower, 0), lanes], 0)
+    else:
+        q_if = None
+
+    # Linear storage (overland flow) and natural retention
+    q_basis = p['qbasis']
+    keep_lin = 1 - d_lin
+    keep_nr = 1 - d_nr
+    ob = np.zeros(nl)
+    nr = q_basis.copy()
+    for i in range(n_steps):
+        ob = d_lin * q[i + 1] + keep_lin * ob
+        fl = ob + q_basis if q_if is None else ob + q_if[i] + q_basis
+        nr = d_nr * fl + keep_nr * nr
+        q[i + 1] = nr
+    return q[1:]
+
+
+class RunoffResult:
+    """
+    Junction hydrographs of a simulation. junctions: junction numbers
+    (K.U.); q: discharge [m³/s], shape (..., junction, step) (None if the
+    hydrographs were not kept); peak [m³/s], t_peak [min], volume [m³]:
+    shape (..., junction).
+    """
+
+    def __init__(self, junctions, q, peak, t_peak, volume):
+        self.junctions = junctions
+        self.q = q
+        self.peak = peak
+        self.t_peak = t_peak
+        self.volume = volume
+
+    def peaks(self):
+        """{junction: (Qmax, tmax, volume)} of an unbatched result."""
+        return {int(j): (float(p), float(t), float(v))
+                for j, p, t, v in zip(self.junctions, self.peak, self.t_peak, self.volume)}
+
+
+def simulate(catchment, rain, offset=0, reduction=1.0, akl_mode='m', rkl_mode='m', szi=0.0, n_steps=N_STEPS,
+             hydrographs=True, rain_steps=None):
+    """
+    Simulates the catchment for the hyetograph rain [mm/h per step].
+
+    rain: (n_rain,) for all sub-catchments, (n, n_rain) per sub-catchment or
+    with leading batch dimensions (..., n or 1, n_rain). offset [steps] and
+    reduction [factor] delay and scale the rain per sub-catchment (scalars or
+    arrays broadcasting to (..., n)). n_steps: simulation length (at most
+    11520 steps in the workbook). hydrographs=False keeps only peak, time to
+    peak and volume. rain_steps: rain duration [steps] per hyetograph (shape
+    of rain without the last axis) if hyetographs of different length are
+    zero-padded to one array; the end of the rain starts the recession.
+    """
+    p = parameters(catchment, akl_mode, rkl_mode, szi)
+    n = len(catchment)
+    rain = np.asarray(rain, dtype=np.float64)
+    if rain.ndim == 1:
+        rain = rain[None, :]
+    lead = rain.shape[:-1]
+    if rain_steps is None:
+        rain_steps = rain.shape[-1]
+    rain_steps = np.broadcast_to(np.asarray(rain_steps, dtype=np.int64), lead).reshape(-1)
+    offset = np.asarray(np.rint(np.asarray(offset, dtype=np.float64) / DT), dtype=np.int64)
+    reduction = np.asarray(reduction, dtype=np.float64)
+    shape = np.broadcast_shapes(p['psi100'].shape, lead, offset.shape, reduction.shape, (n,))
+    if shape[-1] != n:
+        raise ValueError('Niederschlag passt nicht zu {} TEZG.'.format(n))
+    batch = shape[:-1]
+    b = int(np.prod(batch, dtype=np.int64))
+
+    flat = {key: np.broadcast_to(value, shape).reshape(-1) for key, value in p.items()}
+    rows = np.broadcast_to(np.arange(int(np.prod(lead, dtype=np.int64))).reshape(lead), shape).reshape(-1)
+    qnr = _surface(flat, rain.reshape(-1, rain.shape[-1]), rain_steps, rows, np.broadcast_to(offset, shape).reshape(-1),
+                   np.broadcast_to(reduction, shape).reshape(-1), n_steps).reshape(n_steps, b, n)
+    qbasis = flat['qbasis'].reshape(b, n)
+    konst = flat['konst_ge'].reshape(b, n)
+    exp_rick = flat['exp_rick'].reshape(b, n)
+    ch_length = flat['ch_length'].reshape(b, n)
+
+    graph = catchment.graph
+    q_j = np.zeros((n_steps, b, len(graph.junctions)))
+    q_start = np.zeros((b, len(graph.junctions)))
+    rows_i = np.arange(1, n_steps + 1)[:, None, None]
+    for sel, starts, targets in graph.levels:
+        inflow = graph.ko_index[sel] >= 0
+        ko_idx = np.maximum(graph.ko_index[sel], 0)
+        q_ko = np.where(inflow, q_j[:, :, ko_idx], 0.0)
+        q_ko_start = np.where(inflow, q_start[:, ko_idx], 0.0)
+        qb = qbasis[:, sel]
+        qn = qnr[:, :, sel]
+        qv = ((qn + qb) * 0.5 + q_ko).max(axis=0)
+        flow = qv > 0
+        v = konst[:, sel] * np.where(flow, qv, 1) ** exp_rick[:, sel]
+        lag = np.where(flow, np.ceil(ch_length[:, sel] / (v * 60) / DT), 1).astype(np.int64)
+
+        # Moving average of QNR over the travel time (pre-history QBasis) plus the shifted upper junction
+        cum = np.concatenate([np.zeros((1,) + qn.shape[1:]), np.cumsum(qn, axis=0)])
+        back = rows_i - lag[None]
+        mean = (cum[1:] - np.take_along_axis(cum, np.maximum(back, 0), axis=0)
+                + np.maximum(-back, 0) * qb) / lag
+        shifted = np.where(back >= 1, np.take_along_axis(q_ko, np.maximum(back - 1, 0), axis=0), q_ko_start)
+        q_tezg = np.where(flow, mean + shifted, 0.0)
+        # The TEZG of a junction are contiguous in sel and all on this level
+        q_j[:, :, targets] = np.add.reduceat(q_tezg, starts, axis=2)
+        q_start[:, targets] = np.add.reduceat(q_ko_start + qb, starts, axis=1)
+
+    peak = q_j.max(axis=0).reshape(batch + (len(graph.junctions),))
+    t_peak = (q_j.argmax(axis=0) * DT).reshape(peak.shape)
+    volume = (q_j.sum(axis=0) * 60 * DT).reshape(peak.shape)
+    q = np.moveaxis(q_j, 0, -1).reshape(batch + (len(graph.junctions), n_steps)) if hydrographs else None
+    return RunoffResult(graph.junctions, q, peak, t_peak, volume)
+
+
+def write_peaks(result, path_or_file):
+    """Peaks per junction as CSV (';', decimal comma) like import_zemokost.csv."""
+    own = isinstance(path_or_file, str)
+    f = open(path_or_file, mode='w', newline='', encoding='utf-8') if own else path_or_file
+    try:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Knoten', 'Qmax [m3/s]', 'tmax [min]', 'Fracht [m3]'])
+        for junction, (peak, t_peak, volume) in result.peaks().items():
+            writer.writerow([junction] + [str(round(value, 3)).replace('.', ',') for value in (peak, t_peak, volume)])
+    finally:
+        if own:
+            f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zemokost_prep simulate',
+                                     description='ZEMOKOST-Abflusssimulation auf import_zemokost.csv')
+    parser.add_argument('csv', help='import_zemokost.csv')
+    parser.add_argument('--shape', default=SHAPES[0], choices=SHAPES, help='Niederschlagsverteilung')
+    parser.add_argument('--intensity', type=float, required=True, help='Mittlere Intensität [mm/h]')
+    parser.add_argument('--duration', type=float, required=True, help='Niederschlagsdauer [min]')
+    parser.add_argument('--akl', default='m', choices=('b', 'm', 't'), help='Bandbreite der AKL')
+    parser.add_argument('--rkl', default='m', choices=('b', 'm', 't'), help='Bandbreite der RKL')
+    parser.add_argument('--szi', type=float, default=0.0, help='Verschiebung der Anfangsverluste [min]')
+    parser.add_argument('--d90', type=float, default=None, help='d90 [m] für leere Zellen')
+    parser.add_argument('--steps', type=int, default=N_STEPS, help='Simulationsdauer [Schritte à 1 min]')
+    parser.add_argument('--output', default=None, help='Scheitelwerte als CSV (Standard: Konsole)')
+    args = parser.parse_args(argv)
+
+    catchment = read_catchment(args.csv, defaults={'d90 [m]': args.d90} if args.d90 is not None else None)
+    result = simulate(catchment, design_rain(args.shape, args.intensity, args.duration), akl_mode=args.akl,
+                      rkl_mode=args.rkl, szi=args.szi, n_steps=args.steps, hydrographs=False)
+    write_peaks(result, args.output or sys.stdout)
+    return 0
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Storm-cell scenarios: sweep of storm centres, directions and speeds.
+
+As in the workbook's "Radial (XY-coordinates)" areal reduction, the rain of
+every TEZG is reduced with its distance from the storm centre (TEZG
+centroids X/Y of import_zemokost.csv, rainfall.areal_reduction). The storm
+cell moves through the centre in the given direction (degrees clockwise from
+north, the direction it moves to) at the given speed [km/h]; every TEZG gets
+the time offset at which the cell reaches it along its track, counted from
+the first TEZG reached (offsets >= 0 as in the workbook).
+
+storm_scenarios() returns reduction and offset of all scenarios as arrays of
+shape (scenario, TEZG), which runoff.simulate takes as batch dimension;
+storm_sweep() simulates them in batches (optionally spread over worker
+processes) and reports the worst-case peak per junction and the scenario
+that causes it.
+
+    result = storm_sweep(catchment, design_rain('block rainfall', 60.0, 45), 45,
+                         centre_grid(catchment, 5), directions=range(0, 360, 45), speeds=(20, 40))
+    result.worst()  # {junction: (Qmax [m³/s], tmax [min], x, y, direction, speed)}
+
+    python -m zemokost_prep storm import_zemokost.csv --intensity 60 --duration 45 --grid 5 --d90 0.1
+"""
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from zemokost_prep.design import BATCH_LANES
+from zemokost_prep.rainfall import SHAPES, areal_reduction, design_rain
+from zemokost_prep.runoff import N_STEPS, read_catchment, simulate
+
+DIRECTIONS = tuple(range(0, 360, 45))
+SPEEDS = (20.0, 40.0)
+
+
+def centre_grid(catchment, n, margin=0.0):
+    """n x n storm centres [m] evenly over the extent of the TEZG centroids, widened by margin [m]."""
+    _check_xy(catchment)
+    xs = np.linspace(np.min(catchment.x) - margin, np.max(catchment.x) + margin, n)
+    ys = np.linspace(np.min(catchment.y) - margin, np.max(catchment.y) + margin, n)
+    return np.array([(x, y) for y in ys for x in xs])
+
+
+def _check_xy(catchment):
+    missing = ~(np.isfinite(catchment.x) & np.isfinite(catchment.y))
+    if missing.any():
+        raise ValueError('TEZG {}: X/Y fehlen (Schwerpunktkoordinaten für die radiale Abminderung).'.format(
+            ', '.join(str(i) for i in catchment.ids[missing])))
+
+
+def storm_scenarios(catchment, duration, centres, directions=DIRECTIONS, speeds=SPEEDS, mode='weak'):
+    """
+    All combinations of centres [(x, y) in m], directions [degrees] and
+    speeds [km/h], ordered (centre, direction, speed). Returns the scenario
+    table (x, y, direction, speed; shape (scenario, 4)) and reduction
+    [factor] and offset [min] per scenario and TEZG.
+    """
+    _check_xy(catchment)
+    centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+    directions = np.asarray(directions, dtype=np.float64)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    if not (speeds > 0).all():
+        raise ValueError('Zuggeschwindigkeiten müssen größer als 0 sein.')
+
+    # Distances and along-track positions [km] on a (centre, direction, TEZG) grid
+    dx = (catchment.x[None, :] - centres[:, 0, None]) / 1000
+    dy = (catchment.y[None, :] - centres[:, 1, None]) / 1000
+    reduction = areal_reduction(duration, np.hypot(dx, dy), mode)
+    angle = np.radians(directions)
+    along = dx[:, None, :] * np.sin(angle)[None, :, None] + dy[:, None, :] * np.cos(angle)[None, :, None]
+    along -= along.min(axis=-1, keepdims=True)
+    offset = along[:, :, None, :] / speeds[None, None, :, None] * 60
+
+    shape = (len(centres), len(directions), len(speeds))
+    table = np.column_stack([np.repeat(centres, len(directions) * len(speeds), axis=0),
+                             np.tile(np.repeat(directions, len(speeds)), len(centres)),
+                             np.tile(speeds, len(centres) * len(directions))])
+    reduction = np.broadcast_to(reduction[:, None, None, :], shape + reduction.shape[-1:])
+    return table, reduction.reshape(-1, len(catchment)), offset.reshape(-1, len(catchment))
+
+
+class StormResult:
+    """
+    Peaks of a storm sweep. scenarios: (x, y, direction, speed) per scenario;
+    peak [m³/s], t_peak [min], volume [m³]: shape (scenario, junction).
+    """
+
+    def __init__(self, junctions, scenarios, peak, t_peak, volume):
+        self.junctions = junctions
+        self.scenarios = scenarios
+        self.peak = peak
+        self.t_peak = t_peak
+        self.volume = volume
+        self.worst_index = np.argmax(peak, axis=0)
+
+    def worst(self):
+        """{junction: (Qmax, tmax, x, y, direction, speed)} of the scenario with the highest peak."""
+        columns = np.arange(len(self.junctions))
+        peak = self.peak[self.worst_index, columns]
+        t_peak = self.t_peak[self.worst_index, columns]
+        return {int(j): (float(p), float(t)) + tuple(float(v) for v in self.scenarios[s])
+                for j, p, t, s in zip(self.junctions, peak, t_peak, self.worst_index)}
+
+
+def _simulate_batch(catchment, rain, reduction, offset, options):
+    result = simulate(catchment, rain, offset=offset, reduction=reduction, hydrographs=False, **options)
+    return result.junctions, result.peak, result.t_peak, result.volume
+
+
+def storm_sweep(catchment, rain, duration, centres, directions=DIRECTIONS, speeds=SPEEDS, mode='weak',
+                akl_mode='m', rkl_mode='m', szi=0.0, n_steps=N_STEPS, workers=1, batch_size=None):
+    """
+    Simulates the hyetograph rain (rainfall duration [min] for the areal
+    reduction) for every storm scenario (see storm_scenarios), batch_size
+    scenarios at a time (default: BATCH_LANES lanes per batch), with
+    workers > 1 in a process pool.
+    """
+    scenarios, reduction, offset = storm_scenarios(catchment, duration, centres, directions, speeds, mode)
+    if not len(scenarios):
+        raise ValueError('Mindestens ein Regenzentrum, eine Zugrichtung und eine Geschwindigkeit erforderlich.')
+    options = {'akl_mode': akl_mode, 'rkl_mode': rkl_mode, 'szi': szi, 'n_steps': n_steps}
+    batch_size = batch_size or max(1, BATCH_LANES // len(catchment))
+    batches = [(catchment, rain, reduction[s:s + batch_size], offset[s:s + batch_size], options)
+               for s in range(0, len(scenarios), batch_size)]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            parts = list(pool.map(_simulate_batch, *zip(*batches)))
+    else:
+        parts = [_simulate_batch(*batch) for batch in batches]
+    peak, t_peak, volume = (np.concatenate([part[i] for part in parts]) for i in (1, 2, 3))
+    return StormResult(parts[0][0], scenarios, peak, t_peak, volume)
+
+
+def write_worst(result, path_or_file):
+    """Worst-case peak per junction and its storm scenario as CSV (';', decimal comma)."""
+    own = isinstance(path_or_file, str)
+    f = open(path_or_file, mode='w', newline='', encoding='utf-8') if own else path_or_file
+    try:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Knoten', 'Qmax [m3/s]', 'tmax [min]', 'X', 'Y', 'Zugrichtung [Grad]',
+                         'Zuggeschwindigkeit [km/h]'])
+        for junction, values in result.worst().items():
+            writer.writerow([junction] + [str(round(value, 3)).replace('.', ',') for value in values])
+    finally:
+        if own:
+            f.close()
+
+
+def _numbers(text):
+    return [float(value) for value in text.split(',') if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m zemokost_prep storm',
+                                     description='Zugbahnen von Regenzellen: ungünstigster Scheitel je Knoten')
+    parser.add_argument('csv', help='import_zemokost.csv (mit X/Y)')
+    parser.add_argument('--shape', default=SHAPES[0], choices=SHAPES, help='Niederschlagsverteilung')
+    parser.add_argument('--intensity', type=float, required=True, help='Mittlere Intensität im Zentrum [mm/h]')
+    parser.add_argument('--duration', type=float, required=True, help='Niederschlagsdauer [min]')
+    parser.add_argument('--reduction', default='weak', choices=('weak', 'strong'), help='Radiale Abminderung')
+    parser.add_argument('--grid', type=int, default=5, help='Regenzentren als Raster grid x grid über die TEZG')
+    parser.add_argument('--margin', type=float, default=0.0, help='Erweiterung des Rasters über die TEZG [m]')
+    parser.add_argument('--directions', type=_numbers, default=list(DIRECTIONS),
+                        help='Zugrichtungen [Grad, 0 = nach Norden, im Uhrzeigersinn]')
+    parser.add_argument('--speeds', type=_numbers, default=list(SPEEDS), help='Zuggeschwindigkeiten [km/h]')
+    parser.add_argument('--akl', default='m', choices=('b', 'm', 't'), help='Bandbreite der AKL')
+    parser.add_argument('--rkl', default='m', choices=('b', 'm', 't'), help='Bandbreite der RKL')
+    parser.add_argument('--szi', type=float, default=0.0, help='Verschiebung der Anfangsverluste [min]')
+    parser.add_argument('--d90', type=float, default=None, help='d90 [m] für leere Zellen')
+    parser.add_argument('--steps', type=int, default=N_STEPS, help='Simulationsdauer [Schritte à 1 min]')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Anzahl paralleler Worker-Prozesse')
+    parser.add_argument('--output', default=None, help='Ungünstigste Szenarien als CSV (Standard: Konsole)')
+    args = parser.parse_args(argv)
+
+    catchment = read_catchment(args.csv, defaults={'d90 [m]': args.d90} if args.d90 is not None else None)
+    result = storm_sweep(catchment, design_rain(args.shape, args.intensity, args.duration), args.duration,
+                         centre_grid(catchment, args.grid, args.margin), args.directions, args.speeds,
+                         args.reduction, args.akl, args.rkl, args.szi, args.steps, args.workers)
+    write_worst(result, args.output or sys.stdout)
+    return 0
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic catchments for benchmarks.
+
+make_catchment writes a reproducible (seeded) test catchment of a given
+number of sub-basins and DEM cells:
+
+- DEM: tilted V-valley terrain draining to the south-east outlet plus fractal
+  noise (sum of bilinearly interpolated random octaves), written in row
+  blocks, so DEMs of 10^8 cells need no more memory than one block
+- TEZG: ncols tributary strips of nrows segments each, draining into a main
+  valley row along the southern edge; K.O./K.U. are junction numbers that
+  increase downstream (tributaries join the main valley at the lower node
+  of their main valley segment)
+- Hauptgerinne: one channel line per TEZG along the valley axis
+- AKL/RKL/ZA: random class patches as polygons (polygon tool) and as
+  rasters on the patch grid (PSI, RKL and ZAF rasters of the raster tool)
+
+All data are in EPSG:31287 (MGI / Austria Lambert).
+"""
+import json
+import math
+import os
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from zemokost_prep.raster import CREATION_OPTIONS
+
+EPSG = 31287
+ORIGIN = (400000.0, 400000.0)  # upper left corner of the catchment
+
+# Margin of the DEM around the catchment in cells
+MARGIN_CELLS = 10
+
+# TEZG field names of the synthetic layers
+FIELDS = {'TEZG_ID': 'TEZG_NR', 'KNTO': 'KO', 'KNTU': 'KU', 'NAME': 'NAME',
+          'DISCHARGE_COEFF_VAL': 'AKL', 'ROUGHNESS_COEFF_VAL': 'RKL',
+          'INTERFLOW_FACTOR': 'ZAF', 'INTERFLOW_PROP': 'ZAA'}
+
+MANIFEST = 'catchment.json'
+
+
+def layout(basins):
+    """(ncols, nrows) of the tributary strips, ncols * (nrows + 1) >= basins."""
+    ncols = max(1, int(round(math.sqrt(basins))))
+    nrows = max(1, math.ceil(basins / ncols) - 1)
+    return ncols, nrows
+
+
+def _srs():
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    return srs
+
+
+def _octaves(rng, rows, cols, relief):
+    """Random coarse grids (2^k + 1 nodes per axis) with amplitudes halving per octave."""
+    octaves = []
+    k = 1
+    while 2 ** k < min(rows, cols) / 2 and k <= 10:
+        n = 2 ** k + 1
+        octaves.append(rng.standard_normal((n, n)).astype(np.float32) * relief * 0.5 ** k)
+        k += 1
+    return octaves
+
+
+def _bilinear(grid, fy, fx):
+    n = grid.shape[0] - 1
+    y, x = fy * n, fx * n
+    i0 = np.minimum(np.floor(y).astype(int), n - 1)
+    j0 = np.minimum(np.floor(x).astype(int), n - 1)
+    ty, tx = (y - i0)[:, None], (x - j0)[None, :]
+    top = grid[i0][:, j0] * (1 - tx) + grid[i0][:, j0 + 1] * tx
+    bottom = grid[i0 + 1][:, j0] * (1 - tx) + grid[i0 + 1][:, j0 + 1] * tx
+    return top * (1 - ty) + bottom * ty
+
+
+def write_dem(path, rows, cols, cellsize, ncols, nrows, seed=0, block_rows=512):
+    """
+    Writes the DEM of rows x cols cells (catchment plus MARGIN_CELLS) block
+    by block. Returns path.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = cols * cellsize, rows * cellsize
+    seg_h = height / (nrows + 1)
+    strip_w = width / ncols
+    octaves = _octaves(rng, rows, cols, relief=0.02 * max(width, height))
+
+    total_rows, total_cols = rows + 2 * MARGIN_CELLS, cols + 2 * MARGIN_CELLS
+    ds = gdal.GetDriverByName('GTiff').Create(path, total_cols, total_rows, 1, gdal.GDT_Float32,
+                                              options=CREATION_OPTIONS)
+    x0 = ORIGIN[0] - MARGIN_CELLS * cellsize
+    y0 = ORIGIN[1] + MARGIN_CELLS * cellsize
+    ds.SetGeoTransform((x0, cellsize, 0, y0, 0, -cellsize))
+    ds.SetProjection(_srs().ExportToWkt())
+    band = ds.GetRasterBand(1)
+
+    # Catchment coordinates of the cell centres (0 = west / south edge of the catchment)
+    x = (np.arange(total_cols) - MARGIN_CELLS + 0.5) * cellsize
+    fx = np.clip(x / width, 0, 1)
+    for r0 in range(0, total_rows, block_rows):
+        r1 = min(total_rows, r0 + block_rows)
+        y = height - (np.arange(r0, r1) - MARGIN_CELLS + 0.5) * cellsize
+        fy = np.clip(1 - y / height, 0, 1)
+        yy, xx = y[:, None], x[None, :]
+
+        # Main valley (southern row): eastward gradient, V-shape across the valley axis
+        main = 0.05 * (width - xx) + 0.3 * np.abs(yy - seg_h / 2)
+        # Tributary strips: V-shape across the strip axis, draining south into the main valley
+        axis = (np.floor(np.clip(xx, 0, width - 1e-6) / strip_w) + 0.5) * strip_w
+        trib = 0.05 * (width - axis) + 0.2 * (yy - seg_h) + 0.3 * np.abs(xx - axis) + 0.3 * seg_h / 2
+        z = np.where(yy < seg_h, main, np.maximum(main, trib)) + 100.0
+        for grid in octaves:
+            z += _bilinear(grid, fy, fx)
+        band.WriteArray(z.astype(np.float32), 0, r0)
+    band.FlushCache()
+    ds = None
+    return path
+
+
+def _create_layer(path, geom_type, fields):
+    drv = ogr.GetDriverByName('ESRI Shapefile')
+    if os.path.exists(path):
+        drv.DeleteDataSource(path)
+    vds = drv.CreateDataSource(path)
+    vlyr = vds.CreateLayer(os.path.splitext(os.path.basename(path))[0], _srs(), geom_type)
+    for name, field_type in fields:
+        vlyr.CreateField(ogr.FieldDefn(name, field_type))
+    return vds, vlyr
+
+
+def _add_feature(vlyr, geom, values):
+    feat = ogr.Feature(vlyr.GetLayerDefn())
+    feat.SetGeometry(geom)
+    for name, value in values.items():
+        feat.SetField(name, value)
+    vlyr.CreateFeature(feat)
+
+
+def _rect(x0, y0, x1, y1):
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)):
+        ring.AddPoint_2D(x, y)
+    poly = ogr.Geometry(ogr.wkbPolygon)
+    poly.AddGeometry(ring)
+    return poly
+
+
+def _line(points):
+    line = ogr.Geometry(ogr.wkbLineString)
+    for x, y in points:
+        line.AddPoint_2D(x, y)
+    return line
+
+
+def sub_basins(ncols, nrows, width, height):
+    """
+    Returns [(tezg_nr, ko, ku, (x0, y0, x1, y1), channel_points), ...] in
+    catchment coordinates (0, 0 = south-west corner). Junction numbers
+    increase downstream; the outlet is the largest number. The top tributary
+    segments and the first main valley segment are headwaters (K.O. 0).
+    """
+    seg_h = height / (nrows + 1)
+    strip_w = width / ncols
+    node = iter(range(1, ncols * (nrows + 1) + 2))
+    main_nodes = [0]
+    trib_nodes = []
+    for c in range(ncols):
+        trib_nodes.append([0] + [next(node) for _ in range(nrows - 1)])
+        main_nodes.append(next(node))
+
+    basins = []
+    nr = 1
+    for c in range(ncols):
+        xa, xb = c * strip_w, (c + 1) * strip_w
+        xm = (xa + xb) / 2
+        for r in range(nrows):
+            ya, yb = height - (r + 1) * seg_h, height - r * seg_h
+            ku = trib_nodes[c][r + 1] if r + 1 < nrows else main_nodes[c + 1]
+            basins.append((nr, trib_nodes[c][r], ku, (xa, ya, xb, yb), [(xm, yb), (xm, ya)]))
+            nr += 1
+        basins.append((nr, main_nodes[c], main_nodes[c + 1], (xa, 0.0, xb, seg_h),
+                       [(xa, seg_h / 2), (xb, seg_h / 2)]))
+        nr += 1
+    return basins
+
+
+def _write_patch_raster(path, values, patch, data_type):
+    rows, cols = values.shape
+    ds = gdal.GetDriverByName('GTiff').Create(path, cols, rows, 1, data_type, options=['COMPRESS=DEFLATE'])
+    ds.SetGeoTransform((ORIGIN[0], patch, 0, ORIGIN[1], 0, -patch))
+    ds.SetProjection(_srs().ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(values)
+    ds = None
+    return path
+
+
+def make_catchment(out_dir, basins, cells, cellsize=5.0, seed=0):
+    """
+    Writes a synthetic catchment with about basins sub-basins and cells DEM
+    cells to out_dir and returns the algorithm inputs
+    {'zemokost': {...}, 'zemokost_rasteronly': {...}} (without output paths).
+    Existing data written with the same arguments are reused.
+    """
+    spec = {'basins': basins, 'cells': cells, 'cellsize': cellsize, 'seed': seed}
+    manifest = os.path.join(out_dir, MANIFEST)
+    if os.path.isfile(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('spec') == spec:
+            return data['inputs']
+    os.makedirs(out_dir, exist_ok=True)
+
+    ncols, nrows = layout(basins)
+    side = max(16, int(round(math.sqrt(cells))))
+    width = height = side * cellsize
+    rng = np.random.default_rng(seed + 1)
+
+    paths = {name: os.path.join(out_dir, name) for name in (
+        'dem.tif', 'tezg.shp', 'gerinne.shp', 'akl.shp', 'rkl.shp', 'za.shp', 'psi.tif', 'rkl.tif', 'zaf.tif')}
+    write_dem(paths['dem.tif'], side, side, cellsize, ncols, nrows, seed)
+
+    x0, y0 = ORIGIN[0], ORIGIN[1] - height
+    vds_t, tezg = _create_layer(paths['tezg.shp'], ogr.wkbPolygon, [
+        (FIELDS['TEZG_ID'], ogr.OFTInteger), (FIELDS['KNTO'], ogr.OFTInteger), (FIELDS['KNTU'], ogr.OFTInteger),
+        (FIELDS['NAME'], ogr.OFTString)])
+    vds_g, channels = _create_layer(paths['gerinne.shp'], ogr.wkbLineString, [(FIELDS['TEZG_ID'], ogr.OFTInteger)])
+    for nr, ko, ku, (xa, ya, xb, yb), line in sub_basins(ncols, nrows, width, height):
+        _add_feature(tezg, _rect(x0 + xa, y0 + ya, x0 + xb, y0 + yb),
+                     {FIELDS['TEZG_ID']: nr, FIELDS['KNTO']: ko, FIELDS['KNTU']: ku, FIELDS['NAME']: 'TEZG {}'.format(nr)})
+        _add_feature(channels, _line([(x0 + x, y0 + y) for x, y in line]), {FIELDS['TEZG_ID']: nr})
+    vds_t = vds_g = None
+
+    # Class patches: about four per sub-basin
+    npatch = max(2, int(round(math.sqrt(4 * basins))))
+    patch = width / npatch
+    akl = rng.integers(0, 7, (npatch, npatch))
+    rkl = rng.integers(1, 7, (npatch, npatch))
+    zaf = rng.integers(1, 8, (npatch, npatch))
+    zaa = np.round(rng.random((npatch, npatch)), 2)
+    vds_a, akl_lyr = _create_layer(paths['akl.shp'], ogr.wkbPolygon, [(FIELDS['DISCHARGE_COEFF_VAL'], ogr.OFTInteger)])
+    vds_r, rkl_lyr = _create_layer(paths['rkl.shp'], ogr.wkbPolygon, [(FIELDS['ROUGHNESS_COEFF_VAL'], ogr.OFTInteger)])
+    vds_z, za_lyr = _create_layer(paths['za.shp'], ogr.wkbPolygon, [
+        (FIELDS['INTERFLOW_FACTOR'], ogr.OFTInteger), (FIELDS['INTERFLOW_PROP'], ogr.OFTReal)])
+    for i in range(npatch):
+        for j in range(npatch):
+            rect = _rect(ORIGIN[0] + j * patch, ORIGIN[1] - (i + 1) * patch,
+                         ORIGIN[0] + (j + 1) * patch, ORIGIN[1] - i * patch)
+            _add_feature(akl_lyr, rect, {FIELDS['DISCHARGE_COEFF_VAL']: int(akl[i, j])})
+            _add_feature(rkl_lyr, rect, {FIELDS['ROUGHNESS_COEFF_VAL']: int(rkl[i, j])})
+            _add_feature(za_lyr, rect, {FIELDS['INTERFLOW_FACTOR']: int(zaf[i, j]),
+                                        FIELDS['INTERFLOW_PROP']: float(zaa[i, j])})
+    vds_a = vds_r = vds_z = None
+
+    # Rasters of the raster tool: PSI (0..1) from the AKL class, RKL and ZAF on the patch grid
+    _write_patch_raster(paths['psi.tif'], (akl / 6.0).astype(np.float32), patch, gdal.GDT_Float32)
+    _write_patch_raster(paths['rkl.tif'], rkl.astype(np.float32), patch, gdal.GDT_Float32)
+    _write_patch_raster(paths['zaf.tif'], zaf.astype(np.int16), patch, gdal.GDT_Int16)
+
+    common = {'DEM': paths['dem.tif'], 'TEZG': paths['tezg.shp'], 'TEZG_ID': FIELDS['TEZG_ID'],
+              'KNTO': FIELDS['KNTO'], 'KNTU': FIELDS['KNTU'], 'NAME': FIELDS['NAME'],
+              'CHANNEL_MAIN': paths['gerinne.shp']}
+    inputs = {
+        'zemokost': dict(common, DISCHARGE_COEFF=paths['akl.shp'],
+                         DISCHARGE_COEFF_VAL=FIELDS['DISCHARGE_COEFF_VAL'],
+                         ROUGHNESS_COEFF=paths['rkl.shp'], ROUGHNESS_COEFF_VAL=FIELDS['ROUGHNESS_COEFF_VAL'],
+                         INTERFLOW=paths['za.shp'], INTERFLOW_FACTOR=FIELDS['INTERFLOW_FACTOR'],
+                         INTERFLOW_PROP=FIELDS['INTERFLOW_PROP']),
+        'zemokost_rasteronly': dict(common, AKL_RASTER=paths['psi.tif'], RKL_RASTER=paths['rkl.tif'],
+                                    ZAF_RASTER=paths['zaf.tif']),
+    }
+    with open(manifest, mode='w', encoding='utf-8') as f:
+        json.dump({'spec': spec, 'inputs': inputs, 'sub_basins': ncols * (nrows + 1), 'cells': side * side}, f,
+                  indent=1)
+    return inputs
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Thread and cache settings of the processing tools (THREADS, GDAL_CACHE_MB).
+
+The number of threads is passed to WhiteboxTools (--max_procs), to gdal.Warp
+(NUM_THREADS), to the pool of the tiled hydrology and to the gdal:*
+processing algorithms (GDAL_NUM_THREADS). All GDAL settings are passed with
+the single call (warp_options, gdal_extra); the GDAL configuration, the
+block cache and os.environ of the QGIS process are not changed, so runs in
+the Processing background thread cannot affect other threads or later runs.
+"""
+import os
+
+
+def resolve_threads(threads):
+    """Number of worker threads; 0/None = all cores."""
+    threads = int(threads or 0)
+    return threads if threads > 0 else (os.cpu_count() or 1)
+
+
+def warp_options(threads=0, cache_mb=0):
+    """gdal.Warp keyword arguments: warp threads and, if cache_mb > 0, the warp memory [MB]."""
+    options = {'multithread': True, 'warpOptions': ['NUM_THREADS={}'.format(resolve_threads(threads))]}
+    if cache_mb and cache_mb > 0:
+        options['warpMemoryLimit'] = int(cache_mb)
+    return options
+
+
+def gdal_extra(threads=0, cache_mb=0):
+    """
+    EXTRA parameter of the gdal:* processing algorithms: GDAL_NUM_THREADS
+    and, if cache_mb > 0, GDAL_CACHEMAX [MB] as --config options of the
+    GDAL command line call.
+    """
+    extra = '--config GDAL_NUM_THREADS {}'.format(resolve_threads(threads))
+    if cache_mb and cache_mb > 0:
+        extra += ' --config GDAL_CACHEMAX {}'.format(int(cache_mb))
+    return extra
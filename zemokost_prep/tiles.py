@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Tiled (windowed) hydrology.
+
+Instead of one clipped DEM over the bounding box of all TEZG, every TEZG gets
+its own DEM window (TEZG polygon buffered by BUFFER_CELLS, read from the source
+DEM on its grid). Fill, D8 flow accumulation, ridges, stream rasterisation and
+downslope distance run per window in a pool of worker threads (WhiteboxTools
+runs as a separate process started by every chain itself, see
+zemokost_prep.wbt, so threads are sufficient), and each window is reduced to
+the flow length statistics (for the resolution report also the slope
+statistics) of its TEZG right away. Memory and temp disk usage of the
+hydrology are bounded by the largest TEZG window times the number of
+workers; the caller's clipped DEM over the bounding box of all TEZG, the zone
+raster and the slope are not affected. With wbt=None the chain runs in
+process on the window arrays (zemokost_prep.hydro).
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from osgeo import gdal
+
+from zemokost_prep import hydro
+from zemokost_prep.raster import clip_dem, slope_percent
+from zemokost_prep.threads import resolve_threads
+from zemokost_prep.wbt import WbtChain
+from zemokost_prep.zonal import ZonalEngine, rasterize_zones, read_array
+
+# Buffer around every TEZG in cells, so that flow paths crossing the TEZG boundary are kept
+BUFFER_CELLS = 20
+
+
+def clip_window(dem, wkb, out_path, buffer_cells=BUFFER_CELLS, crs_wkt=None, cellsize=None, threads=None,
+                cache_mb=0):
+    """
+    Writes the DEM window of one TEZG (cutline = TEZG buffered by
+    buffer_cells) as Float32 GeoTIFF on the grid of the source DEM
+    (resampled to cellsize if given).
+    """
+    buffer = buffer_cells * (cellsize or gdal.Open(str(dem)).GetGeoTransform()[1])
+    return clip_dem(dem, [wkb], out_path, cellsize=cellsize, crs_wkt=crs_wkt, buffer=buffer, threads=threads,
+                    cache_mb=cache_mb)
+
+
+def window_metrics(wbt, dem, tezg_id, wkb, drainage_path, work_dir, crs_wkt=None, cellsize=None, threads=None,
+                   cache_mb=0, slope=False):
+    """
+    Hydrology chain of one TEZG window (WhiteboxTools, or NumPy if wbt is
+    None). Returns the statistics of the flow length at ridges (D8
+    accumulation 1..2 cells) within the TEZG as {'flenM': {'count', 'sum',
+    'min', 'max'}}; with slope=True also the slope [%] (Horn) of the window
+    as 'slpP'. threads: warp and WBT threads of the window; cache_mb: warp
+    memory [MB].
+    """
+    tag = '{}_{}'.format(tezg_id, uuid.uuid4().hex[:8])
+    paths = {name: os.path.join(work_dir, '{}_{}.tif'.format(name, tag))
+             for name in ('dem', 'filled', 'facc', 'streams', 'flen')}
+    try:
+        clip_window(dem, wkb, paths['dem'], crs_wkt=crs_wkt, cellsize=cellsize, threads=threads, cache_mb=cache_mb)
+        engine = ZonalEngine(rasterize_zones([(tezg_id, wkb)], paths['dem']))
+        if slope:
+            # The buffer gives the boundary cells of the TEZG their full 3x3 neighbourhood
+            engine.add_array('slpP', slope_percent(read_array(paths['dem']), engine.grid.cellsize,
+                                                   abs(engine.grid.geotransform[5])))
+        if wbt is None:
+            ds = gdal.Open(paths['dem'])
+            gt = ds.GetGeoTransform()
+            arrays = hydro.hydrology(read_array(ds), hydro.rasterize_streams(drainage_path, ds), abs(gt[1]),
+                                     abs(gt[5]))
+            engine.add_array('flenM', arrays['flen_ridges'])
+            ds = None
+        else:
+            chain = WbtChain(wbt, num_threads=threads)
+            chain.add('fill_depressions_wang_and_liu', dem=paths['dem'], output=paths['filled'], fix_flats=True)
+            chain.add('d8_flow_accumulation', input=paths['filled'], output=paths['facc'], out_type='cells')
+            chain.add('rasterize_streams', streams=drainage_path, base=paths['filled'], output=paths['streams'],
+                      nodata=True)
+            chain.add('downslope_distance_to_stream', dem=paths['filled'], streams=paths['streams'],
+                      output=paths['flen'])
+            chain.run()
+            # Flow length on ridges read together with the accumulation in the zonal sweep
+            engine.add_masked_raster('flenM', paths['flen'], paths['facc'], *hydro.RIDGE_CELLS)
+
+        table = engine.run()
+        # Close the window rasters before they are deleted
+        engine = None
+        return {name: {stat: table[name, stat][0].item() for stat in ('count', 'sum', 'min', 'max')}
+                for name in table.names()}
+    finally:
+        for path in paths.values():
+            if os.path.exists(path):
+                gdal.GetDriverByName('GTiff').Delete(path)
+
+
+def tiled_metrics(wbt, dem, shapes, drainage_path, work_dir, workers=None, feedback=None, crs_wkt=None,
+                  cellsize=None, threads=None, cache_mb=0, slope=False):
+    """
+    Runs window_metrics for all TEZG shapes [(tezg_id, wkb), ...] in a
+    thread pool. Returns {tezg_id: {name: stats}}. threads (0/None = all
+    cores) is split between the workers (default: threads / 2) and the tools
+    of each window.
+    """
+    shapes = list(shapes)
+    threads = resolve_threads(threads)
+    workers = workers or max(1, threads // 2)
+    window_threads = max(1, threads // workers)
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(workers, max(len(shapes), 1))) as pool:
+        futures = {pool.submit(window_metrics, wbt, dem, tezg_id, wkb, drainage_path, work_dir,
+                               crs_wkt, cellsize, window_threads, cache_mb, slope): tezg_id
+                   for tezg_id, wkb in shapes}
+        for n, future in enumerate(futures, start=1):
+            if feedback is not None and feedback.isCanceled():
+                for f in futures:
+                    f.cancel()
+                break
+            results[futures[future]] = future.result()
+            if feedback is not None:
+                feedback.setProgress(int(n / len(futures) * 100))
+    return results
+
+
+def tiled_flow_length(wbt, dem, shapes, drainage_path, work_dir, workers=None, feedback=None, crs_wkt=None,
+                      cellsize=None, threads=None, cache_mb=0):
+    """Flow length statistics at ridges per TEZG window: {tezg_id: stats} (see tiled_metrics)."""
+    return {tezg_id: metrics['flenM'] for tezg_id, metrics in
+            tiled_metrics(wbt, dem, shapes, drainage_path, work_dir, workers, feedback, crs_wkt, cellsize, threads,
+                          cache_mb).items()}
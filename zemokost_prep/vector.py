@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Vector helpers: narrowing large input layers and aggregating class areas per TEZG.
+"""
+from collections import defaultdict
+
+from PyQt5.QtCore import QVariant
+from qgis.core import QgsFeatureRequest, QgsFeatureSource, QgsField, QgsVectorDataProvider
+
+
+def ensure_spatial_index(layer):
+    """
+    Builds the provider's spatial index of layer (.qix for shapefiles) if it
+    has none and the provider can create one. Returns True if an index is
+    available afterwards. Read-only data (e.g. on a network share) is left
+    as it is; the rectangle filter then falls back to a full scan.
+    """
+    if layer.hasSpatialIndex() != QgsFeatureSource.SpatialIndexNotPresent:
+        return layer.hasSpatialIndex() == QgsFeatureSource.SpatialIndexPresent
+    prov = layer.dataProvider()
+    if not prov.capabilities() & QgsVectorDataProvider.CreateSpatialIndex:
+        return False
+    return bool(prov.createSpatialIndex())
+
+
+def features_in_extent(layer, extent, feedback=None, buffer=0.0):
+    """
+    Copies the features of layer whose bounding box intersects extent
+    (enlarged by buffer) into a memory layer. The rectangle filter is served
+    by the provider's spatial index (.qix for shapefiles, R-tree for GPKG),
+    which is built on demand, so only the features around the catchment are
+    fetched from national/state-wide layers and the following clip or
+    intersection scales with the catchment instead of the input layer.
+    extent and buffer must be given in the CRS of layer.
+    """
+    ensure_spatial_index(layer)
+    request = QgsFeatureRequest().setFilterRect(extent.buffered(buffer) if buffer else extent)
+    return layer.materialize(request, feedback)
+
+
+def class_areas(layer, id_field, class_field, request=None):
+    """
+    Sums the polygon areas of layer per (TEZG id, class value) in a single pass.
+
+    Every feature is read and its area computed exactly once, instead of
+    re-iterating the whole layer for every class and every TEZG. Class values
+    are returned as float so that integer, double and numeric string fields
+    can all be looked up with the class numbers (0-6); features without a
+    numeric class value are skipped.
+
+    Returns a dict {(tezg_id, class_value): area_m2}.
+    """
+    if request is None:
+        request = QgsFeatureRequest()
+    request.setSubsetOfAttributes([id_field, class_field], layer.fields())
+
+    areas = defaultdict(float)
+    for feat in layer.getFeatures(request):
+        geom = feat.geometry()
+        if geom.isNull():
+            continue
+        try:
+            cls = float(feat[class_field])
+        except (TypeError, ValueError):
+            continue
+        areas[(int(feat[id_field]), cls)] += geom.area()
+    return areas
+
+
+def layer_shapes(layer, id_field):
+    """Returns [(tezg_id, wkb), ...] of layer for rasterising the TEZG zones."""
+    request = QgsFeatureRequest().setSubsetOfAttributes([id_field], layer.fields())
+    return [(int(feat[id_field]), bytes(feat.geometry().asWkb())) for feat in layer.getFeatures(request)]
+
+
+def value_shapes(layer, field):
+    """Returns [(value, wkb), ...] of layer for rasterising a numeric attribute; NULL/non-numeric values are skipped."""
+    request = QgsFeatureRequest().setSubsetOfAttributes([field], layer.fields())
+    shapes = []
+    for feat in layer.getFeatures(request):
+        try:
+            value = float(feat[field])
+        except (TypeError, ValueError):
+            continue
+        shapes.append((value, bytes(feat.geometry().asWkb())))
+    return shapes
+
+
+def add_table_fields(layer, id_field, table, columns):
+    """
+    Writes zonal statistics into new double fields of layer, as
+    qgis:zonalstatistics did, so that they end up in the saved TEZG_Stats.shp.
+    columns is a list of (field name, raster name, statistic).
+    """
+    prov = layer.dataProvider()
+    prov.addAttributes([QgsField(field_name, QVariant.Double) for field_name, _, _ in columns])
+    layer.updateFields()
+    idx = [layer.fields().indexOf(field_name) for field_name, _, _ in columns]
+
+    changes = {}
+    for feat in layer.getFeatures():
+        fid = int(feat[id_field])
+        changes[feat.id()] = {i: table.value(fid, name, stat) for i, (_, name, stat) in zip(idx, columns)}
+    prov.changeAttributeValues(changes)
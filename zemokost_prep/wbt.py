@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Shared WhiteboxTools instance and chained tool execution.
+
+Locating the WBT binary and setting up the wrapper is done once per process;
+the preparation scripts and repeated runs (batch mode, CLI) reuse the instance.
+
+WbtChain queues the tools of the hydrology chain and runs them in order
+with the same settings for every tool (number of threads, compressed GeoTIFF
+output), independent of the keyword signatures of the installed wrapper
+version, and records the run time of every tool. The WBT command line runs
+one tool per process, so every tool still is a subprocess. The binary is
+started by its absolute path with --max_procs and --compress_rasters on the
+command line: unlike WhiteboxTools.run_tool, a chain neither changes the
+working directory of the process nor the settings of the shared wrapper, so
+chains can run concurrently from several threads (tiled hydrology).
+"""
+import os
+import subprocess
+import time
+
+_wbt = None
+
+
+def whitebox_tools(verbose=True):
+    """Returns the process-wide WhiteboxTools instance (WBT package next to the scripts)."""
+    global _wbt
+    if _wbt is None:
+        from WBT.whitebox_tools import WhiteboxTools
+        _wbt = WhiteboxTools()
+    _wbt.set_verbose_mode(verbose)
+    return _wbt
+
+
+def _tool_args(kwargs):
+    """WBT command line arguments: True -> flag, False/None -> omitted, else --name='value'."""
+    args = []
+    for name, value in kwargs.items():
+        if value is None or value is False:
+            continue
+        if value is True:
+            args.append('--{}'.format(name))
+        else:
+            args.append("--{}='{}'".format(name, value))
+    return args
+
+
+class WbtChain:
+    """
+    Queue of WhiteboxTools calls, e.g.
+
+        chain = WbtChain(wbt, num_threads=4)
+        chain.add('fill_depressions_wang_and_liu', dem=dem, output=filled, fix_flats=True)
+        chain.add('d8_flow_accumulation', input=filled, output=facc, out_type='cells')
+        timings = chain.run()
+
+    Keywords are the WBT command line parameters (input=, not i=).
+    num_threads: WBT --max_procs (None = WBT default, all cores).
+    compress: write DEFLATE-compressed GeoTIFFs.
+    profiler: StageProfiler; every tool becomes a stage 'wbt <tool>'.
+    feedback: QgsProcessingFeedback for the tool timings.
+    """
+
+    def __init__(self, wbt, num_threads=None, compress=True, profiler=None, feedback=None):
+        self.wbt = wbt
+        self.num_threads = num_threads
+        self.compress = compress
+        self.profiler = profiler
+        self.feedback = feedback
+        self.tools = []
+        self.timings = []
+
+    def add(self, tool, **kwargs):
+        self.tools.append((tool, kwargs))
+        return self
+
+    def _command(self, tool, kwargs):
+        """Command line of one tool (binary by absolute path, settings as arguments)."""
+        command = [os.path.join(self.wbt.exe_path, self.wbt.exe_name),
+                   '--run={}'.format(''.join(part.title() for part in tool.split('_')))]
+        command += _tool_args(kwargs)
+        command.append('--compress_rasters={}'.format('true' if self.compress else 'false'))
+        if self.num_threads:
+            command.append('--max_procs={}'.format(int(self.num_threads)))
+        return command
+
+    def run(self):
+        """Runs the queued tools in order; raises ValueError if a tool fails. Returns [(tool, seconds), ...]."""
+        tools, self.tools = self.tools, []
+        for tool, kwargs in tools:
+            if self.profiler is not None:
+                self.profiler.mark('wbt ' + tool)
+            start = time.perf_counter()
+            try:
+                proc = subprocess.run(self._command(tool, kwargs), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                      universal_newlines=True, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+                ret, output = proc.returncode, proc.stdout.splitlines()
+            except OSError as err:
+                ret, output = 1, [str(err)]
+            self.timings.append((tool, round(time.perf_counter() - start, 3)))
+            if self.feedback is not None:
+                self.feedback.pushInfo('    WBT {}: {} s'.format(tool, self.timings[-1][1]))
+            # WBT may exit with 0 even if the tool failed, so check the output as well
+            if ret != 0 or (kwargs.get('output') and not os.path.isfile(kwargs['output'])):
+                raise ValueError('WhiteboxTools {} fehlgeschlagen:\n{}'.format(tool, '\n'.join(output[-20:])))
+        return self.timings
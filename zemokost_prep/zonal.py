@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Fused zonal statistics for the per-TEZG raster metrics.
+
+The TEZG polygons are rasterised once onto the grid of the clipped DEM
+(ZoneGrid). ZonalEngine then reads every registered raster strip by strip
+exactly once and accumulates count/sum/min/max for all of them in the same
+sweep. The result is a ZonalTable keyed by TEZG_ID_ZK.
+
+Like qgis:zonalstatistics, a cell belongs to a zone if its centre lies inside
+the polygon; NoData and NaN cells are ignored.
+"""
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+STATS = ('count', 'sum', 'mean', 'min', 'max')
+
+# Target number of cells per strip when reading rasters
+STRIP_CELLS = 1 << 22
+
+
+def _open(src):
+    if isinstance(src, gdal.Dataset):
+        return src
+    ds = gdal.Open(str(src))
+    if ds is None:
+        raise ValueError('Raster konnte nicht geöffnet werden: {}'.format(src))
+    return ds
+
+
+class ZoneGrid:
+    """
+    Zone raster aligned with a reference grid. Cells carry the 1-based index
+    into ids; 0 marks cells outside every TEZG.
+    """
+
+    def __init__(self, zones, ids, geotransform, projection):
+        self.zones = zones
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.geotransform = tuple(geotransform)
+        self.projection = projection
+
+    @property
+    def shape(self):
+        return self.zones.shape
+
+    @property
+    def cellsize(self):
+        return abs(self.geotransform[1])
+
+    def matches(self, ds):
+        """True if ds has the same size and (within 1/1000 cell) the same geotransform."""
+        if (ds.RasterYSize, ds.RasterXSize) != self.shape:
+            return False
+        tol = self.cellsize * 1e-3
+        return all(abs(a - b) <= tol for a, b in zip(ds.GetGeoTransform(), self.geotransform))
+
+
+def _burn(shapes, geotransform, projection, shape, data_type, init):
+    """Burns [(value, wkb), ...] by cell centre into a MEM raster and returns the array."""
+    rows, cols = shape
+    mem = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, data_type)
+    mem.SetGeoTransform(geotransform)
+    mem.SetProjection(projection)
+    mem.GetRasterBand(1).Fill(init)
+
+    srs = osr.SpatialReference()
+    if projection:
+        srs.ImportFromWkt(projection)
+    vds = ogr.GetDriverByName('Memory').CreateDataSource('burn')
+    vlyr = vds.CreateLayer('burn', srs, ogr.wkbUnknown)
+    vlyr.CreateField(ogr.FieldDefn('value', ogr.OFTReal))
+    for value, wkb in shapes:
+        feat = ogr.Feature(vlyr.GetLayerDefn())
+        feat.SetGeometry(ogr.CreateGeometryFromWkb(bytes(wkb)))
+        feat.SetField('value', float(value))
+        vlyr.CreateFeature(feat)
+
+    gdal.RasterizeLayer(mem, [1], vlyr, options=['ATTRIBUTE=value'])
+    return mem.GetRasterBand(1).ReadAsArray()
+
+
+def rasterize_zones(shapes, ref):
+    """
+    Burns shapes [(zone_id, wkb), ...] onto the grid of the reference raster
+    ref (path or gdal.Dataset). The geometries must be in the CRS of ref.
+    """
+    ref_ds = _open(ref)
+    gt = ref_ds.GetGeoTransform()
+    wkt = ref_ds.GetProjection()
+    shapes = list(shapes)
+    ids = [int(zone_id) for zone_id, _ in shapes]
+    indexed = [(n + 1, wkb) for n, (_, wkb) in enumerate(shapes)]
+    zones = _burn(indexed, gt, wkt, (ref_ds.RasterYSize, ref_ds.RasterXSize), gdal.GDT_Int32, 0)
+    return ZoneGrid(zones, ids, gt, wkt)
+
+
+def rasterize_values(shapes, zone_grid):
+    """
+    Burns attribute values [(value, wkb), ...] onto the zone grid. Returns a
+    float32 array with NaN where no polygon covers the cell centre.
+    """
+    return _burn(shapes, zone_grid.geotransform, zone_grid.projection, zone_grid.shape,
+                 gdal.GDT_Float32, np.nan)
+
+
+def read_array(src, band=1):
+    """Reads a whole raster band as float32 array with NoData set to NaN."""
+    ds = _open(src)
+    rb = ds.GetRasterBand(band)
+    arr = rb.ReadAsArray().astype(np.float32)
+    nodata = rb.GetNoDataValue()
+    if nodata is not None:
+        arr[arr == np.float32(nodata)] = np.nan
+    return arr
+
+
+def write_array(path, array, zone_grid, nodata=-9999):
+    """Writes a float array on the zone grid as Float32 GeoTIFF (NaN -> nodata)."""
+    rows, cols = zone_grid.shape
+    ds = gdal.GetDriverByName('GTiff').Create(path, cols, rows, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform(zone_grid.geotransform)
+    ds.SetProjection(zone_grid.projection)
+    rb = ds.GetRasterBand(1)
+    rb.SetNoDataValue(nodata)
+    rb.WriteArray(np.where(np.isnan(array), nodata, array).astype(np.float32))
+    ds.FlushCache()
+    ds = None
+    return path
+
+
+class ZonalTable:
+    """
+    Per-zone statistics for several rasters, backed by one NumPy array per
+    (name, statistic) aligned with ids.
+    """
+
+    def __init__(self, ids, data):
+        self.ids = ids
+        self._data = data
+        self._row = {int(i): n for n, i in enumerate(ids)}
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __getitem__(self, key):
+        name, stat = key
+        return self._data[name][stat]
+
+    def names(self):
+        return list(self._data)
+
+    def value(self, zone_id, name, stat):
+        """Statistic of one zone as float (count as int); None if the zone has no valid cells."""
+        row = self._row.get(int(zone_id))
+        if row is None:
+            return None
+        count = int(self._data[name]['count'][row])
+        if stat == 'count':
+            return count
+        if count == 0:
+            return None
+        return float(self._data[name][stat][row])
+
+    def as_dict(self, name, stat):
+        return {int(i): self.value(i, name, stat) for i in self.ids}
+
+    def set_stats(self, name, stats):
+        """
+        Adds statistics computed elsewhere (e.g. per TEZG window) as raster
+        name; stats is {zone_id: {'count', 'sum', 'min', 'max'}}.
+        """
+        n = len(self.ids)
+        data = {'count': np.zeros(n, dtype=np.int64), 'sum': np.zeros(n),
+                'min': np.full(n, np.nan), 'max': np.full(n, np.nan)}
+        for zone_id, values in stats.items():
+            row = self._row.get(int(zone_id))
+            if row is None:
+                continue
+            for stat in data:
+                data[stat][row] = values[stat]
+        count = data['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data['mean'] = np.where(count > 0, data['sum'] / np.maximum(count, 1), np.nan)
+        self._data[name] = data
+
+
+class ZonalEngine:
+    """
+    Collects rasters/arrays on the grid of a ZoneGrid and computes their
+    zonal statistics in a single strip-wise sweep.
+    """
+
+    def __init__(self, zone_grid, strip_cells=STRIP_CELLS):
+        self.grid = zone_grid
+        self.strip_cells = strip_cells
+        self._inputs = []
+
+    def add_raster(self, name, src, band=1):
+        """Registers band of the raster src (path or gdal.Dataset); it must share the zone grid."""
+        ds = _open(src)
+        if not self.grid.matches(ds):
+            raise ValueError('Raster {} ist nicht am Zonenraster (DEM) ausgerichtet.'.format(name))
+        rb = ds.GetRasterBand(band)
+        self._inputs.append((name, ds, rb, rb.GetNoDataValue(), None))
+
+    def add_masked_raster(self, name, src, mask_src, low, high, band=1):
+        """
+        Registers band of src, restricted to the cells where mask_src lies in
+        [low, high] (e.g. flow length on ridges: flow accumulation 1..2 cells).
+        Both rasters are read in the same sweep; no masked raster is written.
+        """
+        self.add_raster(name, src, band)
+        mask_ds = _open(mask_src)
+        if not self.grid.matches(mask_ds):
+            raise ValueError('Raster {} ist nicht am Zonenraster (DEM) ausgerichtet.'.format(name))
+        mask_rb = mask_ds.GetRasterBand(1)
+        self._inputs[-1] = self._inputs[-1][:4] + ((mask_ds, mask_rb, mask_rb.GetNoDataValue(), low, high),)
+
+    def add_array(self, name, array, nodata=None):
+        """Registers an in-memory array of the zone grid shape; NaN always counts as NoData."""
+        if array.shape != self.grid.shape:
+            raise ValueError('Array {} hat nicht die Form des Zonenrasters.'.format(name))
+        self._inputs.append((name, None, array, nodata, None))
+
+    def _strip_rows(self):
+        rows, cols = self.grid.shape
+        step = max(1, self.strip_cells // max(cols, 1))
+        # Align strips with the block height of the first raster input
+        for _, ds, rb, _, _ in self._inputs:
+            if ds is not None:
+                bh = rb.GetBlockSize()[1]
+                if bh > 1:
+                    step = max(bh, step - step % bh)
+                break
+        return [(y0, min(step, rows - y0)) for y0 in range(0, rows, step)]
+
+    def run(self):
+        grid = self.grid
+        n = len(grid.ids) + 1
+        acc = {}
+        for name, _, _, _, _ in self._inputs:
+            acc[name] = {
+                'count': np.zeros(n, dtype=np.int64),
+                'sum': np.zeros(n, dtype=np.float64),
+                'min': np.full(n, np.inf),
+                'max': np.full(n, -np.inf),
+            }
+
+        cols = grid.shape[1]
+        for y0, rows in self._strip_rows():
+            z = grid.zones[y0:y0 + rows]
+            inside = z > 0
+            if not inside.any():
+                continue
+            for name, ds, src, nodata, mask in self._inputs:
+                if ds is not None:
+                    vals = src.ReadAsArray(0, y0, cols, rows)
+                else:
+                    vals = src[y0:y0 + rows]
+                valid = inside.copy()
+                if nodata is not None:
+                    valid &= vals != nodata
+                if vals.dtype.kind == 'f':
+                    valid &= np.isfinite(vals)
+                if mask is not None:
+                    _, mask_rb, mask_nodata, low, high = mask
+                    m = mask_rb.ReadAsArray(0, y0, cols, rows)
+                    valid &= (m >= low) & (m <= high)
+                    if mask_nodata is not None:
+                        valid &= m != mask_nodata
+                zz = z[valid]
+                if zz.size == 0:
+                    continue
+                vv = vals[valid].astype(np.float64)
+                a = acc[name]
+                a['count'] += np.bincount(zz, minlength=n)
+                a['sum'] += np.bincount(zz, weights=vv, minlength=n)
+                np.minimum.at(a['min'], zz, vv)
+                np.maximum.at(a['max'], zz, vv)
+
+        data = {}
+        for name, a in acc.items():
+            count = a['count'][1:]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(count > 0, a['sum'][1:] / np.maximum(count, 1), np.nan)
+            data[name] = {
+                'count': count,
+                'sum': a['sum'][1:],
+                'mean': mean,
+                'min': np.where(count > 0, a['min'][1:], np.nan),
+                'max': np.where(count > 0, a['max'][1:], np.nan),
+            }
+        return ZonalTable(grid.ids, data)